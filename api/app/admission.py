@@ -0,0 +1,203 @@
+"""Admission control: per-route-class concurrency limits with load shedding
+
+Each request is classified (checkout, auth, cart writes, catalog reads, other)
+and must take one of its class's ADMISSION_<CLASS>_LIMIT slots, and one of the
+worker's ADMISSION_MAX_CONCURRENT slots, before its handler runs. When none is
+free it waits in a bounded queue (ADMISSION_<CLASS>_QUEUE) for at most
+ADMISSION_QUEUE_TIMEOUT_MS; a full queue or an expired wait is answered at
+once with 503 and Retry-After, instead of piling more work onto the Motor pool.
+
+Checkout is critical: freed slots go to the highest-priority waiter first,
+ADMISSION_RESERVED_SLOTS of the worker's slots are kept for it, and it is not
+shed early when the event loop lags or checkouts queue for pool connections.
+"""
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import bisect
+import logging
+import os
+import re
+import time
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from . import metrics
+from .health import pool_stats
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") != "0"
+# In-flight requests per worker, across all classes
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "64"))
+# Worker slots only critical classes may take
+ADMISSION_RESERVED_SLOTS = int(os.getenv("ADMISSION_RESERVED_SLOTS", "8"))
+# Longest a request waits for a slot before it is shed
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "2000"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+# Past either of these, non-critical requests are shed instead of queued
+ADMISSION_MAX_EVENT_LOOP_LAG_MS = float(os.getenv("ADMISSION_MAX_EVENT_LOOP_LAG_MS", "500"))
+ADMISSION_MAX_POOL_WAITERS = int(os.getenv("ADMISSION_MAX_POOL_WAITERS", "50"))
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    name: str
+    limit: int
+    queue: int
+    # Lower is served first
+    priority: int
+    critical: bool = False
+
+    @classmethod
+    def from_env(cls, name: str, limit: int, queue: int, priority: int, critical: bool = False) -> "RouteClass":
+        prefix = f"ADMISSION_{name.upper()}"
+        return cls(
+            name=name,
+            limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+            queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+            priority=priority,
+            critical=critical,
+        )
+
+
+CHECKOUT = RouteClass.from_env("checkout", limit=16, queue=64, priority=0, critical=True)
+AUTH = RouteClass.from_env("auth", limit=8, queue=32, priority=1)
+CART_WRITES = RouteClass.from_env("cart_writes", limit=16, queue=64, priority=1)
+CATALOG_READS = RouteClass.from_env("catalog_reads", limit=32, queue=128, priority=2)
+OTHER = RouteClass.from_env("other", limit=16, queue=64, priority=2)
+
+# First match wins; unmatched requests are OTHER
+ROUTE_CLASSES = [
+    ({"POST"}, re.compile(r"^/cart/checkout$"), CHECKOUT),
+    ({"POST"}, re.compile(r"^/orders(/[^/]+/(cancel|confirm))?$"), CHECKOUT),
+    ({"POST"}, re.compile(r"^/auth/"), AUTH),
+    ({"POST", "PUT", "DELETE"}, re.compile(r"^/cart(/|$)"), CART_WRITES),
+    ({"GET"}, re.compile(r"^/(public/)?products(/|$)"), CATALOG_READS),
+    ({"GET"}, re.compile(r"^/stores/[^/]+$"), CATALOG_READS),
+]
+
+# Probes, metrics and long-lived streams are never queued or shed
+EXEMPT_PATHS = {"/", "/health", "/health/deep", "/ready", "/metrics", "/notifications/stream"}
+
+
+def route_class(method: str, path: str) -> RouteClass:
+    for methods, pattern, route_cls in ROUTE_CLASSES:
+        if method in methods and pattern.match(path):
+            return route_cls
+    return OTHER
+
+
+class AdmissionController:
+    """Concurrency slots per route class and per worker, handed out by priority"""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, reserved: int = ADMISSION_RESERVED_SLOTS):
+        self.max_concurrent = max_concurrent
+        self.reserved = reserved
+        self.active: dict[str, int] = {}
+        self.total = 0
+        # (priority, arrival, class, future), in the order slots are handed out
+        self.waiters: list[tuple[int, int, RouteClass, asyncio.Future]] = []
+        self.queued: dict[str, int] = {}
+        self.arrivals = 0
+
+    def _can_admit(self, route_cls: RouteClass) -> bool:
+        capacity = self.max_concurrent if route_cls.critical else self.max_concurrent - self.reserved
+        return self.active.get(route_cls.name, 0) < route_cls.limit and self.total < capacity
+
+    def _admit(self, route_cls: RouteClass) -> None:
+        self.active[route_cls.name] = self.active.get(route_cls.name, 0) + 1
+        self.total += 1
+
+    def overloaded(self) -> Optional[str]:
+        """Why the worker should not queue non-critical requests, if it should not"""
+        if metrics.last_event_loop_lag * 1000 > ADMISSION_MAX_EVENT_LOOP_LAG_MS:
+            return "event_loop_lag"
+        if pool_stats.snapshot()[1] > ADMISSION_MAX_POOL_WAITERS:
+            return "pool_waiters"
+        return None
+
+    async def acquire(self, route_cls: RouteClass) -> Optional[str]:
+        """Take a slot, waiting if needed; returns why the request is shed, or None once admitted"""
+        if self._can_admit(route_cls):
+            self._admit(route_cls)
+            return None
+        if not route_cls.critical:
+            reason = self.overloaded()
+            if reason:
+                return reason
+        if self.queued.get(route_cls.name, 0) >= route_cls.queue:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        self.arrivals += 1
+        waiter = (route_cls.priority, self.arrivals, route_cls, future)
+        bisect.insort(self.waiters, waiter, key=lambda w: w[:2])
+        self.queued[route_cls.name] = self.queued.get(route_cls.name, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), ADMISSION_QUEUE_TIMEOUT_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client went away; give back a slot handed over in the meantime
+            if self._leave_queue(waiter):
+                self.release(route_cls)
+            raise
+        # A slot handed over just as the wait expired still counts
+        return None if self._leave_queue(waiter) else "queue_timeout"
+
+    def _leave_queue(self, waiter) -> bool:
+        """Stop waiting; True when the waiter had already been given a slot"""
+        route_cls = waiter[2]
+        self.queued[route_cls.name] -= 1
+        if waiter in self.waiters:
+            self.waiters.remove(waiter)
+            return False
+        return True
+
+    def release(self, route_cls: RouteClass) -> None:
+        self.active[route_cls.name] -= 1
+        self.total -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        """Hand freed slots to waiters in priority order, skipping classes at their own limit"""
+        for waiter in list(self.waiters):
+            _, _, route_cls, future = waiter
+            if self._can_admit(route_cls):
+                self.waiters.remove(waiter)
+                self._admit(route_cls)
+                future.set_result(True)
+
+
+class AdmissionMiddleware(BaseHTTPMiddleware):
+    """Run each request only once its route class admits it; shed with 503 otherwise"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        super().__init__(app)
+        self.controller = controller or AdmissionController()
+
+    async def dispatch(self, request: Request, call_next):
+        if not ADMISSION_CONTROL or request.url.path in EXEMPT_PATHS or request.method == "OPTIONS":
+            return await call_next(request)
+
+        route_cls = route_class(request.method, request.url.path)
+        started = time.perf_counter()
+        shed_reason = await self.controller.acquire(route_cls)
+        if metrics.METRICS_AVAILABLE:
+            metrics.ADMISSION_WAIT.labels(route_cls.name).observe(time.perf_counter() - started)
+        if shed_reason:
+            if metrics.METRICS_AVAILABLE:
+                metrics.ADMISSION_SHED.labels(route_cls.name, shed_reason).inc()
+            logger.warning("Shed %s %s (%s: %s)", request.method, request.url.path, route_cls.name, shed_reason)
+            return JSONResponse(
+                {"detail": "Server is busy, please retry shortly"},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            return await call_next(request)
+        finally:
+            self.controller.release(route_cls)
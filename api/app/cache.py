@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import asyncio
+import logging
+import time
+
+from .metrics import is_timeout, record_query_timeout
+
+logger = logging.getLogger(__name__)
+
+# How long a stale result is served after a reload timed out, before trying again
+STALE_RETRY_SECONDS = 5
+
+# Named caches, reported by the deep health check
+caches: dict[str, "TTLCache | CachedResult"] = {}
+
+
+class TTLCache:
+    """Small in-process LRU cache whose entries expire after ttl seconds
+
+    Each worker keeps its own copy, so entries may be stale for up to ttl
+    after another worker changes the underlying document.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10_000, name: Optional[str] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        if name:
+            caches[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def fill(self) -> dict:
+        return {"entries": len(self.entries), "max_size": self.max_size}
+
+
+class CachedResult:
+    """One query result shared by all requests and reloaded once it is ttl seconds old
+
+    Concurrent callers of an expired result wait for a single reload instead of
+    each running the query. A reload that overruns its query time budget keeps
+    the previous result in service for STALE_RETRY_SECONDS more.
+    """
+
+    def __init__(self, ttl: float, load: Callable[[Any], Awaitable[Any]], name: Optional[str] = None):
+        self.ttl = ttl
+        self.load = load
+        self.name = name or getattr(load, "__name__", "cached_result")
+        self.value: Any = None
+        self.has_value = False
+        self.expires_at = 0.0
+        self.lock = asyncio.Lock()
+        if name:
+            caches[name] = self
+
+    @property
+    def loaded(self) -> bool:
+        return self.expires_at > time.monotonic()
+
+    async def get(self, db) -> Any:
+        if self.loaded:
+            return self.value
+        async with self.lock:
+            if not self.loaded:
+                try:
+                    self.value = await self.load(db)
+                except Exception as e:
+                    if not (self.has_value and is_timeout(e)):
+                        raise
+                    logger.warning("%s timed out, serving the stale result: %s", self.name, e)
+                    record_query_timeout(self.name, "stale_cache")
+                    self.expires_at = time.monotonic() + min(self.ttl, STALE_RETRY_SECONDS)
+                    return self.value
+                self.has_value = True
+                self.expires_at = time.monotonic() + self.ttl
+        return self.value
+
+    def invalidate(self) -> None:
+        self.expires_at = 0.0
+
+    def fill(self) -> dict:
+        return {"loaded": self.loaded}
+
+
+def cache_fill() -> dict[str, dict]:
+    return {name: cache.fill() for name, cache in caches.items()}
@@ -0,0 +1,68 @@
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from .health import pool_stats
+from .metrics import mongo_listeners
+from .querybudget import QueryTracker
+from .settings import Settings
+from .slowqueries import slow_query_log
+from .timeouts import TimeoutTracker
+
+# ===== MongoDB (Motor) setup with connection pooling =====
+mongo_client: AsyncIOMotorClient | None = None
+database_name = Settings.mongodb_db
+
+
+def connect(settings: Settings) -> AsyncIOMotorClient:
+    """Create the process-wide client used by get_db() and run_transaction()"""
+    global mongo_client, database_name
+    mongo_client = AsyncIOMotorClient(
+        settings.mongodb_uri,
+        maxPoolSize=settings.mongo_max_pool_size,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxIdleTimeMS=30000,
+        connectTimeoutMS=5000,
+        serverSelectionTimeoutMS=5000,
+        # Command latency and pool checkout metrics for /metrics, per-request
+        # query accounting, the slow-query log, pool health and query timeouts
+        event_listeners=[*mongo_listeners(), QueryTracker(), slow_query_log, pool_stats, TimeoutTracker()]
+    )
+    database_name = settings.mongodb_db
+    return mongo_client
+
+
+def close() -> None:
+    global mongo_client
+    if mongo_client is not None:
+        mongo_client.close()
+        mongo_client = None
+
+
+async def get_db() -> AsyncIOMotorDatabase:
+    if mongo_client is None:
+        raise RuntimeError("Mongo client is not initialized")
+    return mongo_client[database_name]
+
+
+async def run_transaction(callback):
+    """Run callback(session) in a MongoDB transaction (driver retries transient errors)"""
+    if mongo_client is None:
+        raise RuntimeError("Mongo client is not initialized")
+    async with await mongo_client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def supports_transactions() -> bool:
+    """Whether the deployment can run transactions (replica set member or mongos, not a standalone)"""
+    if mongo_client is None:
+        raise RuntimeError("Mongo client is not initialized")
+    hello = await mongo_client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def open_pool(size: int) -> None:
+    """Establish `size` pooled connections now instead of on the first requests"""
+    db = await get_db()
+    # Concurrent commands each check out their own connection
+    await asyncio.gather(*(db.command("ping") for _ in range(size)))
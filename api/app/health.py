@@ -0,0 +1,199 @@
+"""Deep health checks
+
+    GET /health          liveness: the process and its event loop answer
+    GET /ready           readiness: warmed up and this worker not saturated (503 otherwise)
+    GET /health/deep     the full report, including MongoDB
+
+The report covers Mongo ping latency, connection pool utilisation and
+checkout wait queue (from pool_stats, registered on the Mongo client), the
+latest event-loop lag probe, background queue depths and cache fill levels.
+It is "down" when Mongo does not answer and "saturated" when any of the
+HEALTH_MAX_* thresholds is exceeded. Reports are cached for
+HEALTH_CACHE_SECONDS so frequent probes cost one ping per interval.
+
+/ready only looks at what is local to the worker: pool checkout waiters,
+event-loop lag and queue depths. A slow or unreachable MongoDB affects every
+worker alike, so failing readiness on it would take them all out of the load
+balancer at once; it shows in /health/deep for alerting instead. /ready does
+no I/O.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Optional
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+from . import metrics
+from .cache import cache_fill
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "2"))
+HEALTH_PING_TIMEOUT_MS = float(os.getenv("HEALTH_PING_TIMEOUT_MS", "1000"))
+HEALTH_MAX_PING_MS = float(os.getenv("HEALTH_MAX_PING_MS", "250"))
+HEALTH_MAX_POOL_UTILISATION = float(os.getenv("HEALTH_MAX_POOL_UTILISATION", "0.9"))
+HEALTH_MAX_POOL_WAITERS = int(os.getenv("HEALTH_MAX_POOL_WAITERS", "10"))
+HEALTH_MAX_EVENT_LOOP_LAG_MS = float(os.getenv("HEALTH_MAX_EVENT_LOOP_LAG_MS", "250"))
+HEALTH_MAX_QUEUE_DEPTH = int(os.getenv("HEALTH_MAX_QUEUE_DEPTH", "10000"))
+
+
+# ===== Connection pool =====
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connections checked out and checkouts waiting, per server"""
+
+    def __init__(self):
+        # Pool events arrive on driver threads
+        self.lock = threading.Lock()
+        self.checked_out: dict[tuple, int] = defaultdict(int)
+        self.waiting: dict[tuple, int] = defaultdict(int)
+
+    def snapshot(self) -> tuple[int, int]:
+        """(checked out, waiting) on the busiest server"""
+        with self.lock:
+            return max(self.checked_out.values(), default=0), max(self.waiting.values(), default=0)
+
+    def connection_check_out_started(self, event) -> None:
+        with self.lock:
+            self.waiting[event.address] += 1
+
+    def connection_checked_out(self, event) -> None:
+        with self.lock:
+            self.waiting[event.address] = max(0, self.waiting[event.address] - 1)
+            self.checked_out[event.address] += 1
+
+    def connection_check_out_failed(self, event) -> None:
+        with self.lock:
+            self.waiting[event.address] = max(0, self.waiting[event.address] - 1)
+
+    def connection_checked_in(self, event) -> None:
+        with self.lock:
+            self.checked_out[event.address] = max(0, self.checked_out[event.address] - 1)
+
+    def pool_closed(self, event) -> None:
+        with self.lock:
+            self.checked_out.pop(event.address, None)
+            self.waiting.pop(event.address, None)
+
+    # Other pool and connection lifecycle events do not change the counts
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+
+pool_stats = PoolStats()
+
+
+# ===== Report =====
+class HealthMonitor:
+    """Builds the health report, at most once per HEALTH_CACHE_SECONDS
+
+    `queues` maps a name to a callable returning that queue's depth; subsystems
+    add themselves when they start. `warm` is set once warmup has finished.
+    """
+
+    def __init__(self, get_db, max_pool_size: int):
+        self.get_db = get_db
+        self.max_pool_size = max_pool_size
+        self.queues: dict[str, Callable[[], int]] = {}
+        self.warm = False
+        self.report: Optional[dict] = None
+        self.expires_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def check(self) -> dict:
+        if self.report is None or self.expires_at <= time.monotonic():
+            # Concurrent probes share one round of checks
+            async with self.lock:
+                if self.report is None or self.expires_at <= time.monotonic():
+                    self.report = await self._build_report()
+                    self.expires_at = time.monotonic() + HEALTH_CACHE_SECONDS
+        # Warmup may finish between checks
+        return {"ready": self.warm and not self.report["worker_saturated"], "warm": self.warm, **self.report}
+
+    def readiness(self) -> dict:
+        """Whether this worker should get traffic: warm and not saturated (no Mongo round trip)"""
+        *_, saturated = self._worker_state()
+        return {"ready": self.warm and not saturated, "warm": self.warm, "saturated": saturated}
+
+    def _worker_state(self):
+        """(checked out, utilisation, waiting, lag_ms, queues, worker thresholds crossed)"""
+        checked_out, waiting = pool_stats.snapshot()
+        utilisation = round(checked_out / self.max_pool_size, 3) if self.max_pool_size else 0.0
+        lag_ms = round(metrics.last_event_loop_lag * 1000, 2)
+        queues = {}
+        for name, depth in self.queues.items():
+            try:
+                queues[name] = depth()
+            except Exception as e:
+                logger.error("Error reading %s depth: %s", name, e)
+
+        # Thresholds crossed, as "check: value > limit"
+        saturated = []
+        if waiting > HEALTH_MAX_POOL_WAITERS:
+            saturated.append(f"pool_waiting: {waiting} > {HEALTH_MAX_POOL_WAITERS}")
+        if lag_ms > HEALTH_MAX_EVENT_LOOP_LAG_MS:
+            saturated.append(f"event_loop_lag_ms: {lag_ms} > {HEALTH_MAX_EVENT_LOOP_LAG_MS:g}")
+        for name, depth in queues.items():
+            if depth > HEALTH_MAX_QUEUE_DEPTH:
+                saturated.append(f"{name}: {depth} > {HEALTH_MAX_QUEUE_DEPTH}")
+        return checked_out, utilisation, waiting, lag_ms, queues, saturated
+
+    async def _ping(self) -> dict:
+        started = time.perf_counter()
+        try:
+            db = await self.get_db()
+            await asyncio.wait_for(db.command("ping"), HEALTH_PING_TIMEOUT_MS / 1000)
+        except Exception as e:
+            return {"ok": False, "error": str(e) or type(e).__name__}
+        return {"ok": True, "ping_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    async def _build_report(self) -> dict:
+        mongo = await self._ping()
+        checked_out, utilisation, waiting, lag_ms, queues, worker_saturated = self._worker_state()
+
+        # Shared checks (MongoDB) alert but do not affect readiness
+        saturated = []
+        if mongo["ok"] and mongo["ping_ms"] > HEALTH_MAX_PING_MS:
+            saturated.append(f"mongo_ping_ms: {mongo['ping_ms']} > {HEALTH_MAX_PING_MS:g}")
+        if utilisation > HEALTH_MAX_POOL_UTILISATION:
+            saturated.append(f"pool_utilisation: {utilisation} > {HEALTH_MAX_POOL_UTILISATION:g}")
+        saturated.extend(worker_saturated)
+
+        status = "down" if not mongo["ok"] else "saturated" if saturated else "ok"
+        if status != "ok":
+            logger.warning("Health check %s: %s", status, mongo.get("error") or "; ".join(saturated))
+        return {
+            "status": status,
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "saturated": saturated,
+            "worker_saturated": worker_saturated,
+            "mongo": mongo,
+            "pool": {
+                "checked_out": checked_out,
+                "max_size": self.max_pool_size,
+                "utilisation": utilisation,
+                "waiting": waiting,
+            },
+            "event_loop": {"lag_ms": lag_ms},
+            "queues": queues,
+            "caches": cache_fill(),
+        }
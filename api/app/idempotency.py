@@ -0,0 +1,178 @@
+from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+from pymongo.errors import DuplicateKeyError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+from .timeouts import with_own_budget
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# How long a completed response is replayable (TTL index on createdAt)
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+# How long a duplicate waits for the in-flight original before giving up
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# An IN_PROGRESS record older than this is treated as abandoned (worker crashed)
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+# Mutating routes that honour the Idempotency-Key header
+IDEMPOTENT_ROUTES = [
+    ("POST", re.compile(r"^/orders$")),
+    ("POST", re.compile(r"^/cart/items$")),
+    ("PUT", re.compile(r"^/cart/items/[^/]+$")),
+    ("DELETE", re.compile(r"^/cart/items/[^/]+$")),
+    ("DELETE", re.compile(r"^/cart$")),
+    ("POST", re.compile(r"^/cart/checkout$")),
+]
+
+
+def is_idempotent_route(method: str, path: str) -> bool:
+    return any(method == m and pattern.match(path) for m, pattern in IDEMPOTENT_ROUTES)
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    """Replay the stored response for retried requests carrying an Idempotency-Key
+
+    The first request with a given key claims it by inserting an IN_PROGRESS
+    record (unique _id); once the handler finishes, its response is stored on
+    that record. Retries replay the stored response, and concurrent duplicates
+    wait for the in-flight request instead of executing the handler again.
+    Keys are scoped to the caller's credentials, method and path.
+    """
+
+    def __init__(self, app, get_db):
+        super().__init__(app)
+        self.get_db = get_db
+        # Same-worker duplicates wait on an event instead of polling Mongo
+        self.in_flight: dict[str, asyncio.Event] = {}
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not is_idempotent_route(request.method, request.url.path):
+            return await call_next(request)
+
+        if len(key) > 255:
+            return JSONResponse({"detail": "Idempotency-Key is too long"}, status_code=400)
+
+        body = await request.body()
+        scope = hashlib.sha256(request.headers.get("Authorization", "").encode()).hexdigest()
+        record_id = f"{scope}:{request.method}:{request.url.path}:{key}"
+        fingerprint = hashlib.sha256(body).hexdigest()
+        db = await self.get_db()
+
+        record = await self._claim(db, record_id, fingerprint)
+        if record is not None:
+            return await self._replay_or_wait(db, record_id, record, fingerprint)
+
+        event = self.in_flight[record_id] = asyncio.Event()
+        try:
+            response = await call_next(request)
+            response_body = b"".join([chunk async for chunk in response.body_iterator])
+
+            # The handler's work is done whatever time it left; record the outcome regardless
+            if response.status_code >= 500:
+                # Let the client retry server errors for real
+                await with_own_budget(db.IdempotencyKey.delete_one({"_id": record_id}))
+            else:
+                await with_own_budget(db.IdempotencyKey.update_one(
+                    {"_id": record_id},
+                    {"$set": {
+                        "status": "COMPLETED",
+                        "statusCode": response.status_code,
+                        "mediaType": response.media_type or response.headers.get("content-type"),
+                        "body": response_body
+                    }}
+                ))
+
+            return Response(
+                content=response_body,
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                media_type=response.media_type
+            )
+        except Exception:
+            await with_own_budget(db.IdempotencyKey.delete_one({"_id": record_id}))
+            raise
+        finally:
+            event.set()
+            self.in_flight.pop(record_id, None)
+
+    async def _claim(self, db, record_id: str, fingerprint: str):
+        """Insert the IN_PROGRESS record; return the existing record if the key is taken"""
+        now = datetime.utcnow()
+        try:
+            await db.IdempotencyKey.insert_one({
+                "_id": record_id,
+                "status": "IN_PROGRESS",
+                "fingerprint": fingerprint,
+                "createdAt": now
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        # Take over records abandoned by a crashed worker
+        stale = await db.IdempotencyKey.find_one_and_update(
+            {
+                "_id": record_id,
+                "status": "IN_PROGRESS",
+                "createdAt": {"$lt": now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}
+            },
+            {"$set": {"fingerprint": fingerprint, "createdAt": now}}
+        )
+        if stale is not None:
+            return None
+
+        record = await db.IdempotencyKey.find_one({"_id": record_id})
+        # Record expired between insert and read; treat as claimed by us on retry
+        return record or await self._claim(db, record_id, fingerprint)
+
+    async def _replay_or_wait(self, db, record_id: str, record: dict, fingerprint: str):
+        if record["fingerprint"] != fingerprint:
+            return JSONResponse(
+                {"detail": "Idempotency-Key was already used with a different request"},
+                status_code=422
+            )
+
+        deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        delay = 0.05
+        while record is not None and record["status"] == "IN_PROGRESS":
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is still in progress"},
+                    status_code=409,
+                    headers={"Retry-After": "1"}
+                )
+
+            event = self.in_flight.get(record_id)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(delay, remaining))
+                delay = min(delay * 2, 1.0)
+            record = await db.IdempotencyKey.find_one({"_id": record_id})
+
+        if record is None:
+            # Original failed with a server error and released the key
+            return JSONResponse(
+                {"detail": "The original request failed; please retry"},
+                status_code=409
+            )
+
+        return Response(
+            content=record["body"],
+            status_code=record["statusCode"],
+            media_type=record.get("mediaType"),
+            headers={"Idempotent-Replayed": "true"}
+        )
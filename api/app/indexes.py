@@ -0,0 +1,430 @@
+"""Declarative MongoDB index registry.
+
+Every index the API relies on is declared in INDEXES, and every query shape
+the API issues is listed in _query_shapes(). Indexes are built by a one-off migration
+rather than on every worker boot:
+
+    cd api
+    python -m app.indexes migrate        # create/update indexes, all collections in parallel,
+                                         # then run the data backfills
+    python -m app.indexes check-plans    # explain() every query shape, fail on COLLSCAN or
+                                         # on scanning far more than it returns
+
+Workers only verify at startup that nothing is missing (see verify_indexes).
+"""
+from datetime import datetime
+from typing import Optional
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+from .idempotency import IDEMPOTENCY_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Read notifications are purged by a TTL index on readAt; unread ones are kept
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", "90"))
+
+# check-plans: a shape that examines more than PLAN_MAX_EXAMINED_RATIO keys or
+# documents per result is not served by its index (ignored under PLAN_MIN_EXAMINED)
+PLAN_MAX_EXAMINED_RATIO = float(os.getenv("PLAN_MAX_EXAMINED_RATIO", "10"))
+PLAN_MIN_EXAMINED = int(os.getenv("PLAN_MIN_EXAMINED", "1000"))
+
+# Options that, when changed, require the index to be rebuilt
+_REBUILD_OPTIONS = ("unique", "sparse", "partialFilterExpression")
+
+INDEXES: dict[str, list[IndexModel]] = {
+    "Product": [
+        IndexModel([("status", ASCENDING)]),
+        IndexModel([("storeId", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("name", TEXT), ("description", TEXT), ("category", TEXT)]),
+        IndexModel([("category", ASCENDING), ("status", ASCENDING)]),
+        # Covers the category-counts $group without touching documents
+        IndexModel([("status", ASCENDING), ("category", ASCENDING)]),
+        IndexModel([("createdAt", DESCENDING)]),
+        # Products holding reservation markers, for the orphaned-reservation sweep
+        IndexModel([("reservations", ASCENDING)], sparse=True),
+    ],
+    "Store": [
+        IndexModel([("ownerId", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+    ],
+    "User": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "Review": [
+        # Keyset pagination of a product's reviews, newest first
+        IndexModel([("productId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+        # One review per user per product; enforced on insert
+        IndexModel([("productId", ASCENDING), ("userId", ASCENDING)], unique=True),
+    ],
+    "Cart": [
+        # One cart per user, created lazily on first mutation
+        IndexModel([("userId", ASCENDING)], unique=True),
+    ],
+    "Notification": [
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)]),
+        IndexModel([("userId", ASCENDING), ("isRead", ASCENDING)]),
+        IndexModel([("readAt", ASCENDING)], expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 24 * 3600),
+    ],
+    "Order": [
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)]),
+        IndexModel([("status", ASCENDING), ("reservationExpiresAt", ASCENDING)]),
+    ],
+    "SubOrder": [
+        IndexModel([("orderId", ASCENDING)]),
+        IndexModel([("storeId", ASCENDING), ("status", ASCENDING)]),
+    ],
+    "OrderItem": [
+        IndexModel([("subOrderId", ASCENDING)]),
+        IndexModel([("productId", ASCENDING)]),
+    ],
+    "IdempotencyKey": [
+        # Records expire once retries are no longer expected
+        IndexModel([("createdAt", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+}
+
+
+def _query_shapes() -> list[dict]:
+    """Representative query per endpoint; placeholder values only shape the plan
+
+    `scan_ok` marks shapes known not to be selective on any index; check-plans
+    reports their scans as warnings instead of failing on them.
+    """
+    # Imported here: the catalog router imports db, which imports this module
+    from .routers.catalog import featured_pool_pipeline
+
+    oid = ObjectId()
+    now = datetime.utcnow()
+    return [
+        # Catalog
+        {"route": "GET /products/featured (featured pool reload)", "collection": "Product",
+         "pipeline": featured_pool_pipeline()},
+        {"route": "GET /public/products/{id}", "collection": "Product",
+         "filter": {"_id": oid, "status": "ACTIVE"}},
+        {"route": "GET /products/search", "collection": "Product",
+         "filter": {"$text": {"$search": "shoe"}, "status": "ACTIVE"}},
+        {"route": "GET /products/search (regex fallback)", "collection": "Product",
+         "filter": {"status": "ACTIVE", "$or": [
+             {"name": {"$regex": "shoe", "$options": "i"}},
+             {"description": {"$regex": "shoe", "$options": "i"}},
+             {"category": {"$regex": "shoe", "$options": "i"}},
+         ]},
+         "scan_ok": "unanchored case-insensitive regex, bounded by REGEX_SEARCH_BUDGET_MS"},
+        {"route": "GET /products/search/suggestions", "collection": "Product",
+         "filter": {"status": "ACTIVE", "$or": [
+             {"name": {"$regex": "^sh", "$options": "i"}},
+             {"category": {"$regex": "^sh", "$options": "i"}},
+         ]},
+         "scan_ok": "case-insensitive prefix regex, bounded by REGEX_SEARCH_BUDGET_MS"},
+        {"route": "GET /products/category-counts", "collection": "Product",
+         "pipeline": [{"$match": {"status": "ACTIVE"}}, {"$group": {"_id": "$category", "count": {"$sum": 1}}}]},
+        {"route": "GET /products/my-products", "collection": "Product",
+         "filter": {"storeId": oid, "status": "ACTIVE"}},
+        {"route": "POST /orders (product validation)", "collection": "Product",
+         "filter": {"_id": {"$in": [oid]}, "status": "ACTIVE"}},
+        # Auth / users / stores
+        {"route": "POST /auth/register", "collection": "User",
+         "filter": {"$or": [{"username": "u"}, {"email": "u@example.com"}]}},
+        {"route": "POST /auth/login", "collection": "User", "filter": {"username": "u"}},
+        {"route": "GET /users/me/store", "collection": "Store", "filter": {"ownerId": oid}},
+        {"route": "GET /stores/{id}", "collection": "Store", "filter": {"_id": oid, "status": "ACTIVE"}},
+        # Reviews
+        {"route": "GET /products/{id}/reviews", "collection": "Review",
+         "filter": {"productId": oid}, "sort": {"createdAt": -1, "_id": -1}},
+        {"route": "GET /products/{id}/reviews?before=", "collection": "Review",
+         "filter": {"productId": oid, "$or": [{"createdAt": {"$lt": now}}, {"createdAt": now, "_id": {"$lt": oid}}]},
+         "sort": {"createdAt": -1, "_id": -1}},
+        {"route": "POST /products/{id}/reviews (product lookup)", "collection": "Product",
+         "filter": {"_id": oid, "status": "ACTIVE"}},
+        # Cart
+        {"route": "GET /cart", "collection": "Cart", "filter": {"userId": oid}},
+        # Notifications
+        {"route": "GET /notifications", "collection": "Notification",
+         "filter": {"userId": oid}, "sort": {"createdAt": -1}},
+        {"route": "POST /notifications/read-all", "collection": "Notification",
+         "filter": {"userId": oid, "isRead": False}},
+        {"route": "reconcile_unread_counts", "collection": "Notification",
+         "pipeline": [{"$match": {"isRead": False, "userId": {"$in": [oid]}}},
+                      {"$group": {"_id": "$userId", "count": {"$sum": 1}}}]},
+        # Orders
+        {"route": "expire_reservations", "collection": "Order",
+         "filter": {"status": "PENDING", "reservationExpiresAt": {"$lte": now}}},
+        {"route": "release_orphaned_reservations", "collection": "Product",
+         "filter": {"reservations": {"$gt": {}}}, "sort": {"_id": 1}},
+        {"route": "cancel_order (sub-orders)", "collection": "SubOrder",
+         "filter": {"orderId": oid, "status": "PENDING"}},
+        {"route": "store sub-orders", "collection": "SubOrder",
+         "filter": {"storeId": oid, "status": "PENDING"}},
+        {"route": "sub-order items", "collection": "OrderItem", "filter": {"subOrderId": oid}},
+    ]
+
+
+# ===== Migration =====
+def _rebuild_options(index: dict) -> dict:
+    options = {option: index[option] for option in _REBUILD_OPTIONS if index.get(option)}
+    # Turning TTL on or off needs a rebuild; changing its value does not
+    options["ttl"] = "expireAfterSeconds" in index
+    return options
+
+
+async def _find_duplicate_key(db: AsyncIOMotorDatabase, collection: str, spec: dict) -> Optional[dict]:
+    """A key value shared by several documents, which would fail building `spec` as a unique index"""
+    keys = list(spec["key"])
+    match = dict(spec.get("partialFilterExpression", {}))
+    if spec.get("sparse"):
+        match["$or"] = [{key: {"$exists": True}} for key in keys]
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$group": {"_id": {key.replace(".", "_"): f"${key}" for key in keys}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 1},
+    ]
+    duplicates = await db[collection].aggregate(pipeline, allowDiskUse=True).to_list(1)
+    return duplicates[0]["_id"] if duplicates else None
+
+
+async def _rebuild_index(db: AsyncIOMotorDatabase, collection: str, current: dict, model: IndexModel) -> None:
+    """Replace an index whose options changed, never leaving the collection without it
+
+    MongoDB cannot hold the old and new definitions side by side (same key
+    pattern), so the old index is dropped first. Data that would fail a
+    unique build is caught before the drop, and any other failed build puts
+    the old index back.
+    """
+    spec = model.document
+    name = spec["name"]
+    if spec.get("unique"):
+        duplicate = await _find_duplicate_key(db, collection, spec)
+        if duplicate is not None:
+            raise RuntimeError(
+                f"{collection}.{name}: not rebuilt as unique, several documents share {duplicate} "
+                f"(old index left in place; remove the duplicates and rerun)"
+            )
+
+    await db[collection].drop_index(name)
+    try:
+        await db[collection].create_indexes([model])
+    except Exception:
+        previous = {option: value for option, value in current.items() if option not in ("v", "key", "ns")}
+        await db[collection].create_indexes([IndexModel(list(current["key"].items()), **previous)])
+        logger.error("Rebuilding %s.%s failed, restored the previous index", collection, name)
+        raise
+
+
+async def _migrate_collection(db: AsyncIOMotorDatabase, collection: str, models: list[IndexModel]) -> list[str]:
+    existing = {index["name"]: index async for index in db[collection].list_indexes()}
+    to_create = []
+    to_rebuild = []
+    actions = []
+
+    for model in models:
+        spec = model.document
+        name = spec["name"]
+        current = existing.get(name)
+        if current is None:
+            to_create.append(model)
+            continue
+
+        if _rebuild_options(current) != _rebuild_options(spec):
+            to_rebuild.append((current, model))
+        elif current.get("expireAfterSeconds") != spec.get("expireAfterSeconds"):
+            # TTL can be changed in place
+            await db.command({
+                "collMod": collection,
+                "index": {"name": name, "expireAfterSeconds": spec["expireAfterSeconds"]}
+            })
+            actions.append(f"{collection}.{name}: TTL set to {spec['expireAfterSeconds']}s")
+
+    if to_create:
+        # One createIndexes command builds all of a collection's indexes in a single pass
+        await db[collection].create_indexes(to_create)
+        actions.extend(f"{collection}.{model.document['name']}: created" for model in to_create)
+    # After the new indexes, so a rebuild the data blocks does not hold them up
+    for current, model in to_rebuild:
+        await _rebuild_index(db, collection, current, model)
+        actions.append(f"{collection}.{model.document['name']}: rebuilt (options changed)")
+
+    declared = {model.document["name"] for model in models} | {"_id_"}
+    actions.extend(f"{collection}.{name}: not in registry (left in place)" for name in existing if name not in declared)
+    return actions
+
+
+async def migrate_indexes(db: AsyncIOMotorDatabase) -> list[str]:
+    """Bring every collection's indexes in line with INDEXES, collections in parallel"""
+    results = await asyncio.gather(*(
+        _migrate_collection(db, collection, models) for collection, models in INDEXES.items()
+    ), return_exceptions=True)
+    # Let every collection finish before reporting a failed one
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return [action for actions in results for action in actions]
+
+
+async def verify_indexes(db: AsyncIOMotorDatabase) -> list[str]:
+    """Names of registry indexes missing from the database (cheap; used at worker startup)"""
+    async def missing_in(collection: str, models: list[IndexModel]) -> list[str]:
+        existing = {index["name"] async for index in db[collection].list_indexes()}
+        return [f"{collection}.{m.document['name']}" for m in models if m.document["name"] not in existing]
+
+    results = await asyncio.gather(*(missing_in(c, m) for c, m in INDEXES.items()))
+    return [name for missing in results for name in missing]
+
+
+# ===== Data backfills =====
+async def run_backfills(db: AsyncIOMotorDatabase) -> list[str]:
+    """One-off data fixes run by `migrate` after the indexes; each is safe to rerun"""
+    # Imported here: notifications imports db, which imports this module
+    from .notifications import backfill_read_at, backfill_unread_counts
+
+    actions = []
+    backfilled = await backfill_unread_counts(db)
+    if backfilled:
+        actions.append(f"User.unreadNotificationCount: initialised on {backfilled} users")
+    stamped = await backfill_read_at(db)
+    if stamped:
+        actions.append(f"Notification.readAt: set on {stamped} read notifications")
+    return actions
+
+
+# ===== Plan checks =====
+def plan_stages(plan) -> list[str]:
+    if isinstance(plan, dict):
+        stages = [plan["stage"]] if "stage" in plan else []
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in plan_stages(item)]
+    return []
+
+
+async def explain_shape(db: AsyncIOMotorDatabase, shape: dict) -> dict:
+    """Run one query shape under explain; winning plan stages and what it examined
+
+    Returns {"stages", "keys_examined", "docs_examined", "returned"}.
+    """
+    if "pipeline" in shape:
+        command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    else:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            command["sort"] = shape["sort"]
+    explained = await db.command({"explain": command, "verbosity": "executionStats"})
+    # find: queryPlanner.winningPlan; aggregate: stages[0].$cursor.queryPlanner or queryPlanner
+    winning = [plan for key, plan in walk_plan(explained) if key == "winningPlan"]
+    stats = [value for key, value in walk_plan(explained) if key == "executionStats" and isinstance(value, dict)]
+    return {
+        "stages": plan_stages(winning),
+        "keys_examined": sum(s.get("totalKeysExamined", 0) for s in stats),
+        "docs_examined": sum(s.get("totalDocsExamined", 0) for s in stats),
+        "returned": sum(s.get("nReturned", 0) for s in stats),
+    }
+
+
+def walk_plan(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield key, value
+            yield from walk_plan(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from walk_plan(item)
+
+
+async def check_query_plans(db: AsyncIOMotorDatabase) -> list[str]:
+    """explain() every registered query shape; return the ones its indexes do not serve
+
+    A shape fails on a COLLSCAN, or when it examines more than
+    PLAN_MAX_EXAMINED_RATIO keys or documents per document returned: an index
+    scan on a field that barely filters (e.g. status) is a scan all the same.
+    """
+    failures = []
+    for shape in _query_shapes():
+        explained = await explain_shape(db, shape)
+        stages = " > ".join(explained["stages"])
+        label = f"{shape['route']} ({shape['collection']})"
+        if "COLLSCAN" in explained["stages"]:
+            failures.append(f"{label}: COLLSCAN in {stages}")
+            continue
+
+        examined = max(explained["keys_examined"], explained["docs_examined"])
+        if examined > PLAN_MIN_EXAMINED and examined > PLAN_MAX_EXAMINED_RATIO * max(explained["returned"], 1):
+            problem = (
+                f"{label}: examined {explained['keys_examined']} keys / {explained['docs_examined']} docs "
+                f"for {explained['returned']} results in {stages}"
+            )
+            if shape.get("scan_ok"):
+                logger.warning("%s (allowed: %s)", problem, shape["scan_ok"])
+            else:
+                failures.append(problem)
+    return failures
+
+
+async def prime_query_plans(db: AsyncIOMotorDatabase, max_time_ms: int = 1000) -> int:
+    """Run every registered find shape once so its plan is cached before real traffic
+
+    Returns how many shapes ran; failures (e.g. no text index yet) are only logged.
+    """
+    primed = 0
+    for shape in _query_shapes():
+        if "filter" not in shape:
+            continue
+        cursor = db[shape["collection"]].find(shape["filter"]).limit(1).max_time_ms(max_time_ms)
+        if "sort" in shape:
+            cursor = cursor.sort(list(shape["sort"].items()))
+        try:
+            await cursor.to_list(1)
+            primed += 1
+        except Exception as e:
+            logger.warning("Could not prime query plan for %s: %s", shape["route"], e)
+    return primed
+
+
+# ===== CLI =====
+async def _main(argv: list[str]) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Manage Walk4You MongoDB indexes")
+    parser.add_argument("command", choices=["migrate", "verify", "check-plans"])
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db = client[os.getenv("MONGODB_DB", "walk4you")]
+    try:
+        if args.command == "migrate":
+            for action in await migrate_indexes(db):
+                print(action)
+            print("Indexes up to date")
+            for action in await run_backfills(db):
+                print(action)
+            print("Data backfills done")
+            return 0
+        if args.command == "verify":
+            missing = await verify_indexes(db)
+            for name in missing:
+                print(f"missing {name}")
+            return 1 if missing else 0
+        failures = await check_query_plans(db)
+        for failure in failures:
+            print(f"FAIL {failure}")
+        print(f"{len(_query_shapes())} query shapes checked, {len(failures)} not served by an index")
+        return 1 if failures else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
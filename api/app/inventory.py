@@ -0,0 +1,237 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import logging
+import os
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from .timeouts import with_own_budget
+
+logger = logging.getLogger(__name__)
+
+# Minutes a PENDING order may hold stock before it is cancelled and restocked,
+# unless it is confirmed (paid) first. 0 disables the timeout (orders hold
+# stock until cancelled).
+RESERVATION_TTL_MINUTES = int(os.getenv("ORDER_RESERVATION_TTL_MINUTES", "30"))
+RESERVATION_SWEEP_SECONDS = int(os.getenv("ORDER_RESERVATION_SWEEP_SECONDS", "60"))
+# A reservation marker whose order was never written (worker died between
+# reserve_stock and the order insert) is released once it is this old
+ORPHAN_RESERVATION_MINUTES = int(os.getenv("ORDER_ORPHAN_RESERVATION_MINUTES", "10"))
+
+
+class InsufficientStockError(Exception):
+    """Raised when stock could not be reserved for every item of an order"""
+
+
+# ===== Reservation primitives =====
+def _marker(order_id: ObjectId) -> str:
+    # Per-order marker on the product lets compensation undo exactly the
+    # decrements that succeeded, and makes reserve/release idempotent.
+    return f"reservations.{order_id}"
+
+
+async def reserve_stock(db: AsyncIOMotorDatabase, order_id: ObjectId, items: dict[ObjectId, int]) -> None:
+    """Atomically decrement stock for every item, or for none of them
+
+    Each decrement is conditional on `quantity >= n`, so concurrent checkouts
+    can never drive stock below zero. All updates go out in one bulk_write;
+    if any of them does not match, the ones that did are rolled back.
+    """
+    marker = _marker(order_id)
+    ops = [
+        UpdateOne(
+            {"_id": product_id, "status": "ACTIVE", "quantity": {"$gte": quantity}, marker: {"$exists": False}},
+            {"$inc": {"quantity": -quantity}, "$set": {marker: quantity}}
+        )
+        for product_id, quantity in items.items()
+    ]
+    try:
+        result = await db.Product.bulk_write(ops, ordered=False)
+    except PyMongoError:
+        # Some decrements may have been applied (a write error, or the request
+        # ran out of time mid-batch); their markers say which
+        await with_own_budget(release_stock(db, order_id, items))
+        raise
+
+    if result.modified_count < len(ops):
+        await with_own_budget(release_stock(db, order_id, items))
+        raise InsufficientStockError(f"Could not reserve stock for order {order_id}")
+
+
+async def release_stock(db: AsyncIOMotorDatabase, order_id: ObjectId, items: dict[ObjectId, int]) -> None:
+    """Give back stock taken by reserve_stock (only where the order's marker is present)"""
+    marker = _marker(order_id)
+    await db.Product.bulk_write([
+        UpdateOne(
+            {"_id": product_id, marker: {"$exists": True}},
+            {"$inc": {"quantity": quantity}, "$unset": {marker: ""}}
+        )
+        for product_id, quantity in items.items()
+    ], ordered=False)
+
+
+async def confirm_stock(db: AsyncIOMotorDatabase, order_id: ObjectId, product_ids: list[ObjectId]) -> None:
+    """Drop reservation markers once the order is durably written"""
+    try:
+        await db.Product.update_many(
+            {"_id": {"$in": product_ids}},
+            {"$unset": {_marker(order_id): ""}}
+        )
+    except Exception as e:
+        logger.error("Error confirming stock reservation for order %s: %s", order_id, e)
+
+
+def reservation_expiry(now: datetime) -> Optional[datetime]:
+    """Deadline for a new PENDING order, or None when timeouts are disabled"""
+    if RESERVATION_TTL_MINUTES <= 0:
+        return None
+    return now + timedelta(minutes=RESERVATION_TTL_MINUTES)
+
+
+# ===== Confirmation =====
+async def confirm_order(
+    db: AsyncIOMotorDatabase,
+    order_id: ObjectId,
+    extra_filter: Optional[dict] = None
+) -> bool:
+    """Mark a PENDING order paid (CONFIRMED); its stock is then never released by the sweeper
+
+    Conditional on PENDING, so an order the sweeper already expired cannot be
+    confirmed. Returns False if the order was not found or is no longer PENDING.
+    """
+    now = datetime.utcnow()
+    order = await db.Order.find_one_and_update(
+        {"_id": order_id, "status": "PENDING", **(extra_filter or {})},
+        {"$set": {"status": "CONFIRMED", "paidAt": now, "updatedAt": now}, "$unset": {"reservationExpiresAt": ""}},
+        projection={"_id": 1}
+    )
+    if not order:
+        return False
+
+    await db.SubOrder.update_many(
+        {"orderId": order_id, "status": "PENDING"},
+        {"$set": {"status": "CONFIRMED"}}
+    )
+    return True
+
+
+# ===== Cancellation / timeout =====
+async def cancel_order(
+    db: AsyncIOMotorDatabase,
+    order_id: ObjectId,
+    reason: str,
+    extra_filter: Optional[dict] = None
+) -> bool:
+    """Cancel a PENDING order and put its stock back
+
+    The PENDING -> CANCELLED flip is conditional, so only one caller (buyer,
+    sweeper, ...) ever restocks a given order. Returns False if the order was
+    not found or is no longer PENDING.
+    """
+    now = datetime.utcnow()
+    order = await db.Order.find_one_and_update(
+        {"_id": order_id, "status": "PENDING", **(extra_filter or {})},
+        {"$set": {"status": "CANCELLED", "cancelReason": reason, "updatedAt": now}},
+        projection={"items": 1}
+    )
+    if not order:
+        return False
+
+    await db.Product.bulk_write([
+        UpdateOne({"_id": ObjectId(item["productId"])}, {"$inc": {"quantity": item["quantity"]}})
+        for item in order["items"]
+    ], ordered=False)
+    await db.SubOrder.update_many(
+        {"orderId": order_id, "status": "PENDING"},
+        {"$set": {"status": "CANCELLED"}}
+    )
+    return True
+
+
+async def expire_reservations(db: AsyncIOMotorDatabase, batch_size: int = 100) -> int:
+    """Cancel PENDING orders whose reservation deadline passed before they were confirmed"""
+    expired = await db.Order.find(
+        {"status": "PENDING", "reservationExpiresAt": {"$lte": datetime.utcnow()}},
+        projection={"_id": 1}
+    ).limit(batch_size).to_list(batch_size)
+
+    cancelled = 0
+    for order in expired:
+        if await cancel_order(db, order["_id"], reason="RESERVATION_EXPIRED"):
+            cancelled += 1
+    return cancelled
+
+
+async def release_orphaned_reservations(db: AsyncIOMotorDatabase, batch_size: int = 100) -> int:
+    """Clear reservation markers left behind by orders that failed midway
+
+    A marker whose Order exists only lost its confirm_stock() and is dropped;
+    one whose Order was never written gives its stock back. Markers younger
+    than ORPHAN_RESERVATION_MINUTES (by the order id's timestamp) belong to
+    checkouts that may still be in flight and are left alone. Products holding
+    markers are paged by _id, so old markers are reached however many
+    products only hold young ones.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=ORPHAN_RESERVATION_MINUTES)
+    # An order's markers may span pages; count each order once
+    released: set[ObjectId] = set()
+    last_id = None
+    while True:
+        query = {"reservations": {"$gt": {}}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        products = await db.Product.find(
+            query,
+            projection={"reservations": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if products:
+            last_id = products[-1]["_id"]
+            released |= await _release_orphaned_batch(db, products, cutoff)
+        if len(products) < batch_size:
+            return len(released)
+
+
+async def _release_orphaned_batch(db: AsyncIOMotorDatabase, products: list[dict], cutoff: datetime) -> set[ObjectId]:
+    # order id -> {product id: reserved quantity}
+    held: dict[ObjectId, dict[ObjectId, int]] = {}
+    for product in products:
+        for order_id, quantity in product["reservations"].items():
+            if ObjectId.is_valid(order_id) and ObjectId(order_id).generation_time.replace(tzinfo=None) < cutoff:
+                held.setdefault(ObjectId(order_id), {})[product["_id"]] = quantity
+    if not held:
+        return set()
+
+    existing = {
+        order["_id"]
+        for order in await db.Order.find({"_id": {"$in": list(held)}}, projection={"_id": 1}).to_list(len(held))
+    }
+    released = set()
+    for order_id, items in held.items():
+        if order_id in existing:
+            await confirm_stock(db, order_id, list(items))
+        else:
+            await release_stock(db, order_id, items)
+            released.add(order_id)
+    return released
+
+
+async def run_reservation_sweeper(get_db) -> None:
+    """Background loop releasing expired and orphaned reservations"""
+    while True:
+        await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+        try:
+            db = await get_db()
+            cancelled = await expire_reservations(db) if RESERVATION_TTL_MINUTES > 0 else 0
+            if cancelled:
+                logger.info("Released stock for %s expired orders", cancelled)
+            orphaned = await release_orphaned_reservations(db)
+            if orphaned:
+                logger.warning("Released stock held for %s orders that were never written", orphaned)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error expiring reservations: %s", e)
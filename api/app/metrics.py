@@ -0,0 +1,265 @@
+"""Prometheus metrics for the API (requires the optional `prometheus_client` package)
+
+    GET /metrics
+
+Request metrics are labelled with the route template (e.g. /products/{product_id})
+so label cardinality stays bounded. Mongo metrics come from pymongo's command
+and connection-pool monitoring, registered on the client through
+mongo_listeners(). With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR
+so every worker's samples are aggregated into one exposition.
+"""
+from typing import Optional
+import asyncio
+import os
+import threading
+import time
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .querybudget import command_collection
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+    )
+    from prometheus_client import multiprocess
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
+# How often the event-loop lag probe wakes up
+EVENT_LOOP_PROBE_SECONDS = float(os.getenv("METRICS_EVENT_LOOP_PROBE_SECONDS", "0.5"))
+UNMATCHED_ROUTE = "unmatched"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+if METRICS_AVAILABLE:
+    HTTP_REQUESTS = Counter(
+        "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"]
+    )
+    HTTP_ERRORS = Counter(
+        "http_request_errors_total", "HTTP requests that failed with a 5xx or an exception", ["method", "route"]
+    )
+    HTTP_LATENCY = Histogram(
+        "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+    )
+    HTTP_IN_FLIGHT = Gauge(
+        "http_requests_in_flight", "HTTP requests being handled", ["method", "route"], multiprocess_mode="livesum"
+    )
+    MONGO_LATENCY = Histogram(
+        "mongo_command_duration_seconds", "Mongo command latency reported by the driver",
+        ["collection", "command"], buckets=LATENCY_BUCKETS
+    )
+    MONGO_FAILURES = Counter(
+        "mongo_command_failures_total", "Mongo commands that returned an error", ["collection", "command"]
+    )
+    POOL_CHECKOUT_WAIT = Histogram(
+        "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+        ["address"], buckets=LATENCY_BUCKETS
+    )
+    POOL_CHECKOUT_FAILURES = Counter(
+        "mongo_pool_checkout_failures_total", "Connection checkouts that failed", ["address", "reason"]
+    )
+    POOL_CHECKED_OUT = Gauge(
+        "mongo_pool_connections_checked_out", "Connections currently checked out of the pool",
+        ["address"], multiprocess_mode="livesum"
+    )
+    ADMISSION_WAIT = Histogram(
+        "admission_queue_wait_seconds", "Time requests waited for an admission slot",
+        ["route_class"], buckets=LATENCY_BUCKETS
+    )
+    ADMISSION_SHED = Counter(
+        "admission_shed_total", "Requests rejected with 503 by admission control", ["route_class", "reason"]
+    )
+    MONGO_TIMEOUTS = Counter(
+        "mongo_query_timeouts_total", "Queries that overran their time budget, by the fallback served",
+        ["operation", "fallback"]
+    )
+    EVENT_LOOP_LAG = Histogram(
+        "event_loop_lag_seconds", "How late the event loop ran a scheduled callback", buckets=LATENCY_BUCKETS
+    )
+
+
+# ===== HTTP =====
+def _matching_path(routes, scope) -> Optional[str]:
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            # Newer FastAPI keeps an included router as one route wrapping the
+            # router's own (unprefixed, as the API includes them) routes
+            included = getattr(route, "original_router", None)
+            if included is not None:
+                return _matching_path(included.routes, scope)
+            return getattr(route, "path", None)
+    return None
+
+
+def route_template(request: Request) -> str:
+    """The path template of the route that will handle the request"""
+    return _matching_path(request.app.router.routes, request.scope) or UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Count, time and track in-flight HTTP requests per route
+
+    Plain ASGI: it only observes the response start, so streamed bodies are
+    passed through untouched and timed until their last chunk is sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not METRICS_AVAILABLE:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        method, route = request.method, route_template(request)
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            if status_code >= 500:
+                HTTP_ERRORS.labels(method, route).inc()
+            in_flight.dec()
+
+
+def metrics_response() -> Response:
+    if not METRICS_AVAILABLE:
+        return Response("prometheus_client is not installed\n", status_code=404, media_type="text/plain")
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# ===== Mongo =====
+class CommandMetrics(monitoring.CommandListener):
+    """Mongo command latency by collection and command name"""
+
+    def __init__(self):
+        # request_id -> collection, remembered from the started event
+        self.collections: dict[int, str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        # getMore names the cursor id; its collection is under "collection"
+        self.collections[event.request_id] = command_collection(event.command_name, event.command)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        collection = self.collections.pop(event.request_id, "-")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        collection = self.collections.pop(event.request_id, "-")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1_000_000)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection checkout wait times and checked-out connections per server"""
+
+    def __init__(self):
+        # Checkouts happen on driver threads; a thread starts and finishes its own
+        self.started_at: dict[tuple, float] = {}
+
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_check_out_started(self, event) -> None:
+        self.started_at[(event.address, threading.get_ident())] = time.perf_counter()
+
+    def connection_checked_out(self, event) -> None:
+        started = self.started_at.pop((event.address, threading.get_ident()), None)
+        # pymongo >= 4.7 reports the wait itself
+        duration = getattr(event, "duration", None)
+        if duration is None and started is not None:
+            duration = time.perf_counter() - started
+        if duration is not None:
+            POOL_CHECKOUT_WAIT.labels(self._address(event)).observe(duration)
+        POOL_CHECKED_OUT.labels(self._address(event)).inc()
+
+    def connection_check_out_failed(self, event) -> None:
+        self.started_at.pop((event.address, threading.get_ident()), None)
+        POOL_CHECKOUT_FAILURES.labels(self._address(event), str(event.reason)).inc()
+
+    def connection_checked_in(self, event) -> None:
+        POOL_CHECKED_OUT.labels(self._address(event)).dec()
+
+    # Pool and connection lifecycle events are not measured
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether a driver error means the query ran out of time (maxTimeMS or pymongo.timeout())"""
+    return isinstance(error, PyMongoError) and error.timeout
+
+
+def record_query_timeout(operation: str, fallback: str) -> None:
+    if METRICS_AVAILABLE:
+        MONGO_TIMEOUTS.labels(operation, fallback).inc()
+
+
+def mongo_listeners() -> list:
+    """Event listeners to pass to AsyncIOMotorClient(event_listeners=...)"""
+    return [CommandMetrics(), PoolMetrics()] if METRICS_AVAILABLE else []
+
+
+# ===== Event loop =====
+# Most recent probe, also read by the health checks
+last_event_loop_lag = 0.0
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_PROBE_SECONDS) -> None:
+    """Record how much later than scheduled the loop wakes a sleeping task"""
+    global last_event_loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        last_event_loop_lag = max(0.0, loop.time() - expected)
+        if METRICS_AVAILABLE:
+            EVENT_LOOP_LAG.observe(last_event_loop_lag)
+
+
+def start_event_loop_monitor() -> asyncio.Task:
+    return asyncio.create_task(monitor_event_loop())
@@ -0,0 +1,254 @@
+"""Notification delivery shared by every router that notifies users
+
+Unread counters, the outbox writer and the payload pushed to live streams.
+"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .db import get_db
+from .outbox import NotificationOutbox
+from .pubsub import notification_broker
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationResponse(BaseModel):
+    id: str
+    userId: str
+    type: str
+    title: str
+    message: str
+    data: Optional[dict] = None
+    isRead: bool
+    createdAt: datetime
+
+
+# Denormalized count of unread notifications on each User document
+UNREAD_COUNT_FIELD = "unreadNotificationCount"
+
+
+async def get_unread_notification_count(db: AsyncIOMotorDatabase, user: dict) -> int:
+    """Read the stored counter, initialising it for users the migration backfill missed"""
+    if UNREAD_COUNT_FIELD in user:
+        return user[UNREAD_COUNT_FIELD]
+    return (await reconcile_unread_counts(db, [user["_id"]])).get(user["_id"], 0)
+
+
+async def decrement_unread_count(db: AsyncIOMotorDatabase, user_id: ObjectId, amount: int = 1) -> int:
+    """Decrement the counter (never below zero) and return the new value"""
+    user = await db.User.find_one_and_update(
+        {"_id": user_id},
+        [{"$set": {UNREAD_COUNT_FIELD: {
+            "$max": [0, {"$subtract": [{"$ifNull": [f"${UNREAD_COUNT_FIELD}", 0]}, amount]}]
+        }}}],
+        projection={UNREAD_COUNT_FIELD: 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return user[UNREAD_COUNT_FIELD] if user else 0
+
+
+async def reconcile_unread_counts(
+    db: AsyncIOMotorDatabase,
+    user_ids: Optional[list[ObjectId]] = None
+) -> dict[ObjectId, int]:
+    """Recompute unread counters from the Notification collection to repair drift
+
+    Pass user_ids to repair specific users; omit to rebuild every user's counter.
+    Returns the recomputed counts for users that have unread notifications.
+    The recount and the $set are not atomic: an increment or decrement that
+    lands in between is overwritten, so rebuild every counter only while no
+    worker is writing notifications.
+    """
+    match = {"isRead": False}
+    if user_ids is not None:
+        match["userId"] = {"$in": user_ids}
+    
+    results = await db.Notification.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$userId", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    counts = {r["_id"]: r["count"] for r in results}
+    
+    ops = [UpdateOne({"_id": user_id}, {"$set": {UNREAD_COUNT_FIELD: count}}) for user_id, count in counts.items()]
+    # Everyone else in scope has nothing unread
+    zero_filter = {"_id": {"$nin": list(counts)}}
+    if user_ids is not None:
+        zero_filter["_id"]["$in"] = user_ids
+    else:
+        zero_filter[UNREAD_COUNT_FIELD] = {"$ne": 0}
+    
+    if ops:
+        await db.User.bulk_write(ops, ordered=False)
+    await db.User.update_many(zero_filter, {"$set": {UNREAD_COUNT_FIELD: 0}})
+    return counts
+
+
+async def backfill_unread_counts(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Initialise the counter on every user that does not have it yet (migration step)
+
+    Each write only applies while the field is still missing, so a rerun never
+    overwrites a live counter. Run it before starting workers of a release that
+    increments the counter. Returns the number of users initialised.
+    """
+    backfilled = 0
+    cursor = db.User.find({UNREAD_COUNT_FIELD: {"$exists": False}}, projection={"_id": 1}).batch_size(batch_size)
+    batch: list[ObjectId] = []
+    async for user in cursor:
+        batch.append(user["_id"])
+        if len(batch) >= batch_size:
+            backfilled += await _backfill_unread_batch(db, batch)
+            batch = []
+    if batch:
+        backfilled += await _backfill_unread_batch(db, batch)
+    return backfilled
+
+
+async def _backfill_unread_batch(db: AsyncIOMotorDatabase, user_ids: list[ObjectId]) -> int:
+    results = await db.Notification.aggregate([
+        {"$match": {"userId": {"$in": user_ids}, "isRead": False}},
+        {"$group": {"_id": "$userId", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    counts = {r["_id"]: r["count"] for r in results}
+    result = await db.User.bulk_write([
+        UpdateOne({"_id": user_id, UNREAD_COUNT_FIELD: {"$exists": False}},
+                  {"$set": {UNREAD_COUNT_FIELD: counts.get(user_id, 0)}})
+        for user_id in user_ids
+    ], ordered=False)
+    return result.modified_count
+
+
+async def backfill_read_at(db: AsyncIOMotorDatabase) -> int:
+    """Stamp readAt on read notifications that predate it (migration step)
+
+    Without readAt the retention TTL index never purges them; stamping "now"
+    starts their retention period at the migration. Returns the number stamped.
+    """
+    result = await db.Notification.update_many(
+        {"isRead": True, "readAt": {"$exists": False}},
+        {"$set": {"readAt": datetime.utcnow()}}
+    )
+    return result.modified_count
+
+
+def notification_payload(notification: dict) -> dict:
+    """JSON-ready notification, as returned by GET /notifications"""
+    return NotificationResponse(
+        id=str(notification["_id"]),
+        userId=str(notification["userId"]),
+        type=notification["type"],
+        title=notification["title"],
+        message=notification["message"],
+        data=notification.get("data"),
+        isRead=notification["isRead"],
+        createdAt=notification["createdAt"]
+    ).model_dump(mode="json")
+
+
+async def create_notification(
+    db: AsyncIOMotorDatabase,
+    user_id: ObjectId,
+    notification_type: str,
+    title: str,
+    message: str,
+    data: Optional[dict] = None
+):
+    """Helper function to create notification (queued, written in the background)"""
+    await create_notifications(db, [{
+        "user_id": user_id,
+        "notification_type": notification_type,
+        "title": title,
+        "message": message,
+        "data": data
+    }])
+
+
+async def create_notifications(db: AsyncIOMotorDatabase, notifications: list[dict]):
+    """Helper function to queue many notifications for one batched insert
+
+    Each entry takes the same keyword arguments as create_notification (minus db);
+    `store_id` may be given instead of `user_id` to notify that store's owner.
+    Returns as soon as the notifications are journaled in the outbox.
+    """
+    if not notifications:
+        return
+    try:
+        now = datetime.utcnow()
+        notification_outbox.enqueue([
+            {
+                "_id": ObjectId(),
+                "userId": n.get("user_id"),
+                "recipientStoreId": n.get("store_id"),
+                "type": n["notification_type"],
+                "title": n["title"],
+                "message": n["message"],
+                "data": n.get("data"),
+                "isRead": False,
+                "createdAt": now
+            }
+            for n in notifications
+        ])
+    except Exception as e:
+        logger.error("Error creating notifications: %s", e)
+
+
+async def write_notifications(notification_docs: list[dict]):
+    """Outbox writer: insert a batch, then bump unread counters and push events
+
+    Replayed batches are expected after a crash, so documents that already
+    exist (same client-side _id) are skipped rather than counted twice.
+    """
+    db = await get_db()
+    
+    # Resolve store-addressed notifications to owners with one query per batch
+    store_ids = {doc["recipientStoreId"] for doc in notification_docs if doc.get("recipientStoreId")}
+    if store_ids:
+        stores = await db.Store.find(
+            {"_id": {"$in": list(store_ids)}},
+            projection={"_id": 1, "ownerId": 1}
+        ).to_list(len(store_ids))
+        owners = {store["_id"]: store["ownerId"] for store in stores}
+        for doc in notification_docs:
+            if doc.get("recipientStoreId"):
+                doc["userId"] = owners.get(doc["recipientStoreId"])
+    notification_docs = [
+        {k: v for k, v in doc.items() if k != "recipientStoreId"}
+        for doc in notification_docs
+        if doc.get("userId") is not None
+    ]
+    if not notification_docs:
+        return
+    
+    try:
+        await db.Notification.insert_many(notification_docs, ordered=False)
+        inserted = notification_docs
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err["code"] != 11000 for err in errors):
+            raise
+        duplicates = {err["index"] for err in errors}
+        inserted = [doc for i, doc in enumerate(notification_docs) if i not in duplicates]
+    
+    if not inserted:
+        return
+    
+    unread_by_user: dict[ObjectId, int] = {}
+    for notification_doc in inserted:
+        unread_by_user[notification_doc["userId"]] = unread_by_user.get(notification_doc["userId"], 0) + 1
+    await db.User.bulk_write([
+        UpdateOne({"_id": user_id}, {"$inc": {UNREAD_COUNT_FIELD: count}})
+        for user_id, count in unread_by_user.items()
+    ], ordered=False)
+    for notification_doc in inserted:
+        await notification_broker.publish(
+            str(notification_doc["userId"]), "notification", notification_payload(notification_doc)
+        )
+
+
+notification_outbox = NotificationOutbox(write_notifications)
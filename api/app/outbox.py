@@ -0,0 +1,291 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import glob
+import logging
+import os
+import socket
+
+from bson import json_util
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Flush when this many notifications are queued...
+OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", "100"))
+# ...or when the oldest queued notification has waited this long
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("NOTIFICATION_OUTBOX_FLUSH_MS", "200")) / 1000
+# Journal segments live here until their notifications are written to Mongo
+OUTBOX_DIR = os.getenv("NOTIFICATION_OUTBOX_DIR", os.path.join(os.getcwd(), ".outbox"))
+# A segment whose batch fails this many flushes in a row with an error that
+# retrying cannot fix is moved to OUTBOX_DIR/dead
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", "10"))
+# Failed flushes are retried with exponential backoff up to this delay
+OUTBOX_MAX_BACKOFF = float(os.getenv("NOTIFICATION_OUTBOX_MAX_BACKOFF_MS", "30000")) / 1000
+DEAD_LETTER_DIR = "dead"
+
+# Server error codes of a write that can succeed unchanged once the
+# deployment recovers (failover, shutdown, network trouble, time limits)
+TRANSIENT_ERROR_CODES = {6, 7, 50, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+
+def _retryable(error: Exception) -> bool:
+    """Whether a failed batch may still be written: Mongo unreachable or busy, not a bad document"""
+    # AutoReconnect, NetworkTimeout and ServerSelectionTimeoutError are ConnectionFailures
+    if isinstance(error, ConnectionFailure):
+        return True
+    if isinstance(error, BulkWriteError):
+        details = error.details or {}
+        return bool(details.get("writeConcernErrors")) or all(
+            err.get("code") in TRANSIENT_ERROR_CODES for err in details.get("writeErrors", [])
+        )
+    if isinstance(error, PyMongoError):
+        return (
+            error.timeout
+            or error.has_error_label("RetryableWriteError")
+            or getattr(error, "code", None) in TRANSIENT_ERROR_CODES
+        )
+    return False
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class NotificationOutbox:
+    """Write-behind queue for notification documents
+
+    enqueue() adds documents to an in-memory queue and hands them to a
+    journal thread, which appends them to a local segment file; it returns
+    without touching the disk or Mongo. A background task hands batches to
+    `writer` (one insert_many) when OUTBOX_BATCH_SIZE documents are queued or
+    OUTBOX_FLUSH_INTERVAL has elapsed. A segment is deleted only after its
+    batch is written, so notifications queued by a worker that crashed are
+    replayed by the next worker to start on the same host. Documents carry
+    client-side _ids, which makes replays idempotent.
+
+    Durability: segments are flushed to the OS but never fsynced. Journaled
+    notifications survive a crash of the worker process, not of the host
+    (power loss, kernel panic), and notifications the journal thread has not
+    written yet are lost with the process. Flushes that fail because Mongo is
+    unreachable are retried with backoff for as long as the outage lasts. A
+    batch that fails OUTBOX_MAX_ATTEMPTS flushes in a row for any other
+    reason has its segment moved to OUTBOX_DIR/dead, so it cannot hold up the
+    queue behind it; replay_dead_letters() writes those segments once the
+    cause is fixed (scripts/replay_dead_notifications.py).
+
+    All file operations run in order on the single journal thread.
+    """
+
+    def __init__(self, writer, directory: str = OUTBOX_DIR):
+        self.writer = writer
+        self.directory = directory
+        self.prefix = f"outbox-{socket.gethostname()}-{os.getpid()}-"
+        self.queue: list[dict] = []
+        self.segment_seq = 0
+        # Segment the queue is journaled to; its file is opened by the journal thread
+        self.segment_path: Optional[str] = None
+        # Segments rotated out but not yet written: (path, docs)
+        self.pending: list[tuple[str, list[dict]]] = []
+        # Consecutive failed flushes of pending[0] that retrying cannot fix
+        self.failures = 0
+        self.wakeup = asyncio.Event()
+        self.flusher: Optional[asyncio.Task] = None
+        self.journal: Optional[ThreadPoolExecutor] = None
+        # Open segment files, only touched on the journal thread
+        self.files: dict[str, object] = {}
+
+    # ===== Producer side =====
+    def enqueue(self, docs: list[dict]) -> None:
+        if self.segment_path is None:
+            self.segment_seq += 1
+            self.segment_path = os.path.join(self.directory, f"{self.prefix}{self.segment_seq}.jsonl")
+        self._journal().submit(self._append, self.segment_path, docs)
+        self.queue.extend(docs)
+        if len(self.queue) >= OUTBOX_BATCH_SIZE:
+            self.wakeup.set()
+
+    def depth(self) -> int:
+        return len(self.queue) + sum(len(docs) for _, docs in self.pending)
+
+    # ===== Lifecycle =====
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        await self._recover_orphaned_segments()
+        self.flusher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and drain everything still queued"""
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Could not drain notification outbox, left in %s: %s", self.directory, e)
+        if self.journal is not None:
+            # Let the journal thread finish, then close whatever is still open
+            await self._in_journal(self._close_all)
+            self.journal.shutdown()
+            self.journal = None
+        self.segment_path = None
+
+    # ===== Flushing =====
+    async def _run(self) -> None:
+        delay = OUTBOX_FLUSH_INTERVAL
+        while True:
+            if delay > OUTBOX_FLUSH_INTERVAL:
+                # Backing off: a full queue must not bring the retry forward
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=OUTBOX_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+                delay = OUTBOX_FLUSH_INTERVAL
+            except Exception as e:
+                delay = min(delay * 2, OUTBOX_MAX_BACKOFF)
+                logger.error("Error flushing notification outbox (retrying in %.1fs): %s", delay, e)
+
+    async def flush(self) -> None:
+        # Rotating the segment and taking the queue happen without an await,
+        # so every queued doc belongs to exactly one pending segment.
+        if self.queue:
+            self.pending.append((self.segment_path, self.queue))
+            self.queue = []
+            self._journal().submit(self._close, self.segment_path)
+            self.segment_path = None
+
+        while self.pending:
+            path, docs = self.pending[0]
+            try:
+                for start in range(0, len(docs), OUTBOX_BATCH_SIZE):
+                    await self.writer(docs[start:start + OUTBOX_BATCH_SIZE])
+            except Exception as e:
+                if _retryable(e):
+                    raise
+                self.failures += 1
+                if self.failures < OUTBOX_MAX_ATTEMPTS:
+                    raise
+                dead = await self._in_journal(self._dead_letter, path)
+                logger.error(
+                    "Gave up on %s queued notifications after %s attempts, moved to %s: %s",
+                    len(docs), self.failures, dead, e
+                )
+            else:
+                await self._in_journal(os.remove, path)
+            self.pending.pop(0)
+            self.failures = 0
+
+    async def replay_dead_letters(self) -> tuple[int, int]:
+        """Write the dead-lettered segments again, removing each one that succeeds
+
+        Replays are idempotent (client-side _ids), so a segment that was
+        partly written before it was dead-lettered is safe to replay.
+        Returns (segments replayed, segments still failing).
+        """
+        replayed = failed = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, DEAD_LETTER_DIR, "*.jsonl"))):
+            docs = await self._in_journal(self._read_segment, path)
+            try:
+                for start in range(0, len(docs), OUTBOX_BATCH_SIZE):
+                    await self.writer(docs[start:start + OUTBOX_BATCH_SIZE])
+            except Exception as e:
+                failed += 1
+                logger.error("Could not replay %s notifications from %s: %s", len(docs), os.path.basename(path), e)
+                continue
+            await self._in_journal(os.remove, path)
+            replayed += 1
+            logger.info("Replayed %s dead-lettered notifications from %s", len(docs), os.path.basename(path))
+        return replayed, failed
+
+    # ===== Journal thread =====
+    def _journal(self) -> ThreadPoolExecutor:
+        if self.journal is None:
+            # One thread, so appends, closes and removals run in submission order
+            self.journal = ThreadPoolExecutor(max_workers=1, thread_name_prefix="notification-outbox")
+        return self.journal
+
+    async def _in_journal(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._journal(), fn, *args)
+
+    def _append(self, path: str, docs: list[dict]) -> None:
+        try:
+            segment = self.files.get(path)
+            if segment is None:
+                os.makedirs(self.directory, exist_ok=True)
+                segment = self.files[path] = open(path, "a", encoding="utf-8")
+            segment.write("".join(json_util.dumps(doc) + "\n" for doc in docs))
+            segment.flush()
+        except Exception as e:
+            # Still queued in memory; only lost if the process dies before the flush
+            logger.error("Error journaling %s notifications to %s: %s", len(docs), os.path.basename(path), e)
+
+    def _close(self, path: str) -> None:
+        segment = self.files.pop(path, None)
+        if segment is not None:
+            segment.close()
+
+    def _close_all(self) -> None:
+        for path in list(self.files):
+            self._close(path)
+            if os.path.exists(path) and os.path.getsize(path) == 0:
+                os.remove(path)
+
+    def _dead_letter(self, path: str) -> str:
+        self._close(path)
+        dead_dir = os.path.join(self.directory, DEAD_LETTER_DIR)
+        os.makedirs(dead_dir, exist_ok=True)
+        dead = os.path.join(dead_dir, os.path.basename(path))
+        try:
+            os.replace(path, dead)
+        except FileNotFoundError:
+            # Never journaled (see _append); nothing to keep
+            pass
+        return dead
+
+    @staticmethod
+    def _read_segment(path: str) -> list[dict]:
+        docs = []
+        with open(path, encoding="utf-8") as segment:
+            for line in segment:
+                try:
+                    docs.append(json_util.loads(line))
+                except ValueError:
+                    # Torn final line from a crash mid-write
+                    logger.warning("Skipping unreadable outbox entry in %s", os.path.basename(path))
+        return docs
+
+    async def _recover_orphaned_segments(self) -> None:
+        host_prefix = f"outbox-{socket.gethostname()}-"
+        for index, path in enumerate(sorted(glob.glob(os.path.join(self.directory, f"{host_prefix}*.jsonl")))):
+            pid = int(os.path.basename(path)[len(host_prefix):].split("-", 1)[0])
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # Take ownership first so concurrently starting workers skip it,
+            # and a crash mid-replay leaves it for the next worker
+            claimed = os.path.join(self.directory, f"{self.prefix}recovered-{index}.jsonl")
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            docs = await self._in_journal(self._read_segment, claimed)
+            self.pending.append((claimed, docs))
+            logger.info("Recovered %s queued notifications from %s", len(docs), os.path.basename(path))
+
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Error replaying recovered notifications (will retry): %s", e)
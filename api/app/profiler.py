@@ -0,0 +1,158 @@
+"""Opt-in sampling profiler for individual requests
+
+A request is profiled when it is picked by PROFILE_SAMPLE_RATE (fraction of
+requests, default 0 = off) or carries the PROFILE_HEADER header set to
+PROFILE_DEBUG_TOKEN (disabled while the token is unset). While it runs, a
+background thread samples the event-loop thread's stack every
+PROFILE_INTERVAL_MS; the samples cover dependency resolution, validation, the
+handler and response serialization, and include whatever else the loop ran
+meanwhile. Profiles are written in the collapsed-stack format read by
+flamegraph.pl and speedscope:
+
+    PROFILE_SAMPLE_RATE=0.001 python -m uvicorn app.main:app
+    flamegraph.pl .profiles/<file>.folded > profile.svg
+
+Only one request per worker is profiled at a time, and PROFILE_DIR is pruned
+to PROFILE_MAX_FILES files no older than PROFILE_MAX_AGE_HOURS.
+"""
+import asyncio
+import glob
+import logging
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_DEBUG_TOKEN = os.getenv("PROFILE_DEBUG_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getcwd(), ".profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_AGE_HOURS = float(os.getenv("PROFILE_MAX_AGE_HOURS", "24"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Sample one thread's stack from a background thread into folded-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: dict[str, int] = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> dict[str, int]:
+        self.stopped.set()
+        self.thread.join()
+        return self.counts
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                stack = ";".join(reversed(labels))
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+
+def _prune(directory: str) -> None:
+    paths = sorted(glob.glob(os.path.join(directory, "*.folded")), key=os.path.getmtime, reverse=True)
+    cutoff = time.time() - PROFILE_MAX_AGE_HOURS * 3600
+    for index, path in enumerate(paths):
+        if index >= PROFILE_MAX_FILES or os.path.getmtime(path) < cutoff:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _write_profile(directory: str, name: str, counts: dict[str, int]) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"{stack} {count}\n" for stack, count in counts.items())
+    _prune(directory)
+    return path
+
+
+class ProfilerMiddleware:
+    """Profile sampled or explicitly requested requests; a no-op otherwise
+
+    Sampling stops when the response starts (the body is serialized by then),
+    and the profile is written once the response has been sent.
+    """
+
+    def __init__(self, app: ASGIApp, directory: str = PROFILE_DIR):
+        self.app = app
+        self.directory = directory
+        self.active = False
+
+    def _wants_profile(self, headers: Headers) -> bool:
+        token = headers.get(PROFILE_HEADER)
+        if token and PROFILE_DEBUG_TOKEN and secrets.compare_digest(token, PROFILE_DEBUG_TOKEN):
+            return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.active or not self._wants_profile(Headers(scope=scope)):
+            await self.app(scope, receive, send)
+            return
+
+        self.active = True
+        sampler = StackSampler(threading.get_ident(), PROFILE_INTERVAL_MS / 1000)
+        started = time.perf_counter()
+        profile = None
+
+        def stop_sampling() -> None:
+            nonlocal profile
+            if self.active:
+                profile = sampler.stop()
+                self.active = False
+
+        async def send_with_profile(message: Message) -> None:
+            nonlocal name
+            if message["type"] == "http.response.start" and self.active:
+                stop_sampling()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+                name = (
+                    f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{slug}-"
+                    f"{elapsed_ms:.0f}ms-{secrets.token_hex(3)}.folded"
+                )
+                MutableHeaders(scope=message)["X-Profile-File"] = name
+            await send(message)
+
+        name = None
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            stop_sampling()
+
+        if name is None:
+            return
+        try:
+            # File I/O stays off the event loop
+            await asyncio.to_thread(_write_profile, self.directory, name, profile)
+        except Exception as e:
+            logger.error("Error writing request profile: %s", e)
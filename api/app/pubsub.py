@@ -0,0 +1,111 @@
+from typing import Optional
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# "memory" delivers only to subscribers on this worker; "redis" fans out across workers
+PUBSUB_BACKEND = os.getenv("NOTIFICATION_PUBSUB_BACKEND", "memory")
+PUBSUB_REDIS_URL = os.getenv("NOTIFICATION_PUBSUB_REDIS_URL", "redis://localhost:6379/0")
+PUBSUB_CHANNEL_PREFIX = "walk4you:notifications:"
+# Events buffered per connection before a slow client starts losing them
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class MemoryBackend:
+    """Single-process backend: published messages are delivered straight back"""
+
+    def __init__(self):
+        self.deliver = None
+
+    async def start(self, deliver) -> None:
+        self.deliver = deliver
+
+    async def publish(self, user_id: str, message: dict) -> None:
+        self.deliver(user_id, message)
+
+    async def stop(self) -> None:
+        self.deliver = None
+
+
+class RedisBackend:
+    """Cross-worker backend on Redis pub/sub (requires the optional `redis` package)"""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("NOTIFICATION_PUBSUB_BACKEND=redis requires `pip install redis`") from e
+        self.redis = redis.from_url(url)
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, deliver) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.psubscribe(f"{PUBSUB_CHANNEL_PREFIX}*")
+        self.listener = asyncio.create_task(self._listen(pubsub, deliver))
+
+    async def _listen(self, pubsub, deliver) -> None:
+        async for raw in pubsub.listen():
+            if raw["type"] != "pmessage":
+                continue
+            try:
+                channel = raw["channel"].decode()
+                deliver(channel[len(PUBSUB_CHANNEL_PREFIX):], json.loads(raw["data"]))
+            except Exception as e:
+                logger.error("Error delivering pubsub message: %s", e)
+
+    async def publish(self, user_id: str, message: dict) -> None:
+        await self.redis.publish(f"{PUBSUB_CHANNEL_PREFIX}{user_id}", json.dumps(message, default=str))
+
+    async def stop(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.redis.aclose()
+
+
+class NotificationBroker:
+    """Fan out per-user notification events to the streams connected to this worker"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.subscribers: dict[str, set[asyncio.Queue]] = {}
+
+    async def start(self) -> None:
+        if self.backend is None:
+            self.backend = RedisBackend(PUBSUB_REDIS_URL) if PUBSUB_BACKEND == "redis" else MemoryBackend()
+        await self.backend.start(self._deliver)
+
+    async def stop(self) -> None:
+        if self.backend is not None:
+            await self.backend.stop()
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+
+    async def publish(self, user_id: str, event: str, data: dict) -> None:
+        """Publish an event for one user; never raises into the caller's request"""
+        try:
+            await self.backend.publish(user_id, {"event": event, "data": data})
+        except Exception as e:
+            logger.error("Error publishing %s event: %s", event, e)
+
+    def _deliver(self, user_id: str, message: dict) -> None:
+        for queue in self.subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.warning("Dropping %s event for slow subscriber %s", message['event'], user_id)
+
+
+notification_broker = NotificationBroker()
@@ -0,0 +1,186 @@
+"""Per-request Mongo query accounting
+
+Every command the driver sends while a request is being handled is recorded
+on that request's RequestQueries (found through a contextvar; Motor copies the
+context into the threads that run pymongo). QueryBudgetMiddleware then:
+
+- adds a Server-Timing header with the number of commands and their total time,
+- logs a warning when a request issues more than QUERY_BUDGET commands,
+- flags commands repeated within one request: the same query with the same
+  values, or the same query shape QUERY_REPEAT_LIMIT or more times (N+1).
+
+check_query_scaling() is the opt-in test mode: it fails when an endpoint's
+command count grows with the size of its input (see scripts/check_query_scaling.py).
+"""
+from contextvars import ContextVar
+from typing import Optional
+import json
+import logging
+import os
+import time
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Mongo commands a single request may issue before a warning is logged
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "10"))
+# Same query shape this many times in one request is reported as a likely N+1
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "3"))
+
+# Driver housekeeping that is not part of a request's work
+_IGNORED_COMMANDS = {"endSessions", "hello", "isMaster", "ismaster", "saslStart", "saslContinue", "killCursors"}
+# Command fields that carry the query itself, as opposed to options
+_SHAPE_FIELDS = ("filter", "query", "q", "pipeline", "updates", "deletes", "sort", "projection")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by check_query_scaling when command counts grow with input size"""
+
+
+def _normalize(value):
+    """Replace literal values with "?" while keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        # $in lists and documents arrays keep their shape, not their length
+        return [_normalize(value[0])] if value else []
+    return "?"
+
+
+def command_collection(command_name: str, command: dict) -> str:
+    target = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return target if isinstance(target, str) else "-"
+
+
+def query_shape(command_name: str, command: dict) -> str:
+    """Collection, command and filter structure with values stripped"""
+    parts = {field: _normalize(command[field]) for field in _SHAPE_FIELDS if field in command}
+    return f"{command_collection(command_name, command)}.{command_name} {json.dumps(parts, sort_keys=True)}"
+
+
+def query_fingerprint(command_name: str, command: dict) -> str:
+    """Like query_shape, but keeps values so identical queries compare equal"""
+    parts = {field: command[field] for field in _SHAPE_FIELDS if field in command}
+    if command_name == "getMore":
+        parts["cursor"] = command[command_name]
+    return (
+        f"{command_collection(command_name, command)}.{command_name} "
+        f"{json.dumps(parts, sort_keys=True, default=str)}"
+    )
+
+
+class RequestQueries:
+    """Commands issued on behalf of one request"""
+
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.started = time.perf_counter()
+        # (shape, fingerprint, duration in ms)
+        self.commands: list[tuple[str, str, float]] = []
+        self.pending: dict[int, tuple[str, str]] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(duration for _, _, duration in self.commands)
+
+    def repeated(self) -> list[str]:
+        """Descriptions of identical queries and repeated shapes (likely N+1)"""
+        shapes: dict[str, int] = {}
+        fingerprints: dict[str, int] = {}
+        for shape, fingerprint, _ in self.commands:
+            shapes[shape] = shapes.get(shape, 0) + 1
+            fingerprints[fingerprint] = fingerprints.get(fingerprint, 0) + 1
+        findings = [f"{count}x identical {fingerprint}" for fingerprint, count in fingerprints.items() if count > 1]
+        findings.extend(f"{count}x shape {shape}" for shape, count in shapes.items() if count >= QUERY_REPEAT_LIMIT)
+        return findings
+
+
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+class QueryTracker(monitoring.CommandListener):
+    """Attribute driver commands to the request in whose context they run"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        queries = current_queries.get()
+        if queries is None or event.command_name in _IGNORED_COMMANDS:
+            return
+        queries.pending[event.request_id] = (
+            query_shape(event.command_name, event.command),
+            query_fingerprint(event.command_name, event.command),
+        )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event)
+
+    @staticmethod
+    def _finish(event) -> None:
+        queries = current_queries.get()
+        if queries is None:
+            return
+        query = queries.pending.pop(event.request_id, None)
+        if query is not None:
+            queries.commands.append((*query, event.duration_micros / 1000))
+
+
+class QueryBudgetMiddleware:
+    """Report each request's Mongo commands in Server-Timing and warn on excess
+
+    The header covers the commands issued before the response starts; the
+    warnings also count those issued while a streamed body is sent.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries(f"{scope['method']} {scope['path']}")
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - queries.started) * 1000
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'db;dur={queries.total_ms:.1f};desc="{queries.count} queries", total;dur={total_ms:.1f}'
+                )
+            await send(message)
+
+        token = current_queries.set(queries)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_queries.reset(token)
+
+        if queries.count > QUERY_BUDGET:
+            logger.warning("%s issued %s Mongo commands (budget %s)", queries.route, queries.count, QUERY_BUDGET)
+        for finding in queries.repeated():
+            logger.warning("%s repeated query: %s", queries.route, finding)
+
+
+def server_timing_queries(header: str) -> Optional[int]:
+    """Query count from a Server-Timing header written by QueryBudgetMiddleware"""
+    for metric in header.split(","):
+        if metric.strip().startswith("db;") and 'desc="' in metric:
+            return int(metric.split('desc="', 1)[1].split(" ", 1)[0])
+    return None
+
+
+def check_query_scaling(endpoint: str, counts_by_size: dict[int, int]) -> None:
+    """Fail when the command count for an endpoint changes with input size"""
+    if len(set(counts_by_size.values())) > 1:
+        observed = ", ".join(f"size {size}: {count}" for size, count in sorted(counts_by_size.items()))
+        raise QueryBudgetExceeded(f"{endpoint} query count grows with input size ({observed})")
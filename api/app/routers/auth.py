@@ -0,0 +1,310 @@
+"""Registration, login, the current user's profile and store-registration OTPs"""
+from datetime import datetime
+from typing import Optional
+import logging
+import os
+import random
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel, EmailStr
+
+from ..db import get_db
+from ..security import create_access_token, get_current_user, hash_password, verify_password
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["auth"])
+
+
+# ===== Auth Models =====
+class UserRegister(BaseModel):
+    username: str
+    password: str
+    email: EmailStr
+    phone: Optional[str] = None
+
+
+class UserLogin(BaseModel):
+    username: str
+    password: str
+
+
+class UserResponse(BaseModel):
+    id: str
+    username: str
+    email: str
+    role: str
+    registerDate: datetime
+    avatar: Optional[dict] = None
+
+
+class AuthResponse(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserResponse
+
+
+@router.post("/auth/register", response_model=AuthResponse)
+async def register(user_data: UserRegister, db: AsyncIOMotorDatabase = Depends(get_db)):
+    try:
+        # Check if user exists (using indexed fields)
+        existing_user = await db.User.find_one({
+            "$or": [
+                {"username": user_data.username},
+                {"email": user_data.email}
+            ]
+        })
+        
+        if existing_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already exists"
+            )
+        
+        hashed_password = hash_password(user_data.password)
+        user_doc = {
+            "username": user_data.username,
+            "password": hashed_password,
+            "email": user_data.email,
+            "phone": user_data.phone,
+            "role": "CUSTOMER",
+            "registerDate": datetime.utcnow()
+        }
+        
+        result = await db.User.insert_one(user_doc)
+        
+        access_token = create_access_token({
+            "user_id": str(result.inserted_id),
+            "username": user_data.username
+        })
+        
+        return AuthResponse(
+            access_token=access_token,
+            token_type="bearer",
+            user=UserResponse(
+                id=str(result.inserted_id),
+                username=user_data.username,
+                email=user_data.email,
+                role="CUSTOMER",
+                registerDate=user_doc["registerDate"]
+            )
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Registration error: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Registration failed"
+        )
+
+
+@router.post("/auth/login", response_model=AuthResponse)
+async def login(login_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
+    try:
+        # Query using indexed field
+        user = await db.User.find_one({"username": login_data.username})
+        
+        if not user or not verify_password(login_data.password, user["password"]):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid username or password"
+            )
+        
+        access_token = create_access_token({
+            "user_id": str(user["_id"]),
+            "username": user["username"]
+        })
+        
+        return AuthResponse(
+            access_token=access_token,
+            token_type="bearer",
+            user=UserResponse(
+                id=str(user["_id"]),
+                username=user["username"],
+                email=user["email"],
+                role=user["role"],
+                registerDate=user["registerDate"],
+                avatar=user.get("avatar")
+            )
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Login error: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Login failed"
+        )
+
+
+@router.get("/users/me", response_model=UserResponse)
+async def get_my_profile(current_user=Depends(get_current_user)):
+    return UserResponse(
+        id=str(current_user["_id"]),
+        username=current_user["username"],
+        email=current_user["email"],
+        role=current_user["role"],
+        registerDate=current_user["registerDate"],
+        avatar=current_user.get("avatar")
+    )
+
+
+# ===== OTP Endpoints =====
+class OTPRequest(BaseModel):
+    email: str
+
+class OTPVerify(BaseModel):
+    email: str
+    otp: str
+
+# Store OTP in memory (in production, use Redis or database)
+otp_storage = {}
+
+def generate_otp():
+    """Generate 6-digit OTP"""
+    return str(random.randint(100000, 999999))
+
+def send_email_otp(email: str, otp: str):
+    """Send OTP via email"""
+    # Only OTP requests need the mail stack; keep it out of worker startup
+    import smtplib
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    
+    try:
+        # Email configuration (you should use environment variables)
+        smtp_server = os.getenv("SMTP_SERVER")
+        smtp_port = int(os.getenv("SMTP_PORT"))
+        smtp_username = os.getenv("SMTP_USERNAME")
+        smtp_password = os.getenv("SMTP_PASSWORD")
+        
+        if not smtp_username or not smtp_password:
+            logger.warning("SMTP credentials not configured, using mock email")
+            return True
+        
+        # Create message
+        msg = MIMEMultipart()
+        msg['From'] = smtp_username
+        msg['To'] = email
+        msg['Subject'] = "Walk4You - Store Registration OTP"
+        
+        # Email body
+        body = f"""
+        <html>
+        <body>
+            <h2>Walk4You Store Registration</h2>
+            <p>Your OTP code is: <strong>{otp}</strong></p>
+            <p>This code will expire in 10 minutes.</p>
+            <p>If you didn't request this code, please ignore this email.</p>
+            <br>
+            <p>Best regards,<br>Walk4You Team</p>
+        </body>
+        </html>
+        """
+        
+        msg.attach(MIMEText(body, 'html'))
+        
+        # Send email
+        server = smtplib.SMTP(smtp_server, smtp_port)
+        server.starttls()
+        server.login(smtp_username, smtp_password)
+        text = msg.as_string()
+        server.sendmail(smtp_username, email, text)
+        server.quit()
+        
+        return True
+    except Exception as e:
+        logger.error("Email sending failed: %s", e)
+        return False
+
+@router.post("/auth/send-otp")
+async def send_otp(request: OTPRequest):
+    """Send OTP to email"""
+    email = request.email
+    
+    # Validate BU Mail format
+    if not email.endswith("@bumail.net"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only BU Mail addresses are allowed"
+        )
+    
+    # Generate OTP
+    otp = generate_otp()
+    
+    # Store OTP with expiration (10 minutes)
+    otp_storage[email] = {
+        "otp": otp,
+        "expires_at": time.time() + 600,  # 10 minutes
+        "attempts": 0
+    }
+    
+    # Send email
+    email_sent = send_email_otp(email, otp)
+    
+    if email_sent:
+        return {
+            "success": True,
+            "message": "OTP sent to your email",
+            "email": email
+        }
+    else:
+        # For development, return OTP in response
+        return {
+            "success": True,
+            "message": "OTP sent to your email (development mode)",
+            "email": email,
+            "otp": otp  # Only for development
+        }
+
+@router.post("/auth/verify-otp")
+async def verify_otp(request: OTPVerify):
+    """Verify OTP"""
+    email = request.email
+    otp = request.otp
+    
+    # Check if OTP exists
+    if email not in otp_storage:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="OTP not found or expired"
+        )
+    
+    stored_data = otp_storage[email]
+    
+    # Check expiration
+    if time.time() > stored_data["expires_at"]:
+        del otp_storage[email]
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="OTP expired"
+        )
+    
+    # Check attempts
+    if stored_data["attempts"] >= 3:
+        del otp_storage[email]
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Too many attempts"
+        )
+    
+    # Verify OTP
+    if stored_data["otp"] != otp:
+        stored_data["attempts"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid OTP"
+        )
+    
+    # OTP verified successfully
+    del otp_storage[email]
+    
+    return {
+        "success": True,
+        "message": "OTP verified successfully"
+    }
@@ -0,0 +1,505 @@
+"""The current user's shopping cart and checkout"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..db import get_db
+from ..security import get_current_user
+from .orders import CartCheckout, OrderResponse, place_order
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["cart"])
+
+
+# ===== Cart Models =====
+class CartItemCreate(BaseModel):
+    productId: str
+    quantity: int
+
+
+class CartItemUpdate(BaseModel):
+    quantity: int
+
+
+class CartItemResponse(BaseModel):
+    id: str
+    productId: str
+    productName: str
+    productPrice: float
+    productImage: Optional[str] = None
+    quantity: int
+    totalPrice: float
+    storeId: str
+    storeName: str
+    createdAt: datetime
+    updatedAt: datetime
+
+
+class CartResponse(BaseModel):
+    id: str
+    userId: str
+    items: list[CartItemResponse]
+    totalItems: int
+    totalAmount: float
+    createdAt: datetime
+    updatedAt: datetime
+
+
+# ===== Cart Helpers =====
+def empty_cart_doc(user_id: ObjectId) -> dict:
+    """Build an unsaved empty cart for users who have never modified their cart"""
+    now = datetime.utcnow()
+    return {
+        "_id": None,
+        "userId": user_id,
+        "items": [],
+        "totalItems": 0,
+        "totalAmount": 0.0,
+        "createdAt": now,
+        "updatedAt": now
+    }
+
+
+def cart_item_snapshot(product: dict) -> dict:
+    """Product fields copied onto a cart item so checkout needs no product reads"""
+    return {
+        "productName": product["name"],
+        "price": product["price"],
+        "storeId": product["storeId"]
+    }
+
+
+async def cart_total(db: AsyncIOMotorDatabase, items: list[dict]) -> float:
+    """Sum of the items' price snapshots; items saved before snapshots existed need one bulk product read"""
+    missing = [item["productId"] for item in items if "price" not in item]
+    prices = {}
+    if missing:
+        products = await db.Product.find(
+            {"_id": {"$in": missing}},
+            projection={"_id": 1, "price": 1}
+        ).to_list(len(missing))
+        prices = {p["_id"]: p["price"] for p in products}
+    
+    total_amount = 0.0
+    for item in items:
+        price = item["price"] if "price" in item else prices.get(item["productId"])
+        if price is not None:
+            total_amount += price * item["quantity"]
+    return total_amount
+
+
+async def get_or_create_cart(db: AsyncIOMotorDatabase, user_id: ObjectId) -> dict:
+    """Load user's cart, upserting an empty one if it doesn't exist yet"""
+    cart_doc = empty_cart_doc(user_id)
+    del cart_doc["_id"]
+    del cart_doc["userId"]
+    try:
+        return await db.Cart.find_one_and_update(
+            {"userId": user_id},
+            {"$setOnInsert": cart_doc},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # A concurrent first mutation won the upsert race; use its cart
+        return await db.Cart.find_one({"userId": user_id})
+
+
+# ===== Cart Endpoints =====
+@router.get("/cart", response_model=CartResponse)
+async def get_cart(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get user's cart"""
+    try:
+        # Find user's cart (read-only: a missing cart is served as a virtual empty one)
+        cart = await db.Cart.find_one({"userId": current_user["_id"]})
+        
+        if not cart:
+            cart = empty_cart_doc(current_user["_id"])
+        
+        # Current product and store details for all items in two queries
+        product_ids = [ObjectId(item["productId"]) for item in cart["items"]]
+        products = {}
+        stores = {}
+        if product_ids:
+            products = {
+                p["_id"]: p
+                async for p in db.Product.find(
+                    {"_id": {"$in": product_ids}},
+                    projection={"_id": 1, "name": 1, "price": 1, "image_url": 1, "storeId": 1}
+                )
+            }
+            store_ids = list({p["storeId"] for p in products.values()})
+            stores = {
+                s["_id"]: s
+                async for s in db.Store.find({"_id": {"$in": store_ids}}, projection={"storeName": 1})
+            }
+        
+        cart_items = []
+        for item in cart["items"]:
+            product = products.get(ObjectId(item["productId"]))
+            if product:
+                store = stores.get(product["storeId"])
+                store_name = store["storeName"] if store else "Unknown Store"
+                
+                cart_items.append(CartItemResponse(
+                    id=str(item["_id"]),
+                    productId=str(item["productId"]),
+                    productName=product["name"],
+                    productPrice=product["price"],
+                    productImage=product.get("image_url"),
+                    quantity=item["quantity"],
+                    totalPrice=product["price"] * item["quantity"],
+                    storeId=str(product["storeId"]),
+                    storeName=store_name,
+                    createdAt=item["createdAt"],
+                    updatedAt=item["updatedAt"]
+                ))
+        
+        return CartResponse(
+            id=str(cart["_id"]) if cart.get("_id") else "",
+            userId=str(cart["userId"]),
+            items=cart_items,
+            totalItems=cart["totalItems"],
+            totalAmount=cart["totalAmount"],
+            createdAt=cart["createdAt"],
+            updatedAt=cart["updatedAt"]
+        )
+        
+    except Exception as e:
+        logger.error("Error getting cart: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/cart/items", response_model=CartItemResponse)
+async def add_to_cart(
+    item_data: CartItemCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Add item to cart"""
+    try:
+        # Verify product exists and is active
+        product = await db.Product.find_one({
+            "_id": ObjectId(item_data.productId),
+            "status": "ACTIVE"
+        })
+        
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        # Check if product has enough quantity
+        if product["quantity"] < item_data.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient quantity. Available: {product['quantity']}"
+            )
+        
+        # Find user's cart, creating it on the first mutation
+        cart = await get_or_create_cart(db, current_user["_id"])
+        
+        # Check if item already exists in cart
+        existing_item = None
+        for item in cart["items"]:
+            if str(item["productId"]) == item_data.productId:
+                existing_item = item
+                break
+        
+        if existing_item:
+            # Update existing item quantity and refresh its price snapshot
+            existing_item["quantity"] += item_data.quantity
+            existing_item.update(cart_item_snapshot(product))
+            existing_item["updatedAt"] = datetime.utcnow()
+        else:
+            # Add new item to cart
+            new_item = {
+                "_id": ObjectId(),
+                "productId": ObjectId(item_data.productId),
+                "quantity": item_data.quantity,
+                **cart_item_snapshot(product),
+                "createdAt": datetime.utcnow(),
+                "updatedAt": datetime.utcnow()
+            }
+            cart["items"].append(new_item)
+        
+        # Recalculate totals
+        total_items = sum(item["quantity"] for item in cart["items"])
+        total_amount = await cart_total(db, cart["items"])
+        
+        # Update cart
+        await db.Cart.update_one(
+            {"_id": cart["_id"]},
+            {
+                "$set": {
+                    "items": cart["items"],
+                    "totalItems": total_items,
+                    "totalAmount": total_amount,
+                    "updatedAt": datetime.utcnow()
+                }
+            }
+        )
+        
+        # Return the added/updated item
+        target_item = existing_item if existing_item else cart["items"][-1]
+        
+        # Get store information
+        store = await db.Store.find_one({"_id": product["storeId"]})
+        store_name = store["storeName"] if store else "Unknown Store"
+        
+        return CartItemResponse(
+            id=str(target_item["_id"]),
+            productId=str(target_item["productId"]),
+            productName=product["name"],
+            productPrice=product["price"],
+            productImage=product.get("image_url"),
+            quantity=target_item["quantity"],
+            totalPrice=product["price"] * target_item["quantity"],
+            storeId=str(product["storeId"]),
+            storeName=store_name,
+            createdAt=target_item["createdAt"],
+            updatedAt=target_item["updatedAt"]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error adding to cart: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.put("/cart/items/{item_id}", response_model=CartItemResponse)
+async def update_cart_item(
+    item_id: str,
+    item_data: CartItemUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Update cart item quantity"""
+    try:
+        # Find user's cart
+        cart = await db.Cart.find_one({"userId": current_user["_id"]})
+        
+        if not cart:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        
+        # Find the item in cart
+        item_found = None
+        for item in cart["items"]:
+            if str(item["_id"]) == item_id:
+                item_found = item
+                break
+        
+        if not item_found:
+            raise HTTPException(status_code=404, detail="Cart item not found")
+        
+        # Verify product still exists and has enough quantity
+        product = await db.Product.find_one({
+            "_id": item_found["productId"],
+            "status": "ACTIVE"
+        })
+        
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        if product["quantity"] < item_data.quantity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Insufficient quantity. Available: {product['quantity']}"
+            )
+        
+        # Update item quantity and refresh its price snapshot
+        item_found["quantity"] = item_data.quantity
+        item_found.update(cart_item_snapshot(product))
+        item_found["updatedAt"] = datetime.utcnow()
+        
+        # Recalculate totals
+        total_items = sum(item["quantity"] for item in cart["items"])
+        total_amount = await cart_total(db, cart["items"])
+        
+        # Update cart
+        await db.Cart.update_one(
+            {"_id": cart["_id"]},
+            {
+                "$set": {
+                    "items": cart["items"],
+                    "totalItems": total_items,
+                    "totalAmount": total_amount,
+                    "updatedAt": datetime.utcnow()
+                }
+            }
+        )
+        
+        # Get store information
+        store = await db.Store.find_one({"_id": product["storeId"]})
+        store_name = store["storeName"] if store else "Unknown Store"
+        
+        return CartItemResponse(
+            id=str(item_found["_id"]),
+            productId=str(item_found["productId"]),
+            productName=product["name"],
+            productPrice=product["price"],
+            productImage=product.get("image_url"),
+            quantity=item_found["quantity"],
+            totalPrice=product["price"] * item_found["quantity"],
+            storeId=str(product["storeId"]),
+            storeName=store_name,
+            createdAt=item_found["createdAt"],
+            updatedAt=item_found["updatedAt"]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error updating cart item: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.delete("/cart/items/{item_id}")
+async def remove_from_cart(
+    item_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Remove item from cart"""
+    try:
+        # Find user's cart
+        cart = await db.Cart.find_one({"userId": current_user["_id"]})
+        
+        if not cart:
+            raise HTTPException(status_code=404, detail="Cart not found")
+        
+        # Remove item from cart
+        cart["items"] = [item for item in cart["items"] if str(item["_id"]) != item_id]
+        
+        # Recalculate totals
+        total_items = sum(item["quantity"] for item in cart["items"])
+        total_amount = await cart_total(db, cart["items"])
+        
+        # Update cart
+        await db.Cart.update_one(
+            {"_id": cart["_id"]},
+            {
+                "$set": {
+                    "items": cart["items"],
+                    "totalItems": total_items,
+                    "totalAmount": total_amount,
+                    "updatedAt": datetime.utcnow()
+                }
+            }
+        )
+        
+        return {"message": "Item removed from cart"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error removing from cart: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.delete("/cart")
+async def clear_cart(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Clear entire cart"""
+    try:
+        # Clear cart items (no-op for users without a stored cart)
+        await db.Cart.update_one(
+            {"userId": current_user["_id"]},
+            {
+                "$set": {
+                    "items": [],
+                    "totalItems": 0,
+                    "totalAmount": 0.0,
+                    "updatedAt": datetime.utcnow()
+                }
+            }
+        )
+        
+        return {"message": "Cart cleared"}
+        
+    except Exception as e:
+        logger.error("Error clearing cart: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/cart/checkout", response_model=OrderResponse)
+async def checkout_cart(
+    checkout_data: CartCheckout,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Turn the stored cart into an order and empty the cart in the same transaction"""
+    try:
+        cart = await db.Cart.find_one({"userId": current_user["_id"]})
+        
+        if not cart or not cart["items"]:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cart is empty"
+            )
+        
+        # Items added before price snapshots existed need one bulk product read
+        missing = [item["productId"] for item in cart["items"] if "price" not in item]
+        products_by_id = {}
+        if missing:
+            products = await db.Product.find(
+                {"_id": {"$in": missing}, "status": "ACTIVE"},
+                projection={"_id": 1, "storeId": 1, "name": 1, "price": 1}
+            ).to_list(len(missing))
+            products_by_id = {p["_id"]: cart_item_snapshot(p) for p in products}
+        
+        lines = []
+        for item in cart["items"]:
+            snapshot = item if "price" in item else products_by_id.get(item["productId"])
+            if snapshot is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Product {item['productId']} not found"
+                )
+            lines.append({
+                "productId": item["productId"],
+                "productName": snapshot["productName"],
+                "storeId": snapshot["storeId"],
+                "quantity": item["quantity"],
+                "price": snapshot["price"]
+            })
+        
+        async def clear_checked_out_cart(session):
+            # Only clear the exact cart we priced; a concurrent edit aborts checkout
+            result = await db.Cart.update_one(
+                {"_id": cart["_id"], "updatedAt": cart["updatedAt"]},
+                {
+                    "$set": {
+                        "items": [],
+                        "totalItems": 0,
+                        "totalAmount": 0.0,
+                        "updatedAt": datetime.utcnow()
+                    }
+                },
+                session=session
+            )
+            if result.modified_count == 0:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Cart changed during checkout, please review it and try again"
+                )
+        
+        return await place_order(db, current_user, lines, checkout_data, extra_writes=clear_checked_out_cart)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error checking out cart: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,471 @@
+"""Public catalog: product listing, search and store pages (read-only)"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+import bisect
+import logging
+import os
+import random
+import re
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+from ..cache import CachedResult
+from ..db import get_db
+from ..timeouts import query_budget, query_timed_out, timeout_fallback
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["catalog"])
+
+
+# ===== Models =====
+class ProductResponse(BaseModel):
+    id: str
+    storeId: str
+    name: str
+    description: str
+    price: float
+    quantity: int
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+    createdAt: datetime
+    updatedAt: datetime
+    status: str
+    ratingCount: int = 0
+    ratingAverage: Optional[float] = None
+    ratingHistogram: dict[str, int] = {}
+
+
+# Review aggregates kept on each Product document by apply_rating_change
+RATING_FIELDS = {"ratingSum": 1, "ratingCount": 1, "ratingHistogram": 1}
+
+
+def product_response(product: dict) -> ProductResponse:
+    rating_count = product.get("ratingCount", 0)
+    histogram = product.get("ratingHistogram") or {}
+    return ProductResponse(
+        id=str(product["_id"]),
+        storeId=str(product["storeId"]),
+        name=product["name"],
+        description=product["description"],
+        price=product["price"],
+        quantity=product["quantity"],
+        image_url=product.get("image_url"),
+        category=product.get("category"),
+        createdAt=product["createdAt"],
+        updatedAt=product["updatedAt"],
+        status=product["status"],
+        ratingCount=rating_count,
+        ratingAverage=round(product.get("ratingSum", 0) / rating_count, 2) if rating_count else None,
+        ratingHistogram={str(star): histogram.get(str(star), 0) for star in range(1, 6)}
+    )
+
+
+# ===== Catalog Caches =====
+# The hottest catalog reads are served from shared results reloaded every
+# CATALOG_CACHE_TTL_SECONDS; warm_catalog_caches() fills them before a worker
+# reports ready
+CATALOG_CACHE_TTL_SECONDS = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", "60"))
+# Active products that featured requests sample from
+FEATURED_POOL_SIZE = int(os.getenv("FEATURED_POOL_SIZE", "200"))
+# Larger catalogs serve suggestions from Mongo instead of an in-memory index
+SUGGESTION_INDEX_MAX_PRODUCTS = int(os.getenv("SUGGESTION_INDEX_MAX_PRODUCTS", "50000"))
+SUGGESTION_INDEX_TTL_SECONDS = int(os.getenv("SUGGESTION_INDEX_TTL_SECONDS", "300"))
+# Unindexed $regex scans get less of the request's query budget
+REGEX_SEARCH_BUDGET_MS = float(os.getenv("REGEX_SEARCH_BUDGET_MS", "1000"))
+
+
+def featured_pool_pipeline() -> list[dict]:
+    """A random sample of active products from active stores"""
+    return [
+        {"$match": {"status": "ACTIVE"}},
+        {"$sample": {"size": FEATURED_POOL_SIZE}},
+        {"$lookup": {
+            "from": "Store",
+            "localField": "storeId",
+            "foreignField": "_id",
+            "as": "store"
+        }},
+        {"$unwind": "$store"},
+        {"$match": {"store.status": "ACTIVE"}},
+        {"$project": {
+            "_id": 1,
+            "storeId": 1,
+            "name": 1,
+            "description": 1,
+            "price": 1,
+            "quantity": 1,
+            "image_url": 1,
+            "category": 1,
+            "createdAt": 1,
+            "updatedAt": 1,
+            "status": 1,
+            **RATING_FIELDS
+        }}
+    ]
+
+
+async def load_featured_pool(db: AsyncIOMotorDatabase) -> list[dict]:
+    return await db.Product.aggregate(featured_pool_pipeline()).to_list(FEATURED_POOL_SIZE)
+
+
+async def load_category_counts(db: AsyncIOMotorDatabase) -> list[dict]:
+    pipeline = [
+        {"$match": {"status": "ACTIVE"}},
+        {
+            "$group": {
+                "_id": "$category",
+                "count": {"$sum": 1}
+            }
+        },
+        {"$sort": {"count": -1}}
+    ]
+    results = await db.Product.aggregate(pipeline).to_list(None)
+    return [
+        {
+            "category": result["_id"] or "uncategorized",
+            "count": result["count"]
+        }
+        for result in results
+    ]
+
+
+class SuggestionIndex:
+    """Distinct active product names, sorted for case-insensitive prefix lookups"""
+
+    def __init__(self, names: list[dict]):
+        # (lowercased name, name, category), one per distinct name
+        self.entries = sorted(
+            (s["_id"].lower(), s["_id"], s.get("category"))
+            for s in names if isinstance(s["_id"], str)
+        )
+        self.keys = [key for key, _, _ in self.entries]
+        self.by_category: dict[str, list[tuple[str, Optional[str]]]] = {}
+        for _, name, category in self.entries:
+            if category:
+                self.by_category.setdefault(category.lower(), []).append((name, category))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def lookup(self, prefix: str, limit: int) -> list[dict]:
+        """Names starting with prefix, then names whose category does"""
+        prefix = prefix.lower()
+        found: dict[str, Optional[str]] = {}
+        for key, name, category in self.entries[bisect.bisect_left(self.keys, prefix):]:
+            if len(found) >= limit or not key.startswith(prefix):
+                break
+            found[name] = category
+        for category_key, names in self.by_category.items():
+            if category_key.startswith(prefix):
+                for name, category in names:
+                    if len(found) >= limit:
+                        break
+                    found.setdefault(name, category)
+        return [{"text": name, "type": "product", "category": category} for name, category in found.items()]
+
+
+async def load_suggestion_index(db: AsyncIOMotorDatabase) -> Optional[SuggestionIndex]:
+    if await db.Product.count_documents({"status": "ACTIVE"}) > SUGGESTION_INDEX_MAX_PRODUCTS:
+        return None
+    names = await db.Product.aggregate([
+        {"$match": {"status": "ACTIVE"}},
+        {"$group": {"_id": "$name", "category": {"$first": "$category"}}}
+    ]).to_list(None)
+    return SuggestionIndex(names)
+
+
+featured_pool = CachedResult(CATALOG_CACHE_TTL_SECONDS, load_featured_pool, name="featured_pool")
+category_counts = CachedResult(CATALOG_CACHE_TTL_SECONDS, load_category_counts, name="category_counts")
+suggestion_index = CachedResult(SUGGESTION_INDEX_TTL_SECONDS, load_suggestion_index, name="suggestion_index")
+
+
+async def warm_catalog_caches(db: AsyncIOMotorDatabase) -> None:
+    await asyncio.gather(featured_pool.get(db), category_counts.get(db), suggestion_index.get(db))
+
+
+# ===== Catalog Endpoints =====
+@router.get("/products/featured", response_model=list[ProductResponse])
+async def get_featured_products(
+    limit: int = 8,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get featured products: a random pick from the cached featured pool"""
+    try:
+        pool = await featured_pool.get(db)
+        return [
+            product_response(product)
+            for product in random.sample(pool, max(0, min(limit, len(pool))))
+        ]
+    except Exception as e:
+        if query_timed_out(e):
+            timeout_fallback("featured_products", "empty", e)
+            return []
+        logger.error("Error getting featured products: %s", e)
+        return []
+
+
+@router.get("/public/products/{product_id}", response_model=ProductResponse)
+async def get_public_product(product_id: str, db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get product by ID - OPTIMIZED"""
+    try:
+        product = await db.Product.find_one(
+            {"_id": ObjectId(product_id), "status": "ACTIVE"},
+            projection={
+                "_id": 1, "storeId": 1, "name": 1, "description": 1,
+                "price": 1, "quantity": 1, "image_url": 1, "category": 1,
+                "createdAt": 1, "updatedAt": 1, "status": 1, **RATING_FIELDS
+            }
+        )
+        
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        return product_response(product)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting product: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/products/search", response_model=list[ProductResponse])
+async def search_products(
+    q: str,
+    limit: int = 20,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Search products - HEAVILY OPTIMIZED using text index"""
+    try:
+        if len(q.strip()) < 2:
+            return []
+        
+        # Use MongoDB text search (requires text index)
+        pipeline = [
+            {
+                "$match": {
+                    "$text": {"$search": q},
+                    "status": "ACTIVE"
+                }
+            },
+            {
+                "$addFields": {
+                    "score": {"$meta": "textScore"}
+                }
+            },
+            {
+                "$lookup": {
+                    "from": "Store",
+                    "localField": "storeId",
+                    "foreignField": "_id",
+                    "as": "store"
+                }
+            },
+            {"$unwind": "$store"},
+            {"$match": {"store.status": "ACTIVE"}},
+            {"$sort": {"score": -1}},
+            {"$limit": limit},
+            {
+                "$project": {
+                    "_id": 1, "storeId": 1, "name": 1, "description": 1,
+                    "price": 1, "quantity": 1, "image_url": 1, "category": 1,
+                    "createdAt": 1, "updatedAt": 1, "status": 1, **RATING_FIELDS
+                }
+            }
+        ]
+
+        
+
+        products = await db.Product.aggregate(pipeline).to_list(limit)
+
+        
+
+        return [
+            product_response(p)
+            for p in products
+        ]
+    except Exception as e:
+        if query_timed_out(e):
+            # The regex fallback would only be slower
+            timeout_fallback("product_search", "timeout", e)
+            raise HTTPException(status_code=504, detail="Search took too long, try a more specific query")
+        logger.error("Error searching products: %s", e)
+        # Fallback to regex search if text index fails
+        try:
+            # Matched literally, so a search string cannot be a pathological pattern
+            pattern = re.escape(q)
+            pipeline = [
+                {
+                    "$match": {
+                        "status": "ACTIVE",
+                        "$or": [
+                            {"name": {"$regex": pattern, "$options": "i"}},
+                            {"description": {"$regex": pattern, "$options": "i"}},
+                            {"category": {"$regex": pattern, "$options": "i"}}
+                        ]
+                    }
+                },
+                {
+                    "$lookup": {
+                        "from": "Store",
+                        "localField": "storeId",
+                        "foreignField": "_id",
+                        "as": "store"
+                    }
+                },
+                {"$unwind": "$store"},
+                {"$match": {"store.status": "ACTIVE"}},
+                {"$limit": limit}
+            ]
+
+            
+
+            with query_budget(REGEX_SEARCH_BUDGET_MS):
+                products = await db.Product.aggregate(pipeline).to_list(limit)
+
+            
+
+            return [
+                product_response(p)
+                for p in products
+            ]
+        except Exception as fallback_error:
+            if query_timed_out(fallback_error):
+                timeout_fallback("product_search_regex", "timeout", fallback_error)
+                raise HTTPException(status_code=504, detail="Search took too long, try a more specific query")
+            logger.error("Fallback search also failed: %s", fallback_error)
+            return []
+
+
+@router.get("/products/search/suggestions")
+async def get_search_suggestions(
+    q: str,
+    limit: int = 5,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get search suggestions, from the in-memory index when the catalog fits in it"""
+    try:
+        if len(q.strip()) < 2:
+            return []
+        
+        index = await suggestion_index.get(db)
+        if index is not None:
+            return index.lookup(q, limit)
+        
+        # Simplified query with limit
+        prefix = f"^{re.escape(q)}"
+        pipeline = [
+            {
+                "$match": {
+                "status": "ACTIVE",
+                "$or": [
+                        {"name": {"$regex": prefix, "$options": "i"}},
+                        {"category": {"$regex": prefix, "$options": "i"}}
+                    ]
+                }
+            },
+            {
+                "$group": {
+                "_id": "$name",
+                "category": {"$first": "$category"}
+                }
+            },
+            {"$limit": limit}
+        ]
+        
+        with query_budget(REGEX_SEARCH_BUDGET_MS):
+            suggestions = await db.Product.aggregate(pipeline).to_list(limit)
+        
+        return [
+            {
+                "text": s["_id"],
+                "type": "product",
+                "category": s.get("category")
+            }
+            for s in suggestions
+        ]
+        
+    except Exception as e:
+        if query_timed_out(e):
+            timeout_fallback("search_suggestions", "empty", e)
+            return []
+        logger.error("Error getting suggestions: %s", e)
+        return []
+
+
+@router.get("/products/category-counts")
+async def get_category_counts(db: AsyncIOMotorDatabase = Depends(get_db)):
+    """Get product counts by category (cached for CATALOG_CACHE_TTL_SECONDS)"""
+    try:
+        return await category_counts.get(db)
+    except Exception as e:
+        if query_timed_out(e):
+            # Cold cache: nothing stale to serve
+            timeout_fallback("category_counts", "empty", e)
+            return []
+        logger.error("Error getting category counts: %s", e)
+        return []
+
+
+@router.get("/products/{product_id}", response_model=ProductResponse)
+async def get_product_public(
+    product_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a specific product by ID - Public endpoint"""
+    try:
+        # Find product (public access)
+        product = await db.Product.find_one({
+            "_id": ObjectId(product_id),
+            "status": "ACTIVE"
+        })
+        
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        
+        return product_response(product)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+
+
+# ===== Public Store Endpoints =====
+@router.get("/stores/{store_id}")
+async def get_public_store(
+    store_id: str,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get public store information by ID"""
+    try:
+        store = await db.Store.find_one({
+            "_id": ObjectId(store_id),
+            "status": "ACTIVE"
+        })
+        
+        if not store:
+            raise HTTPException(status_code=404, detail="Store not found")
+        
+        return {
+            "id": str(store["_id"]),
+            "storeName": store["storeName"],
+            "storeDescription": store.get("storeDescription"),
+            "phoneNumber": store.get("phoneNumber"),
+            "buMail": store.get("buMail"),
+            "registerDate": store["registerDate"],
+            "status": store["status"]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting store: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
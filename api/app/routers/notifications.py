@@ -0,0 +1,272 @@
+"""The current user's notifications, and their live SSE/WebSocket streams"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+import json
+import logging
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+from ..db import get_db
+from ..metrics import is_timeout
+from ..notifications import NotificationResponse, decrement_unread_count, get_unread_notification_count
+from ..pubsub import notification_broker
+from ..security import authenticate_token, get_current_user
+from ..timeouts import PARTIAL_RESULT_HEADER, timeout_fallback
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["notifications"])
+
+
+# ===== Notification Models =====
+class NotificationCreate(BaseModel):
+    type: str  # "review", "order", "message"
+    title: str
+    message: str
+    data: Optional[dict] = None
+
+
+class NotificationIds(BaseModel):
+    ids: list[str]
+
+
+# ===== Notification Endpoints =====
+NOTIFICATION_BATCH_LIMIT = 500
+
+@router.get("/notifications", response_model=list[NotificationResponse])
+async def get_user_notifications(
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get all notifications for current user
+
+    If the query runs out of time, the newest notifications read so far are
+    returned with an X-Partial-Result header.
+    """
+    try:
+        notifications = []
+        try:
+            async for notification in db.Notification.find(
+                {"userId": current_user["_id"]}
+            ).sort("createdAt", -1):
+                notifications.append(notification)
+        except Exception as e:
+            if not (notifications and is_timeout(e)):
+                raise
+            timeout_fallback("notifications", "partial_page", e)
+            response.headers[PARTIAL_RESULT_HEADER] = "timeout"
+        
+        return [
+            NotificationResponse(
+                id=str(notification["_id"]),
+                userId=str(notification["userId"]),
+                type=notification["type"],
+                title=notification["title"],
+                message=notification["message"],
+                data=notification.get("data"),
+                isRead=notification["isRead"],
+                createdAt=notification["createdAt"]
+            )
+            for notification in notifications
+        ]
+    except Exception as e:
+        logger.error("Error getting notifications: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.put("/notifications/{notification_id}/read")
+async def mark_notification_read(
+    notification_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Mark notification as read"""
+    try:
+        result = await db.Notification.update_one(
+            {"_id": ObjectId(notification_id), "userId": current_user["_id"], "isRead": False},
+            {"$set": {"isRead": True, "readAt": datetime.utcnow()}}
+        )
+        
+        if result.matched_count == 0:
+            # Either already read (a no-op) or not this user's notification
+            exists = await db.Notification.count_documents(
+                {"_id": ObjectId(notification_id), "userId": current_user["_id"]}, limit=1
+            )
+            if not exists:
+                raise HTTPException(status_code=404, detail="Notification not found")
+            return {"message": "Notification marked as read"}
+        
+        # Only a real unread -> read flip moves the counter
+        count = await decrement_unread_count(db, current_user["_id"])
+        await notification_broker.publish(
+            str(current_user["_id"]), "unread-count", {"unreadCount": count}
+        )
+        
+        return {"message": "Notification marked as read"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error marking notification as read: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+async def mark_notifications_read(db: AsyncIOMotorDatabase, user_id: ObjectId, extra_filter: dict) -> int:
+    """Mark matching unread notifications as read in one update_many; returns how many flipped"""
+    result = await db.Notification.update_many(
+        {"userId": user_id, "isRead": False, **extra_filter},
+        {"$set": {"isRead": True, "readAt": datetime.utcnow()}}
+    )
+    if result.modified_count:
+        count = await decrement_unread_count(db, user_id, result.modified_count)
+        await notification_broker.publish(str(user_id), "unread-count", {"unreadCount": count})
+    return result.modified_count
+
+
+def parse_notification_ids(payload: NotificationIds) -> list[ObjectId]:
+    if not payload.ids:
+        raise HTTPException(status_code=400, detail="No notification ids given")
+    if len(payload.ids) > NOTIFICATION_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {NOTIFICATION_BATCH_LIMIT} notifications per request"
+        )
+    return [ObjectId(notification_id) for notification_id in payload.ids]
+
+
+@router.post("/notifications/read-all")
+async def mark_all_notifications_read(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Mark every unread notification as read"""
+    try:
+        updated = await mark_notifications_read(db, current_user["_id"], {})
+        return {"message": "All notifications marked as read", "updated": updated}
+    except Exception as e:
+        logger.error("Error marking all notifications as read: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/notifications/read")
+async def mark_notifications_read_batch(
+    payload: NotificationIds,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Mark a list of notifications as read"""
+    try:
+        ids = parse_notification_ids(payload)
+        updated = await mark_notifications_read(db, current_user["_id"], {"_id": {"$in": ids}})
+        return {"message": "Notifications marked as read", "updated": updated}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error marking notifications as read: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/notifications/delete")
+async def delete_notifications(
+    payload: NotificationIds,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Delete a list of notifications"""
+    try:
+        ids = parse_notification_ids(payload)
+        # Flip unread ones first so the unread counter stays exact
+        await mark_notifications_read(db, current_user["_id"], {"_id": {"$in": ids}})
+        result = await db.Notification.delete_many(
+            {"_id": {"$in": ids}, "userId": current_user["_id"]}
+        )
+        return {"message": "Notifications deleted", "deleted": result.deleted_count}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error deleting notifications: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.get("/notifications/unread-count")
+async def get_unread_count(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get count of unread notifications (kept on the User document)"""
+    try:
+        return {"unreadCount": await get_unread_notification_count(db, current_user)}
+    except Exception as e:
+        logger.error("Error getting unread count: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# ===== Notification Stream =====
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+async def notification_events(user: dict, db: AsyncIOMotorDatabase):
+    """Yield the current unread count, then every event published for the user"""
+    user_id = str(user["_id"])
+    queue = notification_broker.subscribe(user_id)
+    try:
+        count = await get_unread_notification_count(db, user)
+        yield {"event": "unread-count", "data": {"unreadCount": count}}
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None  # heartbeat
+    finally:
+        notification_broker.unsubscribe(user_id, queue)
+
+
+@router.get("/notifications/stream")
+async def stream_notifications(
+    token: str,
+    request: Request,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Server-Sent Events stream of new notifications and unread-count changes
+
+    EventSource cannot send headers, so the bearer token comes in `?token=`.
+    """
+    current_user = await authenticate_token(token, db)
+    
+    async def event_stream():
+        async for message in notification_events(current_user, db):
+            if await request.is_disconnected():
+                break
+            if message is None:
+                yield ": ping\n\n"
+            else:
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/notifications/ws")
+async def notifications_websocket(websocket: WebSocket, token: str):
+    """WebSocket variant of /notifications/stream (same events as JSON messages)"""
+    db = await get_db()
+    try:
+        current_user = await authenticate_token(token, db)
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    
+    await websocket.accept()
+    try:
+        async for message in notification_events(current_user, db):
+            await websocket.send_json(message if message is not None else {"event": "ping"})
+    except WebSocketDisconnect:
+        pass
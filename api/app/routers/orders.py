@@ -0,0 +1,333 @@
+"""Orders: placement (shared with cart checkout) and cancellation"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+from ..db import get_db, run_transaction
+from ..inventory import (
+    InsufficientStockError,
+    cancel_order,
+    confirm_order,
+    confirm_stock,
+    release_stock,
+    reservation_expiry,
+    reserve_stock,
+)
+from ..notifications import create_notifications
+from ..security import get_current_user
+from ..timeouts import with_own_budget
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["orders"])
+
+
+# ===== Order Models =====
+class OrderItem(BaseModel):
+    productId: str
+    quantity: int
+    price: float
+
+
+class OrderCreate(BaseModel):
+    items: list[OrderItem]
+    shippingAddress: str
+    phoneNumber: str
+    notes: Optional[str] = None
+
+
+class CartCheckout(BaseModel):
+    shippingAddress: str
+    phoneNumber: str
+    notes: Optional[str] = None
+
+
+class SubOrderResponse(BaseModel):
+    id: str
+    storeId: str
+    items: list[dict]
+    subTotal: float
+    status: str
+
+
+class OrderResponse(BaseModel):
+    id: str
+    userId: str
+    items: list[dict]
+    subOrders: list[SubOrderResponse]
+    totalAmount: float
+    status: str
+    shippingAddress: str
+    phoneNumber: str
+    notes: Optional[str] = None
+    createdAt: datetime
+    updatedAt: datetime
+
+
+# ===== Order Helpers =====
+def to_cents(amount: float) -> int:
+    """Convert a baht amount to integer satang (schema stores money in cents)"""
+    return int(round(amount * 100))
+
+
+async def place_order(
+    db: AsyncIOMotorDatabase,
+    current_user: dict,
+    lines: list[dict],
+    shipping: OrderCreate | CartCheckout,
+    extra_writes=None
+) -> OrderResponse:
+    """Reserve stock and write one Order with a SubOrder per store
+
+    `lines` are already-priced items: productId, productName, storeId (ObjectIds),
+    quantity and price. `extra_writes(session)` runs inside the order transaction.
+    """
+    requested = {line["productId"]: line["quantity"] for line in lines}
+    
+    # Group priced items by store
+    total_amount = 0.0
+    validated_items = []
+    items_by_store: dict[ObjectId, list[dict]] = {}
+    
+    for line in lines:
+        item_total = line["price"] * line["quantity"]
+        total_amount += item_total
+        
+        validated_item = {
+            "productId": str(line["productId"]),
+            "productName": line["productName"],
+            "storeId": str(line["storeId"]),
+            "quantity": line["quantity"],
+            "price": line["price"],
+            "total": item_total
+        }
+        validated_items.append(validated_item)
+        items_by_store.setdefault(line["storeId"], []).append(validated_item)
+    
+    # Reserve stock for every item before writing the order
+    order_id = ObjectId()
+    try:
+        await reserve_stock(db, order_id, requested)
+    except InsufficientStockError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Some items are no longer available in the requested quantity"
+        )
+    
+    # Build Order, SubOrder and OrderItem documents with client-side ids
+    now = datetime.utcnow()
+    order_doc = {
+        "_id": order_id,
+        "userId": current_user["_id"],
+        "buyerId": current_user["_id"],
+        "items": validated_items,
+        "totalAmount": total_amount,
+        "totalPrice": to_cents(total_amount),
+        "status": "PENDING",
+        "shippingAddress": shipping.shippingAddress,
+        "phoneNumber": shipping.phoneNumber,
+        "notes": shipping.notes,
+        "reservationExpiresAt": reservation_expiry(now),
+        "orderDate": now,
+        "createdAt": now,
+        "updatedAt": now
+    }
+    
+    sub_order_docs = []
+    order_item_docs = []
+    for store_id, store_items in items_by_store.items():
+        sub_order_doc = {
+            "_id": ObjectId(),
+            "orderId": order_doc["_id"],
+            "storeId": store_id,
+            "subTotal": sum(to_cents(i["total"]) for i in store_items),
+            "status": "PENDING"
+        }
+        sub_order_docs.append(sub_order_doc)
+        order_item_docs.extend(
+            {
+                "subOrderId": sub_order_doc["_id"],
+                "productId": ObjectId(i["productId"]),
+                "quantity": i["quantity"],
+                "price": to_cents(i["price"])
+            }
+            for i in store_items
+        )
+    
+    async def write_order(session):
+        await db.Order.insert_one(order_doc, session=session)
+        await db.SubOrder.insert_many(sub_order_docs, session=session)
+        await db.OrderItem.insert_many(order_item_docs, session=session)
+        if extra_writes is not None:
+            await extra_writes(session)
+    
+    try:
+        await run_transaction(write_order)
+    except Exception:
+        # Compensation must finish even when the order ran out of query time
+        await with_own_budget(release_stock(db, order_id, requested))
+        raise
+    
+    # Notify every store owner (queued; owners are resolved by the outbox writer)
+    await create_notifications(db, [
+        {
+            "store_id": store_id,
+            "notification_type": "order",
+            "title": "มีคำสั่งซื้อใหม่",
+            "message": (
+                f"มีคำสั่งซื้อใหม่จาก {current_user['username']} "
+                f"มูลค่า {sum(i['total'] for i in store_items):,.2f} บาท"
+            ),
+            "data": {"orderId": str(order_doc["_id"]), "storeId": str(store_id)}
+        }
+        for store_id, store_items in items_by_store.items()
+    ])
+    # The order is committed; markers left behind are dropped by the reservation sweeper
+    try:
+        await with_own_budget(confirm_stock(db, order_id, list(requested)))
+    except Exception as e:
+        logger.error("Error confirming stock for order %s: %s", order_id, e)
+    
+    return OrderResponse(
+        id=str(order_doc["_id"]),
+        userId=str(order_doc["userId"]),
+        items=order_doc["items"],
+        subOrders=[
+            SubOrderResponse(
+                id=str(sub_order["_id"]),
+                storeId=str(sub_order["storeId"]),
+                items=items_by_store[sub_order["storeId"]],
+                subTotal=sub_order["subTotal"] / 100,
+                status=sub_order["status"]
+            )
+            for sub_order in sub_order_docs
+        ],
+        totalAmount=order_doc["totalAmount"],
+        status=order_doc["status"],
+        shippingAddress=order_doc["shippingAddress"],
+        phoneNumber=order_doc["phoneNumber"],
+        notes=order_doc["notes"],
+        createdAt=order_doc["createdAt"],
+        updatedAt=order_doc["updatedAt"]
+    )
+
+
+# ===== Order Endpoints =====
+@router.post("/orders", response_model=OrderResponse)
+async def create_order(
+    order_data: OrderCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Create a new order, split into one SubOrder per store"""
+    try:
+        # Validate request shape before any I/O
+        if not order_data.items:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Order must contain at least one item"
+            )
+        
+        requested: dict[ObjectId, int] = {}
+        for item in order_data.items:
+            if item.quantity <= 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid quantity for product {item.productId}"
+                )
+            product_oid = ObjectId(item.productId)
+            requested[product_oid] = requested.get(product_oid, 0) + item.quantity
+        
+        # Validate all products in a single round trip
+        products = await db.Product.find(
+            {"_id": {"$in": list(requested)}, "status": "ACTIVE"},
+            projection={"_id": 1, "storeId": 1, "name": 1, "price": 1, "quantity": 1}
+        ).to_list(len(requested))
+        products_by_id = {p["_id"]: p for p in products}
+        
+        lines = []
+        for product_oid, quantity in requested.items():
+            product = products_by_id.get(product_oid)
+            if not product:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Product {product_oid} not found"
+                )
+            
+            if product["quantity"] < quantity:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Insufficient quantity for product {product['name']}"
+                )
+            
+            lines.append({
+                "productId": product_oid,
+                "productName": product["name"],
+                "storeId": product["storeId"],
+                "quantity": quantity,
+                "price": product["price"]
+            })
+        
+        return await place_order(db, current_user, lines, order_data)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating order: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/orders/{order_id}/cancel")
+async def cancel_my_order(
+    order_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Cancel a pending order and release its reserved stock"""
+    try:
+        cancelled = await cancel_order(
+            db,
+            ObjectId(order_id),
+            reason="CANCELLED_BY_BUYER",
+            extra_filter={"userId": current_user["_id"]}
+        )
+        
+        if not cancelled:
+            raise HTTPException(status_code=404, detail="Pending order not found")
+        
+        return {"message": "Order cancelled"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error cancelling order: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/orders/{order_id}/confirm")
+async def confirm_my_order(
+    order_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Confirm payment for a pending order; confirmed orders keep their stock"""
+    try:
+        confirmed = await confirm_order(
+            db,
+            ObjectId(order_id),
+            extra_filter={"userId": current_user["_id"]}
+        )
+        
+        if not confirmed:
+            raise HTTPException(status_code=404, detail="Pending order not found")
+        
+        return {"message": "Order confirmed"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error confirming order: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
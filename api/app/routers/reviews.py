@@ -0,0 +1,363 @@
+"""Product reviews and the rating aggregates kept on each product"""
+from datetime import datetime
+from typing import Optional
+import asyncio
+import contextvars
+import logging
+import os
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..cache import TTLCache
+from ..db import get_db
+from ..notifications import create_notifications
+from ..security import get_current_user
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["reviews"])
+
+
+# ===== Review Models =====
+class ReviewCreate(BaseModel):
+    rating: int
+    comment: str
+
+
+class ReviewResponse(BaseModel):
+    id: str
+    productId: str
+    userId: str
+    username: str
+    rating: int
+    comment: str
+    createdAt: datetime
+    updatedAt: datetime
+
+
+# ===== Review Aggregates =====
+def rating_change(old_rating: Optional[int], new_rating: Optional[int]) -> dict:
+    """$inc that moves a product's aggregates from old_rating to new_rating
+
+    old_rating is None for a new review, new_rating is None for a deleted one.
+    """
+    inc = {}
+    if old_rating is not None:
+        inc["ratingSum"] = -old_rating
+        inc["ratingCount"] = -1
+        inc[f"ratingHistogram.{old_rating}"] = -1
+    if new_rating is not None:
+        inc["ratingSum"] = inc.get("ratingSum", 0) + new_rating
+        inc["ratingCount"] = inc.get("ratingCount", 0) + 1
+        key = f"ratingHistogram.{new_rating}"
+        inc[key] = inc.get(key, 0) + 1
+    # Unchanged fields would make a no-op $inc of 0
+    return {field: amount for field, amount in inc.items() if amount}
+
+
+async def apply_rating_change(
+    db: AsyncIOMotorDatabase,
+    product_id: ObjectId,
+    old_rating: Optional[int],
+    new_rating: Optional[int],
+    session=None
+) -> None:
+    inc = rating_change(old_rating, new_rating)
+    if inc:
+        await db.Product.update_one({"_id": product_id}, {"$inc": inc}, session=session)
+
+
+# Rating $incs still running off the request path
+pending_rating_changes: set[asyncio.Task] = set()
+# Longest shutdown waits for them before the Mongo client is closed
+RATING_DRAIN_TIMEOUT_SECONDS = float(os.getenv("RATING_DRAIN_TIMEOUT_SECONDS", "10"))
+
+
+def schedule_rating_change(
+    db: AsyncIOMotorDatabase,
+    product_id: ObjectId,
+    old_rating: Optional[int],
+    new_rating: Optional[int]
+) -> None:
+    """Apply a rating change after the response; on failure rebuild that product's aggregates"""
+    async def run() -> None:
+        try:
+            await apply_rating_change(db, product_id, old_rating, new_rating)
+        except Exception as e:
+            logger.error("Error updating review aggregates for %s, rebuilding: %s", product_id, e)
+            try:
+                await rebuild_rating_aggregates(db, [product_id])
+            except Exception as rebuild_error:
+                logger.error("Error rebuilding review aggregates for %s: %s", product_id, rebuild_error)
+    
+    # A fresh context: the task must not inherit the request's query deadline
+    # (pymongo.timeout), budget or query accounting, which end with the response
+    task = contextvars.Context().run(asyncio.create_task, run())
+    pending_rating_changes.add(task)
+    task.add_done_callback(pending_rating_changes.discard)
+
+
+async def drain_rating_changes(timeout: float = RATING_DRAIN_TIMEOUT_SECONDS) -> None:
+    """Wait for scheduled rating changes at shutdown; reviews still pending after timeout drift until a rebuild"""
+    if not pending_rating_changes:
+        return
+    _, still_pending = await asyncio.wait(set(pending_rating_changes), timeout=timeout)
+    if still_pending:
+        logger.error(
+            "%d review aggregate updates did not finish before shutdown; "
+            "run `python -m scripts.rebuild_rating_aggregates`", len(still_pending)
+        )
+
+
+async def rebuild_rating_aggregates(
+    db: AsyncIOMotorDatabase,
+    product_ids: Optional[list[ObjectId]] = None,
+    batch_size: int = 1000
+) -> int:
+    """Recompute review aggregates from the Review collection to repair drift
+
+    Pass product_ids to repair specific products; omit to rebuild every product.
+    Returns the number of products that have reviews. The grouped results are
+    streamed and written batch_size products at a time; a second pass zeroes
+    products in scope that have no reviews left. A rating $inc landing between
+    a product's recount and its write is overwritten.
+    """
+    pipeline = [{"$match": {"productId": {"$in": product_ids}}}] if product_ids is not None else []
+    pipeline.append({"$group": {
+        "_id": "$productId",
+        "ratingSum": {"$sum": "$rating"},
+        "ratingCount": {"$sum": 1},
+        **{
+            f"star{star}": {"$sum": {"$cond": [{"$eq": ["$rating", star]}, 1, 0]}}
+            for star in range(1, 6)
+        }
+    }})
+    
+    reviewed = 0
+    ops = []
+    async for r in db.Review.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+        ops.append(UpdateOne({"_id": r["_id"]}, {"$set": {
+            "ratingSum": r["ratingSum"],
+            "ratingCount": r["ratingCount"],
+            "ratingHistogram": {str(star): r[f"star{star}"] for star in range(1, 6)}
+        }}))
+        if len(ops) >= batch_size:
+            await db.Product.bulk_write(ops, ordered=False)
+            reviewed += len(ops)
+            ops = []
+    if ops:
+        await db.Product.bulk_write(ops, ordered=False)
+        reviewed += len(ops)
+    
+    # Second pass: products in scope that still carry aggregates but have no reviews
+    scope = {"_id": {"$in": product_ids}} if product_ids is not None else {"ratingCount": {"$ne": 0}}
+    batch = []
+    async for product in db.Product.find(scope, projection={"_id": 1}).batch_size(batch_size):
+        batch.append(product["_id"])
+        if len(batch) >= batch_size:
+            await _zero_unreviewed(db, batch)
+            batch = []
+    if batch:
+        await _zero_unreviewed(db, batch)
+    return reviewed
+
+
+async def _zero_unreviewed(db: AsyncIOMotorDatabase, product_ids: list[ObjectId]) -> None:
+    reviewed = set(await db.Review.distinct("productId", {"productId": {"$in": product_ids}}))
+    unreviewed = [product_id for product_id in product_ids if product_id not in reviewed]
+    if unreviewed:
+        await db.Product.update_many(
+            {"_id": {"$in": unreviewed}},
+            {"$set": {"ratingSum": 0, "ratingCount": 0, "ratingHistogram": {}}}
+        )
+
+
+# ===== Review Endpoints =====
+# Product id -> {"_id", "storeId", "name"} for products that accept reviews
+PRODUCT_CACHE_TTL_SECONDS = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "60"))
+reviewable_products = TTLCache(ttl=PRODUCT_CACHE_TTL_SECONDS, name="reviewable_products")
+
+
+async def get_reviewable_product(db: AsyncIOMotorDatabase, product_id: ObjectId) -> Optional[dict]:
+    """Active product with its store, from the per-worker cache when possible"""
+    product = reviewable_products.get(product_id)
+    if product is None:
+        product = await db.Product.find_one(
+            {"_id": product_id, "status": "ACTIVE"},
+            projection={"_id": 1, "storeId": 1, "name": 1}
+        )
+        if product is not None:
+            reviewable_products.set(product_id, product)
+    return product
+
+
+
+REVIEW_PAGE_SIZE = 20
+REVIEW_PAGE_MAX = 100
+# Response header carrying the cursor for the next (older) page of reviews
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def review_cursor(review: dict) -> str:
+    return f"{review['createdAt'].isoformat()}_{review['_id']}"
+
+
+def parse_review_cursor(cursor: str) -> dict:
+    """Keyset filter for reviews older than the cursor (createdAt desc, _id desc)"""
+    try:
+        created_at, review_id = cursor.rsplit("_", 1)
+        created_at = datetime.fromisoformat(created_at)
+        review_id = ObjectId(review_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"$or": [
+        {"createdAt": {"$lt": created_at}},
+        {"createdAt": created_at, "_id": {"$lt": review_id}}
+    ]}
+
+
+@router.get("/products/{product_id}/reviews", response_model=list[ReviewResponse])
+async def get_product_reviews(
+    product_id: str,
+    response: Response,
+    limit: int = REVIEW_PAGE_SIZE,
+    before: Optional[str] = None,
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a page of reviews for a product, newest first
+    
+    Pass the X-Next-Cursor header of one page as `before` to get the next.
+    """
+    try:
+        limit = max(1, min(limit, REVIEW_PAGE_MAX))
+        cursor_filter = parse_review_cursor(before) if before else {}
+        
+        # Existence check and the review page in one round trip; the page is
+        # read from the (productId, createdAt, _id) index and stops at limit + 1
+        products = await db.Product.aggregate([
+            {"$match": {"_id": ObjectId(product_id), "status": "ACTIVE"}},
+            {"$project": {"_id": 1}},
+            {"$lookup": {
+                "from": "Review",
+                "localField": "_id",
+                "foreignField": "productId",
+                "pipeline": [
+                    {"$match": cursor_filter},
+                    {"$sort": {"createdAt": -1, "_id": -1}},
+                    {"$limit": limit + 1}
+                ],
+                "as": "reviews"
+            }}
+        ]).to_list(1)
+        if not products:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        reviews = products[0]["reviews"]
+        if len(reviews) > limit:
+            reviews = reviews[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = review_cursor(reviews[-1])
+        
+        # Reviews written before usernames were snapshotted: one lookup per page
+        legacy_ids = list({r["userId"] for r in reviews if "username" not in r})
+        if legacy_ids:
+            users = await db.User.find({"_id": {"$in": legacy_ids}}, {"username": 1}).to_list(None)
+            usernames = {u["_id"]: u["username"] for u in users}
+            for review in reviews:
+                review.setdefault("username", usernames.get(review["userId"], ""))
+        
+        return [
+            ReviewResponse(
+                id=str(review["_id"]),
+                productId=str(review["productId"]),
+                userId=str(review["userId"]),
+                username=review["username"],
+                rating=review["rating"],
+                comment=review["comment"],
+                createdAt=review["createdAt"],
+                updatedAt=review["updatedAt"]
+            )
+            for review in reviews
+        ]
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting product reviews: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@router.post("/products/{product_id}/reviews", response_model=ReviewResponse)
+async def create_product_review(
+    product_id: str,
+    review_data: ReviewCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Create a new review for a product"""
+    try:
+        # Validate before any I/O
+        if review_data.rating < 1 or review_data.rating > 5:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Rating must be between 1 and 5"
+            )
+        if not ObjectId.is_valid(product_id):
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        product = await get_reviewable_product(db, ObjectId(product_id))
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        now = datetime.utcnow()
+        review_doc = {
+            "productId": product["_id"],
+            "userId": current_user["_id"],
+            # Snapshot so listing reviews never joins User
+            "username": current_user["username"],
+            "rating": review_data.rating,
+            "comment": review_data.comment,
+            "createdAt": now,
+            "updatedAt": now
+        }
+        
+        # The unique (productId, userId) index rejects a second review, including
+        # concurrent double-submits, so no duplicate check is needed beforehand
+        try:
+            result = await db.Review.insert_one(review_doc)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You have already reviewed this product"
+            )
+        review_doc["_id"] = result.inserted_id
+        schedule_rating_change(db, product["_id"], None, review_doc["rating"])
+        
+        # Notify the store owner (owner is resolved by the outbox writer)
+        await create_notifications(db, [{
+            "store_id": product["storeId"],
+            "notification_type": "review",
+            "title": "มีรีวิวใหม่",
+            "message": f"มีรีวิวใหม่สำหรับสินค้า {product['name']} จาก {current_user['username']}",
+            "data": {"productId": product_id, "reviewId": str(review_doc["_id"])}
+        }])
+        
+        return ReviewResponse(
+            id=str(review_doc["_id"]),
+            productId=str(review_doc["productId"]),
+            userId=str(review_doc["userId"]),
+            username=review_doc["username"],
+            rating=review_doc["rating"],
+            comment=review_doc["comment"],
+            createdAt=review_doc["createdAt"],
+            updatedAt=review_doc["updatedAt"]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error creating review: %s", e)
+        raise HTTPException(status_code=500, detail="Internal server error")
@@ -0,0 +1,356 @@
+"""Seller-side store and product management"""
+from datetime import datetime
+from typing import Optional
+import logging
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo import ReturnDocument
+
+from ..db import get_db
+from ..security import get_current_user
+from .catalog import ProductResponse, featured_pool, product_response
+from .reviews import reviewable_products
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["store"])
+
+
+# ===== Store Models =====
+class StoreCreate(BaseModel):
+    storeName: str
+    storeDescription: Optional[str] = None
+    phoneNumber: Optional[str] = None
+    buMail: Optional[str] = None
+
+
+class StoreUpdate(BaseModel):
+    storeName: str
+    storeDescription: Optional[str] = None
+
+
+class StoreResponse(BaseModel):
+    id: str
+    ownerId: Optional[str] = None
+    storeName: str
+    storeDescription: Optional[str] = None
+    phoneNumber: Optional[str] = None
+    buMail: Optional[str] = None
+    registerDate: datetime
+    status: str
+
+
+def store_response(store: dict) -> StoreResponse:
+    return StoreResponse(
+        id=str(store["_id"]),
+        ownerId=str(store["ownerId"]),
+        storeName=store["storeName"],
+        storeDescription=store.get("storeDescription"),
+        phoneNumber=store.get("phoneNumber"),
+        buMail=store.get("buMail"),
+        registerDate=store["registerDate"],
+        status=store["status"]
+    )
+
+
+# ===== Store Endpoints =====
+# /stores/my-store is kept as an alias of /users/me/store for older clients
+@router.get("/users/me/store", response_model=StoreResponse)
+@router.get("/stores/my-store", response_model=StoreResponse)
+async def get_my_store(db: AsyncIOMotorDatabase = Depends(get_db), current_user=Depends(get_current_user)):
+    """Get user's store if exists"""
+    store = await db.Store.find_one({"ownerId": current_user["_id"]})
+    
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    return store_response(store)
+
+
+@router.post("/users/me/store", response_model=StoreResponse)
+@router.post("/stores/my-store", response_model=StoreResponse)
+async def create_my_store(store_data: StoreCreate, db: AsyncIOMotorDatabase = Depends(get_db), current_user=Depends(get_current_user)):
+    """Create a new store for the current user"""
+    user_id = current_user["_id"]
+    
+    # Check if user already has a store
+    existing_store = await db.Store.find_one({"ownerId": user_id})
+    if existing_store:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User already has a store"
+        )
+    
+    # Create new store
+    store_doc = {
+        "ownerId": user_id,
+        "storeName": store_data.storeName,
+        "storeDescription": store_data.storeDescription,
+        "phoneNumber": store_data.phoneNumber,
+        "buMail": store_data.buMail,  # Use buMail from form data
+        "registerDate": datetime.utcnow(),
+        "status": "ACTIVE"
+    }
+    
+    result = await db.Store.insert_one(store_doc)
+    store_doc["_id"] = result.inserted_id
+    
+    # Update user role to SELLER
+    await db.User.update_one(
+        {"_id": user_id},
+        {"$set": {"role": "SELLER"}}
+    )
+    
+    return store_response(store_doc)
+
+
+@router.put("/users/me/store", response_model=StoreResponse)
+@router.put("/stores/my-store", response_model=StoreResponse)
+async def update_my_store(
+    store_data: StoreUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Update current user's store"""
+    store = await db.Store.find_one_and_update(
+        {"ownerId": current_user["_id"]},
+        {"$set": {
+            "storeName": store_data.storeName,
+            "storeDescription": store_data.storeDescription
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    return store_response(store)
+
+
+@router.get("/users/me/has-store")
+async def check_has_store(db: AsyncIOMotorDatabase = Depends(get_db), current_user=Depends(get_current_user)):
+    """Check if user has a store"""
+    store = await db.Store.find_one({"ownerId": current_user["_id"]}, projection={"_id": 1})
+    
+    return {"hasStore": store is not None}
+
+
+# ===== Product Models =====
+class ProductCreate(BaseModel):
+    name: str
+    description: str
+    price: float
+    quantity: int
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+
+
+class ProductUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    quantity: Optional[int] = None
+    image_url: Optional[str] = None
+    category: Optional[str] = None
+
+
+# ===== Product Endpoints =====
+@router.get("/products/my-products", response_model=list[ProductResponse])
+async def get_my_products(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get all products for current user's store"""
+    user_id = current_user["_id"]
+    
+    # Find user's store
+    store = await db.Store.find_one({"ownerId": user_id})
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    # Get products for this store
+    products = await db.Product.find({"storeId": store["_id"], "status": "ACTIVE"}).to_list(None)
+    
+    return [
+        product_response(product)
+        for product in products
+    ]
+
+
+@router.post("/products", response_model=ProductResponse)
+async def create_product(
+    product_data: ProductCreate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Create a new product for current user's store"""
+    user_id = current_user["_id"]
+    
+    # Find user's store
+    store = await db.Store.find_one({"ownerId": user_id})
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    # Create new product
+    product_doc = {
+        "storeId": store["_id"],
+        "name": product_data.name,
+        "description": product_data.description,
+        "price": product_data.price,
+        "quantity": product_data.quantity,
+        "image_url": product_data.image_url,
+        "category": product_data.category,
+        "createdAt": datetime.utcnow(),
+        "updatedAt": datetime.utcnow(),
+        "status": "ACTIVE"
+    }
+    
+    result = await db.Product.insert_one(product_doc)
+    product_doc["_id"] = result.inserted_id
+    
+    return product_response(product_doc)
+
+
+@router.get("/products/my/{product_id}", response_model=ProductResponse)
+async def get_my_product(
+    product_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a specific product by ID for store owner"""
+    user_id = current_user["_id"]
+    
+    # Find user's store
+    store = await db.Store.find_one({"ownerId": user_id})
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    # Find product
+    product = await db.Product.find_one({
+        "_id": ObjectId(product_id),
+        "storeId": store["_id"]
+    })
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    return product_response(product)
+
+
+@router.put("/products/{product_id}", response_model=ProductResponse)
+async def update_product(
+    product_id: str,
+    product_data: ProductUpdate,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Update a specific product by ID"""
+    user_id = current_user["_id"]
+    
+    # Find user's store
+    store = await db.Store.find_one({"ownerId": user_id})
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    # Find product
+    product = await db.Product.find_one({
+        "_id": ObjectId(product_id),
+        "storeId": store["_id"]
+    })
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    # Update product
+    update_data = {
+        "updatedAt": datetime.utcnow()
+    }
+    
+    if product_data.name is not None:
+        update_data["name"] = product_data.name
+    if product_data.description is not None:
+        update_data["description"] = product_data.description
+    if product_data.price is not None:
+        update_data["price"] = product_data.price
+    if product_data.quantity is not None:
+        update_data["quantity"] = product_data.quantity
+    if product_data.image_url is not None:
+        update_data["image_url"] = product_data.image_url
+    if product_data.category is not None:
+        update_data["category"] = product_data.category
+    
+    await db.Product.update_one(
+        {"_id": ObjectId(product_id)},
+        {"$set": update_data}
+    )
+    reviewable_products.invalidate(ObjectId(product_id))
+    featured_pool.invalidate()
+    
+    # Get updated product
+    updated_product = await db.Product.find_one({"_id": ObjectId(product_id)})
+    
+    return product_response(updated_product)
+
+
+@router.delete("/products/{product_id}")
+async def delete_product(
+    product_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Delete a specific product by ID (permanent delete)"""
+    user_id = current_user["_id"]
+    
+    # Find user's store
+    store = await db.Store.find_one({"ownerId": user_id})
+    if not store:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Store not found"
+        )
+    
+    # Find product
+    product = await db.Product.find_one({
+        "_id": ObjectId(product_id),
+        "storeId": store["_id"]
+    })
+    
+    if not product:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Product not found"
+        )
+    
+    # Permanent delete (remove from database)
+    await db.Product.delete_one({"_id": ObjectId(product_id)})
+    reviewable_products.invalidate(ObjectId(product_id))
+    featured_pool.invalidate()
+    
+    return {"message": "Product deleted successfully"}
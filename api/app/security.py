@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+import base64
+import hashlib
+import json
+import secrets
+
+from bson import ObjectId
+from fastapi import Depends, HTTPException, Request, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from .db import get_db
+
+# ===== Auth helpers =====
+def hash_password(password: str) -> str:
+    salt = secrets.token_hex(16)
+    return f"{salt}:{hashlib.sha256((salt + password).encode()).hexdigest()}"
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    try:
+        salt, hash_value = hashed.split(":", 1)
+        return hashlib.sha256((salt + password).encode()).hexdigest() == hash_value
+    except:
+        return False
+
+
+def create_access_token(data: dict) -> str:
+    exp_dt = datetime.utcnow() + timedelta(hours=24)
+    payload = {
+        "sub": data.get("user_id"),
+        "username": data.get("username"),
+        "exp": int(exp_dt.timestamp()),
+    }
+    token = base64.b64encode(json.dumps(payload).encode()).decode()
+    return token
+
+
+async def get_current_user(request: Request, db: AsyncIOMotorDatabase = Depends(get_db)):
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
+    return await authenticate_token(auth_header.split(" ", 1)[1], db)
+
+
+async def authenticate_token(token: str, db: AsyncIOMotorDatabase):
+    """Resolve a bearer token to its user (shared by header and query-string auth)"""
+    try:
+        payload_raw = base64.b64decode(token).decode()
+        payload = json.loads(payload_raw)
+        exp = int(payload.get("exp", 0))
+        if int(datetime.utcnow().timestamp()) >= exp:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
+        user_id = payload.get("sub")
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        user = await db.User.find_one({"_id": ObjectId(user_id)})
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        return user
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
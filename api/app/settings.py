@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+import os
+
+from dotenv import load_dotenv
+
+# Every router, in registration order: store routes come before catalog so
+# /products/my-products and /stores/my-store are not captured by the catalog's
+# /products/{product_id} and /stores/{store_id}
+ROUTERS = ("auth", "store", "catalog", "reviews", "cart", "orders", "notifications")
+
+DEFAULT_CORS_ORIGINS = ("http://localhost:3000", "http://127.0.0.1:3000")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Configuration for create_app()
+
+    `routers` selects the domains a worker serves, e.g. ("catalog", "reviews")
+    for read-mostly catalog workers and ("auth", "cart", "orders") for
+    checkout workers; background subsystems are only started for the routers
+    that need them.
+    """
+    mongodb_uri: str = "mongodb://localhost:27017"
+    mongodb_db: str = "walk4you"
+    mongo_max_pool_size: int = 50
+    # Connections opened during warmup, before the worker reports ready
+    mongo_min_pool_size: int = 10
+    routers: tuple[str, ...] = ROUTERS
+    cors_origins: tuple[str, ...] = DEFAULT_CORS_ORIGINS
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Settings from the environment (and .env), e.g. API_ROUTERS=catalog,reviews"""
+        load_dotenv()
+        routers = os.getenv("API_ROUTERS")
+        origins = os.getenv("CORS_ORIGINS")
+        return cls(
+            mongodb_uri=os.getenv("MONGODB_URI", cls.mongodb_uri),
+            mongodb_db=os.getenv("MONGODB_DB", cls.mongodb_db),
+            mongo_max_pool_size=int(os.getenv("MONGO_MAX_POOL_SIZE", cls.mongo_max_pool_size)),
+            mongo_min_pool_size=int(os.getenv("MONGO_MIN_POOL_SIZE", cls.mongo_min_pool_size)),
+            routers=tuple(r.strip() for r in routers.split(",") if r.strip()) if routers else ROUTERS,
+            cors_origins=tuple(o.strip() for o in origins.split(",") if o.strip()) if origins else DEFAULT_CORS_ORIGINS,
+        )
@@ -0,0 +1,127 @@
+"""Slow-query log with sampled explain capture
+
+Any find, aggregate, count or distinct that takes longer than SLOW_QUERY_MS is
+logged with its normalized shape and the route that issued it. A sample of
+those (SLOW_QUERY_EXPLAIN_SAMPLE), at most SLOW_QUERY_EXPLAINS_PER_MINUTE and
+at most once per shape every SLOW_QUERY_EXPLAIN_COOLDOWN_SECONDS, are re-run
+as explain("executionStats") in the background and their plan summary logged.
+"""
+from typing import Optional
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import time
+
+from pymongo import monitoring
+
+from .indexes import plan_stages, walk_plan
+from .querybudget import command_collection, current_queries, query_shape
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE", "0.1"))
+SLOW_QUERY_EXPLAINS_PER_MINUTE = int(os.getenv("SLOW_QUERY_EXPLAINS_PER_MINUTE", "6"))
+SLOW_QUERY_EXPLAIN_COOLDOWN_SECONDS = float(os.getenv("SLOW_QUERY_EXPLAIN_COOLDOWN_SECONDS", "300"))
+
+_WATCHED_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Session and transaction fields the driver adds; explain rejects or ignores them
+_DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "$clusterTime", "$db", "$readPreference"}
+
+
+def explain_summary(explained: dict) -> dict:
+    """Winning plan stages and execution counters from an executionStats explain"""
+    stats = next((value for key, value in walk_plan(explained) if key == "executionStats"), {})
+    winning = [plan for key, plan in walk_plan(explained) if key == "winningPlan"]
+    return {
+        "stages": " > ".join(plan_stages(winning)),
+        "keysExamined": stats.get("totalKeysExamined"),
+        "docsExamined": stats.get("totalDocsExamined"),
+        "nReturned": stats.get("nReturned"),
+        "executionTimeMillis": stats.get("executionTimeMillis"),
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Log slow read commands and explain a rate-limited sample of them"""
+
+    def __init__(self):
+        # request_id -> (database, command, route) for watched commands in flight
+        self.in_flight: dict[int, tuple[str, dict, str]] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.get_db = None
+        self.explain_times: list[float] = []
+        self.explained_shapes: dict[str, float] = {}
+
+    def start(self, get_db) -> None:
+        """Enable explain capture; must be called from the API's event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.get_db = get_db
+
+    def stop(self) -> None:
+        self.loop = None
+
+    # ===== Listener (runs on driver threads) =====
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in _WATCHED_COMMANDS:
+            return
+        queries = current_queries.get()
+        route = queries.route if queries is not None else "background"
+        self.in_flight[event.request_id] = (event.database_name, event.command, route)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event)
+
+    def _finish(self, event) -> None:
+        started = self.in_flight.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < SLOW_QUERY_MS:
+            return
+        database, command, route = started
+        shape = query_shape(event.command_name, command)
+        logger.warning("Slow query (%.0fms) from %s: %s", duration_ms, route, shape)
+
+        if self.loop is not None and self._should_explain(shape):
+            self.loop.call_soon_threadsafe(self._schedule_explain, database, event.command_name, command, route, shape)
+
+    def _should_explain(self, shape: str) -> bool:
+        if random.random() >= SLOW_QUERY_EXPLAIN_SAMPLE:
+            return False
+        now = time.monotonic()
+        if now - self.explained_shapes.get(shape, float("-inf")) < SLOW_QUERY_EXPLAIN_COOLDOWN_SECONDS:
+            return False
+        self.explain_times = [t for t in self.explain_times if now - t < 60]
+        if len(self.explain_times) >= SLOW_QUERY_EXPLAINS_PER_MINUTE:
+            return False
+        self.explain_times.append(now)
+        self.explained_shapes[shape] = now
+        return True
+
+    # ===== Explain (runs on the event loop) =====
+    def _schedule_explain(self, database: str, command_name: str, command: dict, route: str, shape: str) -> None:
+        # A fresh context, so the explain runs outside the slow request's query
+        # deadline and is not counted among that request's queries
+        contextvars.Context().run(asyncio.create_task, self._explain(database, command_name, command, route, shape))
+
+    async def _explain(self, database: str, command_name: str, command: dict, route: str, shape: str) -> None:
+        explainable = {key: value for key, value in command.items() if key not in _DRIVER_FIELDS}
+        try:
+            db = (await self.get_db()).client[database]
+            explained = await db.command({"explain": explainable, "verbosity": "executionStats"})
+            summary = explain_summary(explained)
+            logger.warning(
+                "Slow query plan for %s on %s: %s keysExamined=%s docsExamined=%s nReturned=%s "
+                "executionTimeMillis=%s (%s)",
+                route, command_collection(command_name, command), summary["stages"], summary["keysExamined"],
+                summary["docsExamined"], summary["nReturned"], summary["executionTimeMillis"], shape,
+            )
+        except Exception as e:
+            logger.error("Error explaining slow query from %s: %s", route, e)
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,153 @@
+"""Time budgets for Mongo queries
+
+Each request runs under pymongo.timeout() with the budget of its route class
+(QUERY_BUDGET_<CLASS>_MS, classes as in admission.route_class), so the driver
+sends every find, aggregate and getMore with maxTimeMS set to what is left of
+the budget and stops waiting for the server once it is spent. query_budget()
+narrows the budget for one block of queries, e.g. the regex search fallback.
+
+An overrun raises a PyMongoError whose is_timeout() is true. Endpoints that
+have a fallback serve it (a stale cached result, a partial page flagged with
+X-Partial-Result); QueryTimeoutMiddleware turns any other overrun into a 504
+instead of a generic 500. Overruns are counted in mongo_query_timeouts_total,
+including those a handler answers with an empty result (see query_timed_out).
+
+Writes that record or undo work already done (idempotency bookkeeping, stock
+compensation) must not be cut short by a request that is out of time. They
+run through with_own_budget(), under QUERY_BUDGET_BOOKKEEPING_MS of their own;
+a nested pymongo.timeout() can only shorten the request's deadline, not lift it.
+"""
+from contextlib import nullcontext
+from contextvars import Context, ContextVar
+from typing import Awaitable, Optional, TypeVar
+import asyncio
+import logging
+import os
+import time
+
+import pymongo
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from .admission import EXEMPT_PATHS, route_class
+from .metrics import is_timeout, record_query_timeout
+
+logger = logging.getLogger(__name__)
+
+QUERY_TIMEOUTS = os.getenv("QUERY_TIMEOUTS", "1") != "0"
+# Budget for all of a request's queries, by route class
+QUERY_BUDGETS_MS = {
+    "checkout": float(os.getenv("QUERY_BUDGET_CHECKOUT_MS", "10000")),
+    "auth": float(os.getenv("QUERY_BUDGET_AUTH_MS", "3000")),
+    "cart_writes": float(os.getenv("QUERY_BUDGET_CART_WRITES_MS", "5000")),
+    "catalog_reads": float(os.getenv("QUERY_BUDGET_CATALOG_READS_MS", "2000")),
+    "other": float(os.getenv("QUERY_BUDGET_OTHER_MS", "5000")),
+}
+# Budget for bookkeeping and compensating writes, independent of the request's
+QUERY_BUDGET_BOOKKEEPING_MS = float(os.getenv("QUERY_BUDGET_BOOKKEEPING_MS", "5000"))
+
+PARTIAL_RESULT_HEADER = "X-Partial-Result"
+# Server error code for an operation stopped by maxTimeMS
+_MAX_TIME_MS_EXPIRED = 50
+
+
+class RequestBudget:
+    def __init__(self, route_class: str, budget_ms: float):
+        self.route_class = route_class
+        self.deadline = time.monotonic() + budget_ms / 1000
+        # Set when the server stopped one of the request's queries
+        self.timed_out = False
+
+    @property
+    def expired(self) -> bool:
+        return self.timed_out or time.monotonic() >= self.deadline
+
+
+current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("current_budget", default=None)
+
+
+def query_budget(budget_ms: float):
+    """Give the queries in a `with` block at most budget_ms (never more than the request has left)"""
+    return pymongo.timeout(budget_ms / 1000) if QUERY_TIMEOUTS else nullcontext()
+
+
+T = TypeVar("T")
+
+
+async def with_own_budget(operation: Awaitable[T], budget_ms: float = QUERY_BUDGET_BOOKKEEPING_MS) -> T:
+    """Await operation under a fixed budget instead of what is left of the request's
+
+    It runs as a task in a fresh context (outside the request's deadline) and
+    is shielded, so a client disconnecting does not abandon it halfway.
+    """
+    async def run() -> T:
+        with query_budget(budget_ms):
+            return await operation
+
+    return await asyncio.shield(Context().run(asyncio.create_task, run()))
+
+
+def query_timed_out(error: BaseException) -> bool:
+    """Whether an error means the request ran out of query time, however the driver reported it"""
+    if is_timeout(error):
+        return True
+    budget = current_budget.get()
+    return budget is not None and budget.expired
+
+
+def timeout_fallback(operation: str, fallback: str, error: BaseException) -> None:
+    """Log and count a query overrun an endpoint is answering with a fallback"""
+    logger.warning("%s timed out, serving %s: %s", operation, fallback, error)
+    record_query_timeout(operation, fallback)
+
+
+class TimeoutTracker(monitoring.CommandListener):
+    """Flag the current request when the server stops one of its queries at maxTimeMS"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        budget = current_budget.get()
+        if budget is not None and isinstance(event.failure, dict) and event.failure.get("code") == _MAX_TIME_MS_EXPIRED:
+            budget.timed_out = True
+
+
+class QueryTimeoutMiddleware(BaseHTTPMiddleware):
+    """Run each request's queries under its route class's time budget; 504 when it overruns"""
+
+    async def dispatch(self, request: Request, call_next):
+        if not QUERY_TIMEOUTS or request.url.path in EXEMPT_PATHS:
+            return await call_next(request)
+
+        route_cls = route_class(request.method, request.url.path).name
+        budget_ms = QUERY_BUDGETS_MS[route_cls]
+        budget = RequestBudget(route_cls, budget_ms)
+        token = current_budget.set(budget)
+        try:
+            with pymongo.timeout(budget_ms / 1000):
+                response = await call_next(request)
+        except PyMongoError as e:
+            # Raised past the handler (e.g. from a dependency) instead of reported as 500
+            if not is_timeout(e):
+                raise
+            return self._timed_out(request, route_cls, budget_ms)
+        finally:
+            current_budget.reset(token)
+
+        # Handlers report unexpected errors as 500; one whose budget ran out timed out
+        if response.status_code == 500 and budget.expired:
+            return self._timed_out(request, route_cls, budget_ms)
+        return response
+
+    @staticmethod
+    def _timed_out(request: Request, route_cls: str, budget_ms: float) -> JSONResponse:
+        logger.warning("%s %s ran out of its %.0fms query budget", request.method, request.url.path, budget_ms)
+        record_query_timeout(route_cls, "timeout")
+        return JSONResponse({"detail": "Database query timed out"}, status_code=504)
@@ -0,0 +1,564 @@
+"""Endpoint-level load test for the Walk4You API.
+
+Seeds a throwaway database with synthetic stores, products, users, carts,
+reviews and notifications, starts the API against it and drives every route
+at a fixed concurrency, one route at a time:
+
+    cd api
+    python -m pip install httpx
+    python -m scripts.benchmark --requests 500 --concurrency 32 --out bench.json
+    python -m scripts.benchmark --baseline benchmarks/baseline.json
+    python -m scripts.benchmark --update-baseline          # accept current numbers
+
+Reports throughput and p50/p95/p99 latency per route, writes them as JSON and
+exits non-zero when a route's p95 regresses past --tolerance against the
+baseline. Pass --base-url to benchmark an API that is already running (it
+must use the same MONGODB_URI and --db).
+"""
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+try:
+    import httpx
+except ImportError:
+    sys.exit("The benchmark needs httpx: python -m pip install httpx")
+
+from app.indexes import migrate_indexes
+from app.security import create_access_token, hash_password
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "baseline.json")
+PASSWORD = "benchmark-password"
+CATEGORIES = ["เสื้อผ้า", "รองเท้า", "กระเป๋า", "อิเล็กทรอนิกส์", "ของใช้ในบ้าน", "ความงาม", "กีฬา", "หนังสือ"]
+WORDS = ["shoe", "running", "cotton", "leather", "bag", "phone", "lamp", "shirt", "รองเท้า", "เสื้อ", "กระเป๋า", "วิ่ง"]
+
+
+# ===== Seeding =====
+async def seed(db, args, rng: random.Random) -> dict:
+    """Insert the synthetic dataset; return the ids and tokens scenarios draw from"""
+    now = datetime.utcnow()
+    users = [
+        {
+            "_id": ObjectId(),
+            "username": f"bench{i}",
+            "password": hash_password(PASSWORD),
+            "email": f"bench{i}@example.com",
+            "phone": None,
+            "role": "SELLER" if i < args.stores else "CUSTOMER",
+            "registerDate": now
+        }
+        for i in range(args.users + args.stores)
+    ]
+    sellers, buyers = users[:args.stores], users[args.stores:]
+
+    stores = [
+        {
+            "_id": ObjectId(),
+            "ownerId": seller["_id"],
+            "storeName": f"ร้าน {seller['username']}",
+            "storeDescription": "synthetic store",
+            "phoneNumber": None,
+            "buMail": seller["email"],
+            "registerDate": now,
+            "status": "ACTIVE"
+        }
+        for seller in sellers
+    ]
+
+    products = []
+    for i in range(args.products):
+        # A few stores hold most of the catalog, as in production
+        store = stores[min(int(rng.paretovariate(1.2)) - 1, len(stores) - 1)]
+        name = " ".join(rng.sample(WORDS, 3))
+        products.append({
+            "_id": ObjectId(),
+            "storeId": store["_id"],
+            "name": f"{name} {i}",
+            "description": f"{name} synthetic product",
+            "price": float(rng.randint(50, 5000)),
+            "quantity": 1_000_000,
+            "image_url": None,
+            "category": rng.choice(CATEGORIES),
+            "status": "ACTIVE",
+            "createdAt": now - timedelta(minutes=i),
+            "updatedAt": now
+        })
+
+    reviews = {}
+    for _ in range(args.reviews):
+        buyer, product = rng.choice(buyers), rng.choice(products)
+        reviews[(product["_id"], buyer["_id"])] = {
+            "productId": product["_id"],
+            "userId": buyer["_id"],
+            "username": buyer["username"],
+            "rating": rng.randint(1, 5),
+            "comment": "synthetic review",
+            "createdAt": now - timedelta(seconds=rng.randint(0, 86400 * 30)),
+            "updatedAt": now
+        }
+
+    notifications = [
+        {
+            "_id": ObjectId(),
+            "userId": buyer["_id"],
+            "type": "order",
+            "title": "synthetic",
+            "message": "synthetic notification",
+            "data": None,
+            "isRead": rng.random() < 0.5,
+            "createdAt": now - timedelta(seconds=rng.randint(0, 86400 * 30))
+        }
+        for buyer in buyers
+        for _ in range(args.notifications)
+    ]
+    unread = {}
+    for n in notifications:
+        if not n["isRead"]:
+            unread[n["userId"]] = unread.get(n["userId"], 0) + 1
+    for buyer in buyers:
+        buyer["unreadNotificationCount"] = unread.get(buyer["_id"], 0)
+
+    await db.User.insert_many(users, ordered=False)
+    await db.Store.insert_many(stores, ordered=False)
+    await db.Product.insert_many(products, ordered=False)
+    if reviews:
+        await db.Review.insert_many(list(reviews.values()), ordered=False)
+    if notifications:
+        await db.Notification.insert_many(notifications, ordered=False)
+    await fill_carts(db, buyers, products, rng)
+
+    def token(user):
+        return create_access_token({"user_id": str(user["_id"]), "username": user["username"]})
+
+    return {
+        "buyers": [{"id": b["_id"], "token": token(b), "username": b["username"]} for b in buyers],
+        "sellers": [{"id": s["_id"], "token": token(s)} for s in sellers],
+        "stores": [s["_id"] for s in stores],
+        "products": [p["_id"] for p in products],
+        "products_by_store": {
+            s["_id"]: [p["_id"] for p in products if p["storeId"] == s["_id"]] for s in stores
+        },
+        "notifications": {
+            b["_id"]: [n["_id"] for n in notifications if n["userId"] == b["_id"]] for b in buyers
+        },
+        "product_docs": {p["_id"]: p for p in products},
+    }
+
+
+async def fill_carts(db, buyers: list[dict], products: list[dict], rng: random.Random) -> None:
+    """Give every buyer a cart with a few items (also used to refill before checkout)"""
+    now = datetime.utcnow()
+    carts = []
+    for buyer in buyers:
+        items = [
+            {
+                "_id": ObjectId(),
+                "productId": p["_id"],
+                "quantity": rng.randint(1, 3),
+                "productName": p["name"],
+                "price": p["price"],
+                "storeId": p["storeId"],
+                "createdAt": now,
+                "updatedAt": now
+            }
+            for p in rng.sample(products, min(3, len(products)))
+        ]
+        carts.append({
+            "userId": buyer["_id"],
+            "items": items,
+            "totalItems": sum(i["quantity"] for i in items),
+            "totalAmount": sum(i["quantity"] * i["price"] for i in items),
+            "createdAt": now,
+            "updatedAt": now
+        })
+    await db.Cart.delete_many({"userId": {"$in": [b["_id"] for b in buyers]}})
+    await db.Cart.insert_many(carts, ordered=False)
+
+
+# ===== Scenarios =====
+def auth(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+class Scenario:
+    """One route: `call(client, ctx, rng, i)` issues the i-th request"""
+
+    def __init__(self, route: str, call, expect=(200,), setup=None):
+        self.route = route
+        self.call = call
+        self.expect = set(expect)
+        self.setup = setup
+
+
+def scenarios(run_id: str) -> list[Scenario]:
+    def buyer(ctx, i):
+        return ctx["buyers"][i % len(ctx["buyers"])]
+
+    def seller(ctx, i):
+        return ctx["sellers"][i % len(ctx["sellers"])]
+
+    def own_product(ctx, i):
+        s = seller(ctx, i)
+        store_index = ctx["sellers"].index(s)
+        owned = ctx["products_by_store"][ctx["stores"][store_index]]
+        return s, owned[i % len(owned)] if owned else ctx["products"][0]
+
+    def product(ctx, rng):
+        return rng.choice(ctx["products"])
+
+    def notification(ctx, i):
+        b = buyer(ctx, i)
+        ids = ctx["notifications"][b["id"]]
+        return b, ids[(i // len(ctx["buyers"])) % len(ids)] if ids else ObjectId()
+
+    async def add_cart_item(c, ctx, rng, i):
+        response = await c.post("/cart/items", headers=auth(buyer(ctx, i)),
+                                json={"productId": str(product(ctx, rng)), "quantity": 1})
+        if response.status_code == 200:
+            ctx.setdefault("cart_items", []).append((buyer(ctx, i), response.json()["id"]))
+        return response
+
+    def cart_item(ctx, i):
+        items = ctx.get("cart_items") or [(buyer(ctx, i), str(ObjectId()))]
+        return items[i % len(items)]
+
+    async def create_product(c, ctx, rng, i):
+        s = seller(ctx, i)
+        response = await c.post("/products", headers=auth(s), json={
+            "name": f"bench product {run_id} {i}", "description": "created by benchmark",
+            "price": 100.0, "quantity": 1000, "category": rng.choice(CATEGORIES)
+        })
+        if response.status_code == 200:
+            ctx.setdefault("created_products", []).append((s, response.json()["id"]))
+        return response
+
+    async def delete_product(c, ctx, rng, i):
+        created = ctx.get("created_products") or []
+        if i >= len(created):
+            return await c.delete(f"/products/{ObjectId()}", headers=auth(seller(ctx, i)))
+        s, product_id = created[i]
+        return await c.delete(f"/products/{product_id}", headers=auth(s))
+
+    async def place_order(c, ctx, rng, i):
+        p = ctx["product_docs"][product(ctx, rng)]
+        b = buyer(ctx, i)
+        response = await c.post("/orders", headers=auth(b), json={
+            "items": [{"productId": str(p["_id"]), "quantity": 1, "price": p["price"]}],
+            "shippingAddress": "1 Benchmark Rd, Bangkok", "phoneNumber": "0800000000"
+        })
+        if response.status_code == 200:
+            ctx.setdefault("orders", []).append((b, response.json()["id"]))
+        return response
+
+    async def cancel_order(c, ctx, rng, i):
+        orders = ctx.get("orders") or []
+        b, order_id = orders[i] if i < len(orders) else (buyer(ctx, i), str(ObjectId()))
+        return await c.post(f"/orders/{order_id}/cancel", headers=auth(b))
+
+    async def register(c, ctx, rng, i):
+        response = await c.post("/auth/register", json={
+            "username": f"new{run_id}{i}", "password": PASSWORD, "email": f"new{run_id}{i}@example.com"
+        })
+        if response.status_code == 200:
+            ctx.setdefault("registered", []).append({"token": response.json()["access_token"]})
+        return response
+
+    def registered(ctx, i):
+        users = ctx.get("registered") or [buyer(ctx, i)]
+        return users[i % len(users)]
+
+    async def open_stream(c, ctx, rng, i):
+        # Time to an open event stream, not its lifetime
+        async with c.stream("GET", "/notifications/stream", params={"token": buyer(ctx, i)["token"]}) as response:
+            return response
+
+    async def refill_carts(ctx, db, rng):
+        buyers = [{"_id": b["id"]} for b in ctx["buyers"]]
+        await fill_carts(db, buyers, list(ctx["product_docs"].values()), rng)
+
+    checkout_body = {"shippingAddress": "1 Benchmark Rd, Bangkok", "phoneNumber": "0800000000"}
+
+    return [
+        # Public catalog
+        Scenario("GET /", lambda c, ctx, rng, i: c.get("/")),
+        Scenario("GET /health", lambda c, ctx, rng, i: c.get("/health")),
+        Scenario("GET /products/featured", lambda c, ctx, rng, i: c.get("/products/featured")),
+        Scenario("GET /public/products/{id}",
+                 lambda c, ctx, rng, i: c.get(f"/public/products/{product(ctx, rng)}")),
+        Scenario("GET /products/{id}", lambda c, ctx, rng, i: c.get(f"/products/{product(ctx, rng)}")),
+        Scenario("GET /products/search",
+                 lambda c, ctx, rng, i: c.get("/products/search", params={"q": rng.choice(WORDS)})),
+        Scenario("GET /products/search/suggestions",
+                 lambda c, ctx, rng, i: c.get("/products/search/suggestions", params={"q": rng.choice(WORDS)[:2]})),
+        Scenario("GET /products/category-counts", lambda c, ctx, rng, i: c.get("/products/category-counts")),
+        Scenario("GET /stores/{id}", lambda c, ctx, rng, i: c.get(f"/stores/{rng.choice(ctx['stores'])}")),
+        Scenario("GET /products/{id}/reviews",
+                 lambda c, ctx, rng, i: c.get(f"/products/{product(ctx, rng)}/reviews")),
+        # Auth and profile
+        Scenario("POST /auth/register", register),
+        Scenario("POST /auth/login", lambda c, ctx, rng, i: c.post(
+            "/auth/login", json={"username": buyer(ctx, i)["username"], "password": PASSWORD})),
+        Scenario("GET /users/me", lambda c, ctx, rng, i: c.get("/users/me", headers=auth(buyer(ctx, i)))),
+        Scenario("GET /users/me/has-store",
+                 lambda c, ctx, rng, i: c.get("/users/me/has-store", headers=auth(buyer(ctx, i)))),
+        Scenario("GET /users/me/store",
+                 lambda c, ctx, rng, i: c.get("/users/me/store", headers=auth(seller(ctx, i)))),
+        Scenario("POST /users/me/store", lambda c, ctx, rng, i: c.post(
+            "/users/me/store", headers=auth(registered(ctx, i)), json={"storeName": f"store {run_id} {i}"}),
+            expect=(200, 400)),
+        Scenario("PUT /users/me/store", lambda c, ctx, rng, i: c.put(
+            "/users/me/store", headers=auth(seller(ctx, i)), json={"storeName": f"ร้าน {i}"})),
+        Scenario("GET /stores/my-store",
+                 lambda c, ctx, rng, i: c.get("/stores/my-store", headers=auth(seller(ctx, i)))),
+        Scenario("PUT /stores/my-store", lambda c, ctx, rng, i: c.put(
+            "/stores/my-store", headers=auth(seller(ctx, i)), json={"storeName": f"ร้าน {i}"})),
+        Scenario("POST /stores/my-store", lambda c, ctx, rng, i: c.post(
+            "/stores/my-store", headers=auth(seller(ctx, i)), json={"storeName": f"ร้าน {i}"}),
+            expect=(200, 400)),
+        # Seller catalog management
+        Scenario("GET /products/my-products",
+                 lambda c, ctx, rng, i: c.get("/products/my-products", headers=auth(seller(ctx, i)))),
+        Scenario("GET /products/my/{id}", lambda c, ctx, rng, i: (
+            lambda s, p: c.get(f"/products/my/{p}", headers=auth(s)))(*own_product(ctx, i))),
+        Scenario("POST /products", create_product),
+        Scenario("PUT /products/{id}", lambda c, ctx, rng, i: (
+            lambda s, p: c.put(f"/products/{p}", headers=auth(s), json={"price": float(rng.randint(50, 5000))})
+        )(*own_product(ctx, i))),
+        Scenario("DELETE /products/{id}", delete_product),
+        # Reviews (a user reviews a product once; repeats are rejected)
+        Scenario("POST /products/{id}/reviews", lambda c, ctx, rng, i: c.post(
+            f"/products/{product(ctx, rng)}/reviews", headers=auth(buyer(ctx, i)),
+            json={"rating": rng.randint(1, 5), "comment": "benchmark review"}), expect=(200, 400)),
+        # Notifications
+        Scenario("GET /notifications",
+                 lambda c, ctx, rng, i: c.get("/notifications", headers=auth(buyer(ctx, i)))),
+        Scenario("GET /notifications/unread-count",
+                 lambda c, ctx, rng, i: c.get("/notifications/unread-count", headers=auth(buyer(ctx, i)))),
+        Scenario("PUT /notifications/{id}/read", lambda c, ctx, rng, i: (
+            lambda b, n: c.put(f"/notifications/{n}/read", headers=auth(b)))(*notification(ctx, i)),
+            expect=(200, 404)),
+        Scenario("POST /notifications/read", lambda c, ctx, rng, i: (
+            lambda b, n: c.post("/notifications/read", headers=auth(b), json={"ids": [str(n)]}))(*notification(ctx, i))),
+        Scenario("POST /notifications/read-all",
+                 lambda c, ctx, rng, i: c.post("/notifications/read-all", headers=auth(buyer(ctx, i)))),
+        Scenario("POST /notifications/delete", lambda c, ctx, rng, i: (
+            lambda b, n: c.post("/notifications/delete", headers=auth(b), json={"ids": [str(n)]}))(*notification(ctx, i))),
+        Scenario("GET /notifications/stream (connect)", open_stream),
+        # Cart
+        Scenario("GET /cart", lambda c, ctx, rng, i: c.get("/cart", headers=auth(buyer(ctx, i)))),
+        Scenario("POST /cart/items", add_cart_item),
+        Scenario("PUT /cart/items/{id}", lambda c, ctx, rng, i: (
+            lambda b, item: c.put(f"/cart/items/{item}", headers=auth(b), json={"quantity": 2}))(*cart_item(ctx, i)),
+            expect=(200, 404)),
+        Scenario("DELETE /cart/items/{id}", lambda c, ctx, rng, i: (
+            lambda b, item: c.delete(f"/cart/items/{item}", headers=auth(b)))(*cart_item(ctx, i))),
+        Scenario("POST /cart/checkout", lambda c, ctx, rng, i: c.post(
+            "/cart/checkout", headers=auth(buyer(ctx, i)), json=checkout_body),
+            expect=(200, 400), setup=refill_carts),
+        Scenario("DELETE /cart", lambda c, ctx, rng, i: c.delete("/cart", headers=auth(buyer(ctx, i)))),
+        # Orders
+        Scenario("POST /orders", place_order),
+        Scenario("POST /orders/{id}/cancel", cancel_order, expect=(200, 404, 409)),
+    ]
+
+
+# Routes the benchmark cannot drive without side effects outside the API
+SKIPPED = {
+    "POST /auth/send-otp": "sends e-mail over SMTP",
+    "POST /auth/verify-otp": "needs an OTP delivered by e-mail",
+    "WEBSOCKET /notifications/ws": "needs a WebSocket client; the SSE stream covers the same path",
+}
+
+
+# ===== Measurement =====
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least pct% of values at or below it"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+async def run_scenario(client, ctx, scenario: Scenario, args, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    counter = iter(range(args.requests))
+
+    async def worker():
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await scenario.call(client, ctx, rng, i)
+                outcome = None if response.status_code in scenario.expect else str(response.status_code)
+            except Exception as e:
+                outcome = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if outcome is not None:
+                errors[outcome] = errors.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "errorsByStatus": errors,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50), 2),
+        "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2),
+        "max": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list[str]:
+    """Routes whose p95 got slower than baseline by more than tolerance (and min_delta_ms)"""
+    regressions = []
+    for route, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if previous is None:
+            continue
+        limit = previous["p95"] * (1 + tolerance)
+        if current["p95"] > limit and current["p95"] - previous["p95"] > min_delta_ms:
+            regressions.append(f"{route}: p95 {current['p95']}ms vs baseline {previous['p95']}ms")
+        if current["errors"] > previous.get("errors", 0):
+            regressions.append(f"{route}: {current['errors']} errors vs baseline {previous.get('errors', 0)}")
+    return regressions
+
+
+# ===== Server =====
+async def start_server(args) -> subprocess.Popen:
+    env = dict(os.environ, MONGODB_DB=args.db)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env
+    )
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}") as client:
+        for _ in range(100):
+            if server.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return server
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("API server did not become healthy")
+
+
+# ===== CLI =====
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route")
+    parser.add_argument("--routes", default="", help="only routes containing this text")
+    parser.add_argument("--stores", type=int, default=20)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--reviews", type=int, default=5000)
+    parser.add_argument("--notifications", type=int, default=20, help="per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="walk4you_bench")
+    parser.add_argument("--base-url", help="benchmark a running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started API")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0)
+    parser.add_argument("--keep-db", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db = mongo[args.db]
+    await mongo.drop_database(args.db)
+    server = None
+    try:
+        await migrate_indexes(db)
+        rng = random.Random(args.seed)
+        ctx = await seed(db, args, rng)
+        print(f"Seeded {args.db}: {args.stores} stores, {args.products} products, {args.users} users")
+
+        if args.base_url is None:
+            server = await start_server(args)
+        base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+
+        run_id = ObjectId().binary.hex()[-8:]
+        results = {
+            "createdAt": datetime.utcnow().isoformat(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "update_baseline")},
+            "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+            "skipped": SKIPPED,
+            "routes": {},
+        }
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            for index, scenario in enumerate(scenarios(run_id)):
+                if args.routes not in scenario.route:
+                    continue
+                if scenario.setup is not None:
+                    await scenario.setup(ctx, db, random.Random(args.seed + index))
+                if args.warmup:
+                    warm = argparse.Namespace(requests=args.warmup, concurrency=min(args.concurrency, args.warmup))
+                    await run_scenario(client, ctx, scenario, warm, args.seed + index)
+                    if scenario.setup is not None:
+                        await scenario.setup(ctx, db, random.Random(args.seed + index))
+                stats = await run_scenario(client, ctx, scenario, args, args.seed + index)
+                results["routes"][scenario.route] = stats
+                print(
+                    f"{scenario.route:<45} {stats['throughput']:>8.1f} req/s  "
+                    f"p50 {stats['p50']:>7.2f}  p95 {stats['p95']:>7.2f}  p99 {stats['p99']:>7.2f} ms"
+                    + (f"  errors {stats['errorsByStatus']}" if stats["errors"] else "")
+                )
+
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+        if args.update_baseline:
+            os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, ensure_ascii=False)
+            print(f"Baseline written to {args.baseline}")
+            return 0
+
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+            return 0
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        print("No regressions against baseline" if not regressions else f"{len(regressions)} regressions")
+        return 1 if regressions else 0
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if not args.keep_db:
+            await mongo.drop_database(args.db)
+        mongo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
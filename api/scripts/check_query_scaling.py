@@ -0,0 +1,165 @@
+"""Fail when an endpoint's Mongo round trips grow with the size of its input.
+
+Drives the endpoints whose work depends on input size (cart contents, order
+lines, updated fields, notification ids) at several sizes and compares the
+command counts reported in the Server-Timing header (see app.querybudget):
+
+    cd api
+    python -m scripts.check_query_scaling --sizes 1 5 20
+
+Runs against a throwaway database (default walk4you_queries) and an API it
+starts itself, or --base-url for one that is already running on that database.
+Exits non-zero if any endpoint's count is not constant.
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import os
+import sys
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.indexes import migrate_indexes
+from app.security import create_access_token
+from app.querybudget import QueryBudgetExceeded, check_query_scaling, server_timing_queries
+from scripts.benchmark import httpx, start_server
+
+SHIPPING = {"shippingAddress": "1 Query Rd, Bangkok", "phoneNumber": "0800000000"}
+
+
+async def seed(db, max_size: int) -> dict:
+    """One buyer, one seller, and max_size products each in its own store"""
+    now = datetime.utcnow()
+    buyer = {"_id": ObjectId(), "username": "buyer", "email": "buyer@example.com", "role": "CUSTOMER",
+             "registerDate": now, "unreadNotificationCount": 0}
+    seller = {"_id": ObjectId(), "username": "seller", "email": "seller@example.com", "role": "SELLER",
+              "registerDate": now}
+    stores = [{"_id": ObjectId(), "ownerId": seller["_id"] if i == 0 else ObjectId(), "storeName": f"store {i}",
+               "registerDate": now, "status": "ACTIVE"} for i in range(max_size)]
+    products = [{"_id": ObjectId(), "storeId": store["_id"], "name": f"product {i}", "description": "",
+                 "price": 10.0, "quantity": 1_000_000, "status": "ACTIVE", "createdAt": now, "updatedAt": now}
+                for i, store in enumerate(stores)]
+    await db.User.insert_many([buyer, seller])
+    await db.Store.insert_many(stores)
+    await db.Product.insert_many(products)
+
+    def token(user):
+        return {"Authorization": f"Bearer {create_access_token({'user_id': str(user['_id']), 'username': user['username']})}"}
+
+    return {"buyer": buyer, "buyer_auth": token(buyer), "seller_auth": token(seller), "products": products}
+
+
+async def set_cart(db, ctx: dict, size: int) -> None:
+    now = datetime.utcnow()
+    items = [{"_id": ObjectId(), "productId": p["_id"], "quantity": 1, "productName": p["name"], "price": p["price"],
+              "storeId": p["storeId"], "createdAt": now, "updatedAt": now} for p in ctx["products"][:size]]
+    await db.Cart.replace_one(
+        {"userId": ctx["buyer"]["_id"]},
+        {"userId": ctx["buyer"]["_id"], "items": items, "totalItems": size, "totalAmount": 10.0 * size,
+         "createdAt": now, "updatedAt": now},
+        upsert=True
+    )
+
+
+async def add_notifications(db, ctx: dict, size: int) -> list[str]:
+    docs = [{"_id": ObjectId(), "userId": ctx["buyer"]["_id"], "type": "order", "title": "t", "message": "m",
+             "data": None, "isRead": False, "createdAt": datetime.utcnow()} for _ in range(size)]
+    await db.Notification.insert_many(docs)
+    await db.User.update_one({"_id": ctx["buyer"]["_id"]}, {"$inc": {"unreadNotificationCount": size}})
+    return [str(d["_id"]) for d in docs]
+
+
+def endpoints(db, ctx: dict) -> dict:
+    """Endpoint name -> async fn(client, size) returning the response to measure"""
+    buyer, seller = ctx["buyer_auth"], ctx["seller_auth"]
+    fields = {"name": "renamed", "description": "d", "price": 12.0, "quantity": 5, "image_url": None, "category": "c"}
+    owned = ctx["products"][0]["_id"]
+
+    async def get_cart(client, size):
+        await set_cart(db, ctx, size)
+        return await client.get("/cart", headers=buyer)
+
+    async def add_to_cart(client, size):
+        await set_cart(db, ctx, size)
+        return await client.post("/cart/items", headers=buyer,
+                                 json={"productId": str(ctx["products"][0]["_id"]), "quantity": 1})
+
+    async def checkout(client, size):
+        await set_cart(db, ctx, size)
+        return await client.post("/cart/checkout", headers=buyer, json=SHIPPING)
+
+    async def create_order(client, size):
+        items = [{"productId": str(p["_id"]), "quantity": 1, "price": p["price"]} for p in ctx["products"][:size]]
+        return await client.post("/orders", headers=buyer, json={"items": items, **SHIPPING})
+
+    async def update_product(client, size):
+        body = dict(list(fields.items())[:max(1, min(size, len(fields)))])
+        return await client.put(f"/products/{owned}", headers=seller, json=body)
+
+    async def read_notifications(client, size):
+        ids = await add_notifications(db, ctx, size)
+        return await client.post("/notifications/read", headers=buyer, json={"ids": ids})
+
+    return {
+        "GET /cart": get_cart,
+        "POST /cart/items": add_to_cart,
+        "POST /cart/checkout": checkout,
+        "POST /orders": create_order,
+        "PUT /products/{id}": update_product,
+        "POST /notifications/read": read_notifications,
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--db", default="walk4you_queries")
+    parser.add_argument("--base-url", help="check a running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    args.workers = 1
+
+    load_dotenv()
+    mongo = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    db = mongo[args.db]
+    await mongo.drop_database(args.db)
+    server = None
+    try:
+        await migrate_indexes(db)
+        ctx = await seed(db, max(args.sizes))
+        if args.base_url is None:
+            server = await start_server(args)
+
+        failures = []
+        async with httpx.AsyncClient(base_url=args.base_url or f"http://127.0.0.1:{args.port}", timeout=30) as client:
+            for name, call in endpoints(db, ctx).items():
+                counts = {}
+                for size in args.sizes:
+                    response = await call(client, size)
+                    count = server_timing_queries(response.headers.get("Server-Timing", ""))
+                    if response.status_code >= 400 or count is None:
+                        failures.append(f"{name} (size {size}): HTTP {response.status_code}, no query count")
+                        break
+                    counts[size] = count
+                else:
+                    try:
+                        check_query_scaling(name, counts)
+                        print(f"ok    {name}: {counts[args.sizes[0]]} queries at every size")
+                    except QueryBudgetExceeded as e:
+                        failures.append(str(e))
+
+        for failure in failures:
+            print(f"FAIL  {failure}")
+        return 1 if failures else 0
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        await mongo.drop_database(args.db)
+        mongo.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
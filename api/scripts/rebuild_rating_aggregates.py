@@ -0,0 +1,32 @@
+"""Rebuild the denormalized review aggregates on Product documents.
+
+    cd api
+    python -m scripts.rebuild_rating_aggregates
+
+ratingSum, ratingCount and ratingHistogram are set to what the Review
+collection holds per product. Not safe while the API is serving traffic: a
+review written between a product's recount and its write is lost from the
+aggregates. Stop the workers (or the reviews router) first.
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.routers.reviews import rebuild_rating_aggregates
+
+
+async def main() -> None:
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    try:
+        db = client[os.getenv("MONGODB_DB", "walk4you")]
+        reviewed = await rebuild_rating_aggregates(db)
+        print(f"Rebuilt review aggregates ({reviewed} products with reviews)")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
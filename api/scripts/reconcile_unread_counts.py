@@ -0,0 +1,33 @@
+"""Rebuild the denormalized unread-notification counters on User documents.
+
+    cd api
+    python -m scripts.reconcile_unread_counts
+
+Counters are set to the number of unread Notification documents per user.
+Not safe while the API is serving traffic: a counter change that lands between
+the recount and the write is lost. Stop the workers (or the notifications
+router) first. Users that only lack the counter are initialised by
+`python -m app.indexes migrate`, which is safe to rerun.
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.notifications import reconcile_unread_counts
+
+
+async def main() -> None:
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    try:
+        db = client[os.getenv("MONGODB_DB", "walk4you")]
+        counts = await reconcile_unread_counts(db)
+        print(f"Reconciled unread counters ({len(counts)} users with unread notifications)")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+"""Write notifications the outbox gave up on (NOTIFICATION_OUTBOX_DIR/dead).
+
+    cd api
+    python -m scripts.replay_dead_notifications
+
+Run it once the cause of the failures is fixed. Each segment that is written
+is deleted; segments that still fail are left in place and reported. Safe
+while the API is serving traffic and safe to rerun: notifications that were
+already written are skipped.
+"""
+import asyncio
+import sys
+
+from app import db
+from app.notifications import notification_outbox
+from app.pubsub import notification_broker
+from app.settings import Settings
+
+
+async def main() -> int:
+    db.connect(Settings.from_env())
+    # Connected streams still get the events when the broker fans out across workers
+    await notification_broker.start()
+    try:
+        replayed, failed = await notification_outbox.replay_dead_letters()
+        print(f"Replayed {replayed} dead-lettered segments ({failed} still failing)")
+        return 1 if failed else 0
+    finally:
+        await notification_outbox.stop()
+        await notification_broker.stop()
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
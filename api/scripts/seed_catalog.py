@@ -0,0 +1,342 @@
+"""Bulk-load a production-sized synthetic dataset.
+
+    cd api
+    python -m scripts.seed_catalog --products 1000000 --users 200000 --workers 8
+    python -m scripts.seed_catalog --products 50000 --db walk4you_dev --drop
+
+Generates stores, products (Thai and English names, skewed category and store
+distributions), reviews with matching rating aggregates, and users with carts
+and notification histories. Every document is a pure function of --seed and
+its index, including its _id, so the same arguments (and --epoch, the date
+generated timestamps count back from) always produce the same data regardless
+of --workers. Batches are streamed to Mongo with unordered insert_many calls
+from parallel worker processes; indexes are built once the data is in (see
+app.indexes).
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import hashlib
+import itertools
+import os
+import random
+import sys
+import time
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.indexes import migrate_indexes
+
+# Timestamp embedded in generated _ids; fixed so ids do not depend on --epoch
+ID_TIME = (1_735_689_600).to_bytes(4, "big")  # 2025-01-01T00:00:00Z
+PASSWORD = "password"
+# PASSWORD in hash_password's format with a fixed salt, shared by every seeded user
+_SALT = "5eed" * 8
+PASSWORD_HASH = f"{_SALT}:{hashlib.sha256((_SALT + PASSWORD).encode()).hexdigest()}"
+
+CATEGORIES = [
+    "เสื้อผ้า", "รองเท้า", "กระเป๋า", "อิเล็กทรอนิกส์", "มือถือและแท็บเล็ต", "ของใช้ในบ้าน",
+    "ความงาม", "สุขภาพ", "กีฬา", "หนังสือ", "ของเล่น", "อาหารและเครื่องดื่ม",
+    "สัตว์เลี้ยง", "เครื่องเขียน", "ยานยนต์", "เครื่องประดับ",
+]
+THAI_ADJECTIVES = ["สีดำ", "สีขาว", "ผ้าฝ้าย", "หนังแท้", "กันน้ำ", "น้ำหนักเบา", "พรีเมียม", "มือสอง", "ไซส์ใหญ่", "ลายไทย"]
+THAI_NOUNS = ["รองเท้าวิ่ง", "เสื้อยืด", "กระเป๋าสะพาย", "หูฟัง", "โคมไฟ", "แก้วน้ำ", "หมวก", "นาฬิกา", "ผ้าพันคอ", "ครีมกันแดด"]
+EN_ADJECTIVES = ["black", "white", "cotton", "leather", "waterproof", "lightweight", "premium", "vintage", "oversized", "wireless"]
+EN_NOUNS = ["running shoes", "t-shirt", "backpack", "headphones", "lamp", "tumbler", "cap", "watch", "scarf", "sunscreen"]
+BRANDS = ["Siam", "Chao", "Lanna", "Walk4You", "Nara", "Urban", "Kiri", "Mali"]
+
+
+# ===== Deterministic generation =====
+def entity_id(kind: int, index: int) -> ObjectId:
+    """Stable, unique ObjectId for the index-th entity of a kind"""
+    return ObjectId(ID_TIME + bytes([kind]) + index.to_bytes(7, "big"))
+
+
+def child_id(kind: int, parent: int, n: int) -> ObjectId:
+    """Stable ObjectId for the n-th child (n < 65536) of the parent-th entity"""
+    return ObjectId(ID_TIME + bytes([kind]) + parent.to_bytes(5, "big") + n.to_bytes(2, "big"))
+
+
+STORE, USER, PRODUCT, REVIEW, CART, NOTIFICATION, CART_ITEM = range(1, 8)
+
+
+def rng_for(seed: int, kind: int, index: int) -> random.Random:
+    return random.Random(seed * 1_000_003 + kind * 10_000_000_019 + index)
+
+
+def skewed_index(rng: random.Random, size: int, skew: float) -> int:
+    """Index in [0, size) where low indexes are much more likely (skew > 1)"""
+    return min(size - 1, int(size * rng.random() ** skew))
+
+
+def store_doc(args, i: int) -> dict:
+    rng = rng_for(args.seed, STORE, i)
+    name = f"ร้าน{rng.choice(BRANDS)} {i}" if rng.random() < 0.6 else f"{rng.choice(BRANDS)} Shop {i}"
+    return {
+        "_id": entity_id(STORE, i),
+        # Sellers are the first --stores users
+        "ownerId": entity_id(USER, i),
+        "storeName": name,
+        "storeDescription": f"{name} - synthetic store",
+        "phoneNumber": f"08{rng.randint(0, 99_999_999):08d}",
+        "buMail": f"seller{i}@example.com",
+        "registerDate": args.epoch - timedelta(days=rng.randint(0, 1000)),
+        "status": "ACTIVE" if rng.random() < 0.98 else "INACTIVE",
+    }
+
+
+def product_doc(args, i: int) -> dict:
+    rng = rng_for(args.seed, PRODUCT, i)
+    if rng.random() < 0.5:
+        name = f"{rng.choice(THAI_NOUNS)} {rng.choice(THAI_ADJECTIVES)} {rng.choice(BRANDS)}"
+    else:
+        name = f"{rng.choice(BRANDS)} {rng.choice(EN_ADJECTIVES)} {rng.choice(EN_NOUNS)}"
+    created = args.epoch - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+    return {
+        "_id": entity_id(PRODUCT, i),
+        # A few large stores own most of the catalog
+        "storeId": entity_id(STORE, skewed_index(rng, args.stores, args.store_skew)),
+        "name": f"{name} #{i}",
+        "description": f"{name} สินค้าคุณภาพ synthetic item {i}",
+        "price": float(round(rng.lognormvariate(6, 1.1), 0) or 1),
+        "quantity": rng.randint(0, 500),
+        "image_url": None,
+        "category": CATEGORIES[skewed_index(rng, len(CATEGORIES), args.category_skew)],
+        "status": "ACTIVE" if rng.random() < 0.97 else "INACTIVE",
+        "createdAt": created,
+        "updatedAt": min(args.epoch, created + timedelta(days=rng.randint(0, 30))),
+    }
+
+
+def user_doc(args, i: int) -> dict:
+    rng = rng_for(args.seed, USER, i)
+    return {
+        "_id": entity_id(USER, i),
+        "username": f"user{i}",
+        "password": PASSWORD_HASH,
+        "email": f"user{i}@example.com",
+        "phone": f"08{rng.randint(0, 99_999_999):08d}",
+        "role": "SELLER" if i < args.stores else "CUSTOMER",
+        "registerDate": args.epoch - timedelta(days=rng.randint(0, 1000)),
+    }
+
+
+def product_with_reviews(args, i: int) -> tuple[dict, list[dict]]:
+    """A product plus its reviews; rating aggregates are filled in to match"""
+    product = product_doc(args, i)
+    rng = rng_for(args.seed, REVIEW, i)
+    # Heavy tail: most products have a handful of reviews, a few have thousands
+    count = min(args.users, 65_535, int(args.reviews_mean * (rng.paretovariate(1.5) - 1) / 2))
+    reviews = []
+    histogram = {str(star): 0 for star in range(1, 6)}
+    for n, user_index in enumerate(rng.sample(range(args.users), count)):
+        rating = rng.choices((1, 2, 3, 4, 5), weights=(5, 5, 15, 35, 40))[0]
+        histogram[str(rating)] += 1
+        created = min(args.epoch, product["createdAt"] + timedelta(hours=rng.randint(1, 24 * 365)))
+        reviews.append({
+            "_id": child_id(REVIEW, i, n),
+            "productId": product["_id"],
+            "userId": entity_id(USER, user_index),
+            "username": f"user{user_index}",
+            "rating": rating,
+            "comment": rng.choice(["ดีมาก", "ส่งไว", "คุ้มราคา", "Great quality", "As described", "พอใช้ได้"]),
+            "createdAt": created,
+            "updatedAt": created,
+        })
+    product["ratingSum"] = sum(r["rating"] for r in reviews)
+    product["ratingCount"] = len(reviews)
+    product["ratingHistogram"] = histogram
+    return product, reviews
+
+
+def user_with_history(args, i: int) -> tuple[dict, list[dict], list[dict]]:
+    """A user, their cart (if any) and their notification history"""
+    user = user_doc(args, i)
+    rng = rng_for(args.seed, NOTIFICATION, i)
+
+    notifications = []
+    count = min(1000, int(rng.expovariate(1 / args.notifications_mean))) if args.notifications_mean else 0
+    for n in range(count):
+        # Within the read-notification TTL so nothing is purged straight away
+        created = args.epoch - timedelta(minutes=rng.randint(0, 60 * 24 * 60))
+        is_read = rng.random() < 0.8
+        notifications.append({
+            "_id": child_id(NOTIFICATION, i, n),
+            "userId": user["_id"],
+            "type": rng.choice(["order", "review", "message"]),
+            "title": "อัปเดตคำสั่งซื้อ",
+            "message": f"synthetic notification {n}",
+            "data": None,
+            "isRead": is_read,
+            "readAt": created + timedelta(hours=1) if is_read else None,
+            "createdAt": created,
+        })
+    user["unreadNotificationCount"] = sum(1 for n in notifications if not n["isRead"])
+
+    carts = []
+    if rng.random() < args.cart_rate:
+        items = []
+        for n in range(rng.randint(1, 8)):
+            # Carts favour popular (low-index) products
+            product = product_doc(args, skewed_index(rng, args.products, 2.0))
+            items.append({
+                "_id": child_id(CART_ITEM, i, n),
+                "productId": product["_id"],
+                "quantity": rng.randint(1, 3),
+                "productName": product["name"],
+                "price": product["price"],
+                "storeId": product["storeId"],
+                "createdAt": args.epoch,
+                "updatedAt": args.epoch,
+            })
+        carts.append({
+            "_id": entity_id(CART, i),
+            "userId": user["_id"],
+            "items": items,
+            "totalItems": sum(item["quantity"] for item in items),
+            "totalAmount": sum(item["quantity"] * item["price"] for item in items),
+            "createdAt": args.epoch,
+            "updatedAt": args.epoch,
+        })
+    return user, carts, notifications
+
+
+def generate(args, kind: str, start: int, stop: int) -> dict[str, list[dict]]:
+    """Documents per collection for entities [start, stop) of one kind"""
+    if kind == "Store":
+        return {"Store": [store_doc(args, i) for i in range(start, stop)]}
+    if kind == "Product":
+        batch = {"Product": [], "Review": []}
+        for i in range(start, stop):
+            product, reviews = product_with_reviews(args, i)
+            batch["Product"].append(product)
+            batch["Review"].extend(reviews)
+        return batch
+    batch = {"User": [], "Cart": [], "Notification": []}
+    for i in range(start, stop):
+        user, carts, notifications = user_with_history(args, i)
+        batch["User"].append(user)
+        batch["Cart"].extend(carts)
+        batch["Notification"].extend(notifications)
+    return batch
+
+
+# ===== Loading =====
+async def load_chunks(args, chunks: list[tuple[str, int, int]]) -> dict[str, int]:
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), maxPoolSize=args.inflight * 2)
+    db = client[args.db]
+    inserted: dict[str, int] = {}
+    in_flight = asyncio.Semaphore(args.inflight)
+    pending = set()
+
+    async def insert(collection: str, docs: list[dict]) -> None:
+        try:
+            for start in range(0, len(docs), args.batch_size):
+                await db[collection].insert_many(docs[start:start + args.batch_size], ordered=False)
+            inserted[collection] = inserted.get(collection, 0) + len(docs)
+        finally:
+            in_flight.release()
+
+    try:
+        for kind, start, stop in chunks:
+            # Generate the next batch while earlier batches are still being written
+            for collection, docs in generate(args, kind, start, stop).items():
+                if docs:
+                    await in_flight.acquire()
+                    task = asyncio.create_task(insert(collection, docs))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        await asyncio.gather(*pending)
+        return inserted
+    finally:
+        client.close()
+
+
+def run_worker(args, chunks: list[tuple[str, int, int]]) -> dict[str, int]:
+    load_dotenv()
+    return asyncio.run(load_chunks(args, chunks))
+
+
+def plan_chunks(args) -> list[tuple[str, int, int]]:
+    chunks = []
+    for kind, total in (("Store", args.stores), ("User", args.users), ("Product", args.products)):
+        chunks.extend((kind, start, min(start + args.batch_size, total)) for start in range(0, total, args.batch_size))
+    return chunks
+
+
+async def prepare(args) -> None:
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    try:
+        if args.drop:
+            await client.drop_database(args.db)
+        elif await client[args.db].Product.estimated_document_count():
+            raise SystemExit(f"{args.db} already has products; pass --drop to replace them")
+    finally:
+        client.close()
+
+
+async def build_indexes(args) -> list[str]:
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    try:
+        return await migrate_indexes(client[args.db])
+    finally:
+        client.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--stores", type=int, default=5_000)
+    parser.add_argument("--users", type=int, default=200_000, help="includes one seller per store")
+    parser.add_argument("--reviews-mean", type=float, default=4.0, help="average reviews per product")
+    parser.add_argument("--notifications-mean", type=float, default=15.0, help="average notifications per user")
+    parser.add_argument("--cart-rate", type=float, default=0.3, help="share of users with a cart")
+    parser.add_argument("--store-skew", type=float, default=3.0, help="higher = catalog concentrated in fewer stores")
+    parser.add_argument("--category-skew", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--epoch", type=datetime.fromisoformat,
+                        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help="YYYY-MM-DD that generated timestamps count back from (default: today)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="parallel loader processes")
+    parser.add_argument("--batch-size", type=int, default=5_000, help="documents per insert_many")
+    parser.add_argument("--inflight", type=int, default=2, help="concurrent insert_many calls per worker")
+    parser.add_argument("--db", default=os.getenv("SEED_DB", "walk4you_scale"))
+    parser.add_argument("--drop", action="store_true", help="drop --db before loading")
+    parser.add_argument("--no-indexes", action="store_true", help="skip building indexes after loading")
+    args = parser.parse_args()
+    if args.users < args.stores:
+        parser.error("--users must be at least --stores (every store has a seller)")
+
+    load_dotenv()
+    asyncio.run(prepare(args))
+    chunks = plan_chunks(args)
+    # Interleave so every worker gets a mix of cheap and expensive chunks
+    shares = [chunks[w::args.workers] for w in range(args.workers)]
+
+    started = time.perf_counter()
+    totals: dict[str, int] = {}
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for inserted in pool.map(run_worker, itertools.repeat(args), shares):
+            for collection, count in inserted.items():
+                totals[collection] = totals.get(collection, 0) + count
+    elapsed = time.perf_counter() - started
+
+    for collection, count in sorted(totals.items()):
+        print(f"{collection:<14} {count:>12,}")
+    print(f"Loaded {sum(totals.values()):,} documents into {args.db} in {elapsed:.1f}s "
+          f"({sum(totals.values()) / elapsed:,.0f} docs/s, {args.workers} workers)")
+
+    if not args.no_indexes:
+        started = time.perf_counter()
+        for action in asyncio.run(build_indexes(args)):
+            print(action)
+        print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    print(f"Seeded users log in with password '{PASSWORD}' (user0 .. user{args.users - 1})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
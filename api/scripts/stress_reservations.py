@@ -0,0 +1,124 @@
+"""Concurrency stress check for the stock reservation engine.
+
+Hammers reserve_stock() with many parallel multi-item checkouts against a
+small amount of stock and verifies that nothing is oversold:
+
+    cd api
+    python -m scripts.stress_reservations --workers 200 --orders 5000
+
+Runs against MONGODB_URI in a throwaway database (default walk4you_stress),
+which is dropped afterwards. Exits non-zero if any invariant is violated.
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.inventory import InsufficientStockError, confirm_stock, release_stock, reserve_stock
+
+
+async def seed(db, products: int, stock: int) -> list[ObjectId]:
+    now = datetime.utcnow()
+    result = await db.Product.insert_many([
+        {
+            "storeId": ObjectId(),
+            "name": f"stress-{i}",
+            "description": "",
+            "price": 100.0,
+            "quantity": stock,
+            "status": "ACTIVE",
+            "createdAt": now,
+            "updatedAt": now
+        }
+        for i in range(products)
+    ])
+    return result.inserted_ids
+
+
+async def checkout(db, product_ids, rng, sold: dict, stats: dict, abort_rate: float) -> None:
+    basket = {pid: rng.randint(1, 3) for pid in rng.sample(product_ids, rng.randint(1, min(4, len(product_ids))))}
+    order_id = ObjectId()
+    try:
+        await reserve_stock(db, order_id, basket)
+    except InsufficientStockError:
+        stats["rejected"] += 1
+        return
+
+    if rng.random() < abort_rate:
+        # Simulate the order write failing after a successful reservation
+        await release_stock(db, order_id, basket)
+        stats["aborted"] += 1
+        return
+
+    await confirm_stock(db, order_id, list(basket))
+    for pid, quantity in basket.items():
+        sold[pid] += quantity
+    stats["accepted"] += 1
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=5)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--abort-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="walk4you_stress")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = AsyncIOMotorClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"), maxPoolSize=args.workers)
+    db = client[args.db]
+    await client.drop_database(args.db)
+
+    try:
+        product_ids = await seed(db, args.products, args.stock)
+        sold = {pid: 0 for pid in product_ids}
+        stats = {"accepted": 0, "rejected": 0, "aborted": 0}
+        rng = random.Random(args.seed)
+        queue = asyncio.Queue()
+        for _ in range(args.orders):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                await checkout(db, product_ids, rng, sold, stats, args.abort_rate)
+
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(worker() for _ in range(args.workers)))
+        elapsed = asyncio.get_running_loop().time() - started
+
+        failures = []
+        async for product in db.Product.find({"_id": {"$in": product_ids}}):
+            expected = args.stock - sold[product["_id"]]
+            if product["quantity"] < 0:
+                failures.append(f"{product['name']}: negative stock {product['quantity']}")
+            if product["quantity"] != expected:
+                failures.append(f"{product['name']}: stock {product['quantity']} != expected {expected}")
+            if product.get("reservations"):
+                failures.append(f"{product['name']}: leftover reservation markers {product['reservations']}")
+
+        print(
+            f"{args.orders} checkouts in {elapsed:.2f}s "
+            f"({args.orders / elapsed:.0f}/s): {stats['accepted']} accepted, "
+            f"{stats['rejected']} rejected, {stats['aborted']} aborted"
+        )
+        for failure in failures:
+            print(f"FAIL {failure}")
+        print("OK: no oversell" if not failures else f"{len(failures)} invariant violations")
+        return 1 if failures else 0
+    finally:
+        await client.drop_database(args.db)
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -17,6 +17,8 @@ interface Product {
   image_url?: string;
   category?: string;
   storeId: string;
+  ratingCount?: number;
+  ratingAverage?: number | null;
 }
 
 interface RecommendedProduct {
@@ -114,6 +116,7 @@ export default function ProductPage() {
   const [reviews, setReviews] = useState<Review[]>([]);
   const [isSubmittingReview, setIsSubmittingReview] = useState(false);
   const [reviewsLoading, setReviewsLoading] = useState(false);
+  const [reviewsCursor, setReviewsCursor] = useState<string | null>(null);
   const [isAddingToCart, setIsAddingToCart] = useState(false);
   
   const { addToCart } = useCart();
@@ -148,22 +151,24 @@ export default function ProductPage() {
     }
   }, [id]);
 
-  const fetchReviews = async () => {
+  const fetchReviews = async (before?: string) => {
     if (!id) return;
     
     try {
       setReviewsLoading(true);
-      const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8000"}/products/${id}/reviews`);
+      const query = before ? `?before=${encodeURIComponent(before)}` : '';
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8000"}/products/${id}/reviews${query}`);
       if (response.ok) {
         const reviewsData = await response.json();
-        setReviews(reviewsData);
+        setReviews(prev => before ? [...prev, ...reviewsData] : reviewsData);
+        setReviewsCursor(response.headers.get('X-Next-Cursor'));
       } else {
         console.error('Failed to fetch reviews');
-        setReviews([]);
+        if (!before) setReviews([]);
       }
     } catch (error) {
       console.error('Error fetching reviews:', error);
-      setReviews([]);
+      if (!before) setReviews([]);
     } finally {
       setReviewsLoading(false);
     }
@@ -363,7 +368,7 @@ export default function ProductPage() {
                       <Star key={i} className="w-4 h-4 lg:w-5 lg:h-5 fill-yellow-400 text-yellow-400" />
                     ))}
                   </div>
-                  <span className="text-sm lg:text-base text-gray-600">(4.9 จาก {reviews.length} รีวิว)</span>
+                  <span className="text-sm lg:text-base text-gray-600">({product.ratingAverage?.toFixed(1) ?? '-'} จาก {product.ratingCount ?? 0} รีวิว)</span>
                 </div>
 
                 <p className="text-sm lg:text-base text-gray-600 leading-relaxed mb-6">
@@ -476,7 +481,7 @@ export default function ProductPage() {
                 }`}
               >
                 <MessageCircle className="w-5 h-5" />
-                รีวิวสินค้า ({reviews.length})
+                รีวิวสินค้า ({product.ratingCount ?? reviews.length})
               </button>
             </div>
           </div>
@@ -564,7 +569,7 @@ export default function ProductPage() {
                 {/* Reviews List */}
                 <div className="space-y-4">
                   <h3 className="text-lg font-semibold text-gray-900">รีวิวจากลูกค้า</h3>
-                  {reviewsLoading ? (
+                  {reviewsLoading && reviews.length === 0 ? (
                     <div className="text-center py-8">
                       <div className="w-8 h-8 border-2 border-blue-600 border-t-transparent rounded-full animate-spin mx-auto mb-4"></div>
                       <p className="text-gray-500">กำลังโหลดรีวิว...</p>
@@ -605,6 +610,15 @@ export default function ProductPage() {
                       </div>
                     ))
                   )}
+                  {reviewsCursor && (
+                    <button
+                      onClick={() => fetchReviews(reviewsCursor)}
+                      disabled={reviewsLoading}
+                      className="w-full py-3 border border-gray-200 rounded-xl text-gray-700 hover:bg-gray-50 transition disabled:opacity-50"
+                    >
+                      {reviewsLoading ? 'กำลังโหลดรีวิว...' : 'ดูรีวิวเพิ่มเติม'}
+                    </button>
+                  )}
                 </div>
               </div>
             )}
@@ -87,22 +87,68 @@ export const useNotifications = () => {
 
   const markAllAsRead = useCallback(async () => {
     try {
-      const unreadNotifications = notifications.filter(n => !n.isRead);
-      await Promise.all(unreadNotifications.map(n => markAsRead(n.id)));
+      const token = localStorage.getItem('access_token');
+      if (!token) return;
+
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_BASE || 'http://localhost:8000'}/notifications/read-all`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json',
+        },
+      });
+
+      if (response.ok) {
+        setNotifications(prev => prev.map(n => ({ ...n, isRead: true })));
+        setUnreadCount(0);
+      }
     } catch (error) {
       console.error('Failed to mark all notifications as read:', error);
     }
-  }, [notifications, markAsRead]);
+  }, []);
 
-  // Poll for new notifications every 30 seconds
+  // Subscribe to pushed notifications; a slow poll and a refetch after every
+  // reconnect catch up on events the stream missed (e.g. published on another
+  // API worker when the server runs without a cross-worker pub/sub backend)
   useEffect(() => {
     const token = localStorage.getItem('access_token');
     if (!token) return;
 
-    fetchUnreadCount();
-    const interval = setInterval(fetchUnreadCount, 30000);
-    return () => clearInterval(interval);
-  }, [fetchUnreadCount]);
+    let disconnected = false;
+    const source = new EventSource(
+      `${process.env.NEXT_PUBLIC_API_BASE || 'http://localhost:8000'}/notifications/stream?token=${encodeURIComponent(token)}`
+    );
+
+    source.addEventListener('unread-count', (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setUnreadCount(data.unreadCount);
+    });
+
+    source.addEventListener('notification', (event) => {
+      const notification: Notification = JSON.parse((event as MessageEvent).data);
+      setNotifications(prev => [notification, ...prev]);
+      setUnreadCount(prev => prev + 1);
+    });
+
+    source.onopen = () => {
+      if (disconnected) {
+        disconnected = false;
+        fetchNotifications();
+      }
+    };
+
+    source.onerror = () => {
+      // EventSource reconnects on its own; the stream resends the unread count on connect
+      disconnected = true;
+      console.error('Notification stream disconnected, reconnecting...');
+    };
+
+    const interval = setInterval(fetchUnreadCount, 120000);
+    return () => {
+      clearInterval(interval);
+      source.close();
+    };
+  }, [fetchNotifications, fetchUnreadCount]);
 
   return {
     notifications,